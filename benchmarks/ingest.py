@@ -0,0 +1,360 @@
+"""
+Ingest benchmarks: parser only, insert only, webhook end to end through the ASGI app, and a full
+history sync reading from an in-memory fake Firestore.
+
+Each scenario runs in a fresh process so its peak RSS is its own. Data is generated from a fixed
+seed, so runs are comparable. The database is a throwaway SQLite file unless --database-url points
+at a disposable Postgres/TimescaleDB; rows of the "benchmark" project are deleted there before
+every scenario, so never point it at a real database.
+
+    python -m benchmarks.ingest --output results.json
+    python -m benchmarks.ingest --save-baseline benchmarks/baseline.json
+    python -m benchmarks.ingest --baseline benchmarks/baseline.json --tolerance 0.25
+
+With --baseline the exit status is 1 when a scenario lost more than the tolerance in throughput,
+or grew by more than it in p50/p99 latency or peak RSS. Baselines are only comparable on the same
+machine and database.
+"""
+import argparse
+import bisect
+import contextlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ("parser", "insert", "webhook", "sync")
+PROJECT = "benchmark"
+
+# Compared against the baseline; True when a higher value is better
+COMPARED_METRICS = {"throughput_per_second": True, "p50_ms": False, "p99_ms": False, "peak_rss_mb": False}
+
+_OPS = {
+    "==": lambda a, b: a == b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+}
+
+
+def generate_readings(count: int, sensors: int = 50, seed: int = 42) -> list[dict]:
+    """Raw readings as the sensors publish them: one document per sensor per minute."""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    readings = []
+    for i in range(count):
+        readings.append({
+            "project_id": PROJECT,
+            "sensor_id": f"BENCH{i % sensors:04d}",
+            "timestamp": start + timedelta(minutes=i // sensors),
+            "temperature": round(rng.uniform(-20, 30), 2),
+            "humidity": round(rng.uniform(10, 100), 1),
+            "pressure": round(rng.uniform(960, 1050), 1),
+            "battery": round(rng.uniform(2.8, 3.6), 3),
+        })
+    return readings
+
+
+class FakeDoc:
+    __slots__ = ("id", "_data")
+
+    def __init__(self, doc_id: str, data: dict):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self) -> dict:
+        # Firestore builds a new dict on every call
+        return dict(self._data)
+
+
+class FakeCount:
+    def __init__(self, value: int):
+        self.value = value
+
+
+class FakeQuery:
+    """Enough of a Firestore query for the history sync: where, order_by, limit, count, stream.
+    Documents are kept sorted by timestamp so range filters are bisections, keeping the fake's own
+    cost out of the measurement."""
+
+    def __init__(self, docs: list[FakeDoc], filters: tuple = (), descending: bool = False, limit=None):
+        self.docs = docs
+        self.filters = filters
+        self.descending = descending
+        self.limit_to = limit
+
+    def where(self, filter):
+        return FakeQuery(self.docs, self.filters + ((filter.field_path, filter.op_string, filter.value),),
+                         self.descending, self.limit_to)
+
+    def order_by(self, field, direction=None):
+        return FakeQuery(self.docs, self.filters, direction == "DESCENDING", self.limit_to)
+
+    def limit(self, count: int):
+        return FakeQuery(self.docs, self.filters, self.descending, count)
+
+    def count(self):
+        matched = len(self._matching())
+        return type("Aggregation", (), {"get": lambda _: [[FakeCount(matched)]]})()
+
+    def stream(self):
+        docs = self._matching()
+        if self.descending:
+            docs = docs[::-1]
+        if self.limit_to is not None:
+            docs = docs[:self.limit_to]
+        return iter(docs)
+
+    def _matching(self) -> list[FakeDoc]:
+        timestamps = [doc._data["timestamp"] for doc in self.docs]
+        low, high = 0, len(self.docs)
+        others = []
+        for field, op, value in self.filters:
+            if field != "timestamp":
+                others.append((field, _OPS[op], value))
+            elif op == ">":
+                low = max(low, bisect.bisect_right(timestamps, value))
+            elif op == ">=":
+                low = max(low, bisect.bisect_left(timestamps, value))
+            elif op == "<":
+                high = min(high, bisect.bisect_left(timestamps, value))
+            elif op == "<=":
+                high = min(high, bisect.bisect_right(timestamps, value))
+        return [doc for doc in self.docs[low:high]
+                if all(op(doc._data.get(field), value) for field, op, value in others)]
+
+
+class FakeCollection:
+    def stream(self):
+        return iter(())
+
+    def list_documents(self):
+        return []
+
+
+class FakeFirestore:
+    def __init__(self, readings: list[dict]):
+        docs = [FakeDoc(f"doc_{i}", reading) for i, reading in enumerate(readings)]
+        self.readings = FakeQuery(sorted(docs, key=lambda doc: doc._data["timestamp"]))
+
+    def collection_group(self, name: str):
+        return self.readings
+
+    def collection(self, name: str):
+        return FakeCollection()
+
+
+def setup_database(url: str):
+    """Point src.db at the benchmark database and empty the benchmark project."""
+    from sqlalchemy import create_engine
+    from src import db
+
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    db.ENGINE = create_engine(url, connect_args=connect_args)
+    db.Base.metadata.create_all(db.ENGINE)
+    clear_project(db)
+    return db.ENGINE
+
+
+def clear_project(db):
+    from sqlalchemy import delete
+
+    with db.ENGINE.begin() as connection:
+        connection.execute(delete(db.SensorData).where(db.SensorData.project_id == PROJECT))
+
+
+def _timed(func, *args) -> float:
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+
+def run_parser(args) -> dict:
+    from src.SensorDataParser import SensorDataParser
+
+    readings = generate_readings(args.docs)
+    parser = SensorDataParser(PROJECT)
+    latencies = [_timed(parser.process_raw_sensor_data, reading) for reading in readings]
+    return {"items": len(readings), "unit": "docs", "latency_of": "doc", "latencies": latencies}
+
+
+def run_insert(args) -> dict:
+    from src.SensorDataParser import SensorDataParser
+    from src.db import insert_sensor_rows
+
+    setup_database(args.database_url)
+    parser = SensorDataParser(PROJECT)
+    rows = [row for reading in generate_readings(args.docs) for row in parser.process_raw_sensor_data(reading)]
+    batches = [rows[i:i + args.batch_size] for i in range(0, len(rows), args.batch_size)]
+    latencies = [_timed(insert_sensor_rows, batch) for batch in batches]
+    return {"items": len(rows), "unit": "rows", "latency_of": "batch", "latencies": latencies}
+
+
+def run_webhook(args) -> dict:
+    os.environ.setdefault("VITE_AUTH0_DOMAIN", "benchmark.invalid")
+    os.environ.setdefault("VITE_AUTH0_AUDIENCE", "benchmark")
+    from fastapi.testclient import TestClient
+    from src.dependencies import get_auth_claims
+    from src.normalizer_api import app
+
+    setup_database(args.database_url)
+    app.dependency_overrides[get_auth_claims] = lambda: {"sub": "benchmark"}
+    # Not entered as a context manager: the lifespan would start the Firestore background work
+    client = TestClient(app)
+
+    payloads = [dict(r, timestamp=r["timestamp"].isoformat()) for r in generate_readings(args.requests + 20)]
+    for payload in payloads[:20]:
+        client.post("/api/webhook", json=payload)
+
+    latencies = []
+    for payload in payloads[20:]:
+        started = time.perf_counter()
+        response = client.post("/api/webhook", json=payload)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != 201:
+            raise RuntimeError(f"Webhook returned {response.status_code}: {response.text}")
+    return {"items": len(latencies), "unit": "requests", "latency_of": "request", "latencies": latencies}
+
+
+def run_sync(args) -> dict:
+    from unittest.mock import patch
+    from src import db
+    from src.history_to_timescale import sync_firestore_to_timescale
+
+    setup_database(args.database_url)
+    client = FakeFirestore(generate_readings(args.docs))
+    latencies = []
+    with patch("src.history_to_timescale.get_firestore_client", return_value=client):
+        for _ in range(args.repeat):
+            clear_project(db)
+            latencies.append(_timed(lambda: sync_firestore_to_timescale(
+                project_ids=[PROJECT], workers=args.partitions)))
+    return {"items": args.docs * args.repeat, "unit": "docs", "latency_of": "sync", "latencies": latencies}
+
+
+RUNNERS = {"parser": run_parser, "insert": run_insert, "webhook": run_webhook, "sync": run_sync}
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * (len(values) - 1) + 0.5))]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_scenario(name: str, args) -> dict:
+    """Run one scenario in this process and summarize it."""
+    with tempfile.TemporaryDirectory(prefix="ingest-bench-") as workdir:
+        if not args.database_url:
+            args.database_url = f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+        # The webhook appends to webhook_logs.txt in the working directory; keep it out of the tree
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                measured = RUNNERS[name](args)
+        finally:
+            os.chdir(cwd)
+
+    latencies = measured.pop("latencies")
+    # Only the measured operations; imports, data generation and warm-up are left out
+    seconds = sum(latencies)
+    return {
+        "scenario": name,
+        **measured,
+        "seconds": round(seconds, 4),
+        "throughput_per_second": round(measured["items"] / seconds, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+        "max_ms": round(max(latencies) * 1000, 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_in_subprocess(name: str, argv: list[str]) -> dict:
+    result = subprocess.run([sys.executable, "-m", "benchmarks.ingest", "--child", name, *argv],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Regressions beyond the tolerance (a fraction, 0.25 = 25 %) as readable lines."""
+    previous = {entry["scenario"]: entry for entry in baseline.get("scenarios", [])}
+    regressions = []
+    for entry in results["scenarios"]:
+        old_entry = previous.get(entry["scenario"])
+        if old_entry is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = old_entry.get(metric), entry.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{entry['scenario']}: {metric} {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark parsing, inserting, the webhook and history sync")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="Run only this scenario (repeatable), default all")
+    parser.add_argument("--database-url", help="Disposable Postgres/TimescaleDB, default a temporary SQLite file")
+    parser.add_argument("--docs", type=int, default=20000, help="Readings for the parser, insert and sync scenarios")
+    parser.add_argument("--requests", type=int, default=1000, help="Webhook requests")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per insert")
+    parser.add_argument("--partitions", type=int, default=4, help="Concurrent Firestore shards in the sync")
+    parser.add_argument("--repeat", type=int, default=3, help="Full syncs to run")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Fail when results regress against this results file")
+    parser.add_argument("--save-baseline", help="Write the results to this file as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed regression, 0.25 = 25 %%")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args)))
+        return 0
+
+    passthrough = ["--docs", str(args.docs), "--requests", str(args.requests), "--batch-size", str(args.batch_size),
+                   "--partitions", str(args.partitions), "--repeat", str(args.repeat)]
+    if args.database_url:
+        passthrough += ["--database-url", args.database_url]
+
+    results = {
+        "database": args.database_url.split(":", 1)[0] if args.database_url else "sqlite",
+        "python": sys.version.split()[0],
+        "scenarios": [run_in_subprocess(name, passthrough) for name in args.scenario or SCENARIOS],
+    }
+    print(json.dumps(results, indent=2))
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Cold-start benchmark: time from a fresh interpreter to an importable app and a ready Firestore client.
+
+Every run is a new process, so module imports and channel setup are measured cold, like a
+freshly scaled-up worker.
+
+    python -m benchmarks.startup --runs 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child process and prints one JSON line
+_PROBE = """
+import json, time
+started = time.perf_counter()
+import src.normalizer_api
+imported = time.perf_counter()
+from src.firestore_client import warm_up_firestore_client
+ready = warm_up_firestore_client()
+finished = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - started,
+    "warm_up_seconds": finished - imported,
+    "ready_seconds": finished - started,
+    "firestore_ready": ready,
+}))
+"""
+
+
+def measure_once() -> dict:
+    result = subprocess.run([sys.executable, "-c", _PROBE], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup probe failed:\n{result.stderr}")
+    # The app prints while importing; the measurement is the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs: list[dict]) -> dict:
+    summary = {"runs": len(runs), "firestore_ready": all(run["firestore_ready"] for run in runs)}
+    for key in ("import_seconds", "warm_up_seconds", "ready_seconds"):
+        values = [run[key] for run in runs]
+        summary[key] = {
+            "median": round(statistics.median(values), 4),
+            "min": round(min(values), 4),
+            "max": round(max(values), 4),
+        }
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure import-to-ready time of the API")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    summary = summarize([measure_once() for _ in range(args.runs)])
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,9 +3,12 @@ CREATE TABLE IF NOT EXISTS sensor_metadata (
     description TEXT NULL,
     latitude FLOAT NOT NULL,
     longitude FLOAT NOT NULL,
-    project_id VARCHAR(50) NOT NULL
+    project_id VARCHAR(50) NOT NULL,
+    geohash VARCHAR(12) NULL
 );
 
+CREATE INDEX IF NOT EXISTS ix_sensor_metadata_geohash ON sensor_metadata (geohash);
+
 CREATE TABLE IF NOT EXISTS sensor_data (
     timestamp TIMESTAMPTZ NOT NULL,
     sensor_id VARCHAR(50) NOT NULL,
@@ -15,9 +18,70 @@ CREATE TABLE IF NOT EXISTS sensor_data (
     PRIMARY KEY (timestamp, sensor_id, metric_name)
 );
 
+CREATE TABLE IF NOT EXISTS sync_jobs (
+    job_id VARCHAR(36) PRIMARY KEY NOT NULL,
+    job_type VARCHAR(20) NOT NULL,
+    state VARCHAR(20) NOT NULL,
+    scope TEXT NOT NULL DEFAULT '',
+    params TEXT NULL,
+    current_project VARCHAR(50) NULL,
+    docs_read INTEGER NOT NULL DEFAULT 0,
+    docs_total INTEGER NULL,
+    rows_written INTEGER NOT NULL DEFAULT 0,
+    error TEXT NULL,
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMPTZ NOT NULL,
+    started_at TIMESTAMPTZ NULL,
+    finished_at TIMESTAMPTZ NULL,
+    heartbeat_at TIMESTAMPTZ NULL
+);
+
+CREATE TABLE IF NOT EXISTS unconfigured_sensor_summaries (
+    sensor_id VARCHAR(50) PRIMARY KEY NOT NULL,
+    reading_count INTEGER NOT NULL DEFAULT 0,
+    first_seen TIMESTAMPTZ NULL,
+    last_seen TIMESTAMPTZ NULL,
+    raw_keys TEXT NOT NULL DEFAULT '[]',
+    sample TEXT NOT NULL DEFAULT '[]',
+    watermark TIMESTAMPTZ NULL,
+    updated_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS reconciled_days (
+    project_id VARCHAR(50) NOT NULL,
+    sensor_id VARCHAR(100) NOT NULL,
+    day DATE NOT NULL,
+    firestore_count INTEGER NOT NULL,
+    reconciled_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (project_id, sensor_id, day)
+);
+
 -- Luodaan hypertable TimescaleDB:ssä
 SELECT create_hypertable('sensor_data', 'timestamp', if_not_exists => TRUE);
 
+-- Hourly rollup of the numeric readings, used by the series API for buckets of an hour or more.
+-- Real-time aggregation (materialized_only = false) fills in the not yet materialized hours.
+CREATE MATERIALIZED VIEW IF NOT EXISTS sensor_data_hourly
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    time_bucket(INTERVAL '1 hour', timestamp) AS bucket,
+    sensor_id,
+    metric_name,
+    project_id,
+    count(CASE WHEN metric_value ~ '^[-+]?[0-9]*[.]?[0-9]+([eE][-+]?[0-9]+)?$' THEN metric_value::DOUBLE PRECISION END) AS value_count,
+    sum(CASE WHEN metric_value ~ '^[-+]?[0-9]*[.]?[0-9]+([eE][-+]?[0-9]+)?$' THEN metric_value::DOUBLE PRECISION END) AS value_sum,
+    min(CASE WHEN metric_value ~ '^[-+]?[0-9]*[.]?[0-9]+([eE][-+]?[0-9]+)?$' THEN metric_value::DOUBLE PRECISION END) AS value_min,
+    max(CASE WHEN metric_value ~ '^[-+]?[0-9]*[.]?[0-9]+([eE][-+]?[0-9]+)?$' THEN metric_value::DOUBLE PRECISION END) AS value_max
+FROM sensor_data
+GROUP BY bucket, sensor_id, metric_name, project_id
+WITH NO DATA;
+
+SELECT add_continuous_aggregate_policy('sensor_data_hourly',
+    start_offset => INTERVAL '3 days',
+    end_offset => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '30 minutes',
+    if_not_exists => TRUE);
+
 CREATE USER grafana_ro WITH PASSWORD 'secure_password';
 
 GRANT CONNECT ON DATABASE sensor_data TO grafana_ro;
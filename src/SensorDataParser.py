@@ -3,13 +3,18 @@ from typing import List, Optional
 from zoneinfo import ZoneInfo
 from google.api_core.datetime_helpers import DatetimeWithNanoseconds
 
+from src.sensor_mappings import SENSOR_MAPPINGS, MappingRegistry, SensorMapping
+from src.utils.metrics import ROWS_PARSED, READINGS_REJECTED, project_label
+
 POSSIBLE_SENSOR_ID_FIELDS = ("sensor_id", "id", "sensorId", "device_id", "deviceId", "sensorID", "SensorID", "mac")
 POSSIBLE_TIMESTAMP_FIELDS = ("timestamp", "time", "date", "datetime", "SensorReadingTime", "ts")
 
 
 class SensorDataParser:
-    def __init__(self, project_id: str):
+    def __init__(self, project_id: str, mappings: Optional[MappingRegistry] = None):
         self.project_id = project_id
+        # Per-sensor mappings from sensor_config, kept up to date in the background
+        self.mappings = SENSOR_MAPPINGS if mappings is None else mappings
         self.tz_helsinki = ZoneInfo("Europe/Helsinki")
         self.tz_utc = ZoneInfo("UTC")
         self.id_fields = set(POSSIBLE_SENSOR_ID_FIELDS)
@@ -28,28 +33,49 @@ class SensorDataParser:
         raw_id_val = raw_data.get(self.cached_id_field) if self.cached_id_field else None
         sensor_id = str(raw_id_val).replace(":", "") if raw_id_val else None
 
-        return self._convert_to_normalized_format(raw_data, sensor_id)
+        # Already normalized documents (e.g. backfilled ones) carry clean names under "measurements"
+        mapping = None if "measurements" in raw_data else self.mappings.get(sensor_id)
+        if mapping is not None:
+            rows = self._convert_mapped(raw_data, sensor_id, mapping)
+        else:
+            rows = self._convert_to_normalized_format(raw_data, sensor_id)
 
-    def _convert_to_normalized_format(self, sensor_reading: dict, sensor_id: str | None) -> List[dict]:
-        rows = []
+        if rows:
+            ROWS_PARSED.inc(len(rows), project=project_label(self.project_id))
+        else:
+            READINGS_REJECTED.inc(project=project_label(self.project_id))
+        return rows
 
-        actual_measurements = sensor_reading.get("measurements", {})
+    def _convert_mapped(self, raw_data: dict, sensor_id: str | None, mapping: SensorMapping) -> List[dict]:
+        metrics = mapping.measurements(raw_data)
+        if not metrics:
+            return []
+        if raw_data.get(mapping.ts_field) is not None:
+            base_time = self.parse_timestamp_value(raw_data[mapping.ts_field])
+        else:
+            base_time = self._parse_timestamp(raw_data)
+        return self.rows_from_metrics(metrics, sensor_id, base_time)
 
-        if not actual_measurements:
-            metrics = {k: v for k, v in sensor_reading.items() if k not in self.ignored_fields}
+    def _convert_to_normalized_format(self, sensor_reading: dict, sensor_id: str | None) -> List[dict]:
+        # Only the measurements of a normalized document are metrics; its other fields (extra,
+        # backfilled, original_received_at) are bookkeeping, even when measurements is empty
+        if "measurements" in sensor_reading:
+            metrics = {**(sensor_reading["measurements"] or {})}
         else:
-            metrics = {**actual_measurements}
+            metrics = {k: v for k, v in sensor_reading.items() if k not in self.ignored_fields}
 
         if not metrics:
             return []
 
         base_time = self._parse_timestamp(sensor_reading)
+        return self.rows_from_metrics(metrics, sensor_id, base_time)
 
+    def rows_from_metrics(self, metrics: dict, sensor_id: str | None, timestamp: datetime.datetime) -> List[dict]:
+        rows = []
         for metric_name, metric_value in metrics.items():
-            row = self._create_sensor_row(metric_name, metric_value, sensor_id, self.project_id, base_time)
+            row = self._create_sensor_row(metric_name, metric_value, sensor_id, self.project_id, timestamp)
             if row:
                 rows.append(row)
-
         return rows
 
     def _parse_timestamp(self, item: dict) -> datetime.datetime:
@@ -57,7 +83,9 @@ class SensorDataParser:
             self.cached_ts_field = _find_field_name(item, self.ts_fields)
 
         val = item.get(self.cached_ts_field) if self.cached_ts_field else None
+        return self.parse_timestamp_value(val)
 
+    def parse_timestamp_value(self, val) -> datetime.datetime:
         if isinstance(val, datetime.datetime):
             if val.tzinfo:
                 return val.astimezone(self.tz_utc)
@@ -77,6 +105,10 @@ class SensorDataParser:
                     self.tz_utc)
             except ValueError:
                 pass
+            try:
+                return self.parse_timestamp_value(float(val))  # epoch as a string
+            except ValueError:
+                pass
 
         raise ValueError("Timestamp field missing or invalid")
 
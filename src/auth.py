@@ -1,7 +1,90 @@
+import asyncio
 import os
+import threading
+from typing import Any, Optional
+
+from auth0_api_python.cache import CacheAdapter
+from auth0_api_python.utils import fetch_jwks, fetch_oidc_metadata, normalize_domain
 from fastapi_plugin.fast_api_client import Auth0FastAPI
 
+from src.utils.cache import TTLCache
+
+# Lifetime of cached OIDC discovery metadata and signing keys. Auth0 sends a short max-age, which
+# the SDK honours for what it fetches itself; the background refresher stores with this lifetime
+AUTH_JWKS_CACHE_SECONDS = int(os.getenv("AUTH_JWKS_CACHE_SECONDS", "3600"))
+# How often signing keys are refetched in the background so no request waits on Auth0, 0 disables
+AUTH_JWKS_REFRESH_SECONDS = float(os.getenv("AUTH_JWKS_REFRESH_SECONDS", "300"))
+
+
+class KeyCache(CacheAdapter):
+    """The SDK's discovery/JWKS cache on top of TTLCache, which unlike the SDK's InMemoryCache
+    may be written by the refresher thread while requests read it."""
+
+    def __init__(self, maxsize: int = 100):
+        self._cache = TTLCache(maxsize=maxsize, ttl=AUTH_JWKS_CACHE_SECONDS)
+
+    def get(self, key: str) -> Optional[Any]:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[int] = None) -> None:
+        self._cache.set(key, value, ttl=float("inf") if ttl_seconds is None else ttl_seconds)
+
+    def delete(self, key: str) -> None:
+        self._cache.invalidate(key)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+KEY_CACHE = KeyCache()
+
 auth0 = Auth0FastAPI(
     domain=os.getenv("VITE_AUTH0_DOMAIN"),
-    audience=os.getenv("VITE_AUTH0_AUDIENCE")
-)
\ No newline at end of file
+    audience=os.getenv("VITE_AUTH0_AUDIENCE"),
+    cache_adapter=KEY_CACHE,
+    cache_ttl_seconds=AUTH_JWKS_CACHE_SECONDS,
+)
+
+
+async def refresh_signing_keys() -> bool:
+    """Fetch discovery metadata and the JWKS and store them under the keys the SDK reads."""
+    options = auth0.api_client.options
+    if not options.domain:
+        return False
+    try:
+        metadata, _ = await fetch_oidc_metadata(domain=options.domain, custom_fetch=options.custom_fetch)
+        jwks, _ = await fetch_jwks(jwks_uri=metadata["jwks_uri"], custom_fetch=options.custom_fetch)
+    except Exception as e:
+        # The previous keys stay cached until AUTH_JWKS_CACHE_SECONDS runs out
+        print(f"Error refreshing Auth0 signing keys: {e}")
+        return False
+    KEY_CACHE.set(normalize_domain(f"https://{options.domain}"), metadata, AUTH_JWKS_CACHE_SECONDS)
+    KEY_CACHE.set(metadata["jwks_uri"], jwks, AUTH_JWKS_CACHE_SECONDS)
+    return True
+
+
+class SigningKeyRefresher:
+    def __init__(self, interval: float = AUTH_JWKS_REFRESH_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="auth0-jwks", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=10)
+
+    def _run(self):
+        while not self._stop.is_set():
+            asyncio.run(refresh_signing_keys())
+            self._stop.wait(self.interval)
+
+
+def start_signing_key_refresher() -> Optional[SigningKeyRefresher]:
+    if AUTH_JWKS_REFRESH_SECONDS <= 0 or not auth0.api_client.options.domain:
+        return None
+    return SigningKeyRefresher().start()
@@ -1,13 +1,26 @@
+import json
+import math
 import os
+import threading
 import time
-from datetime import datetime
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, timezone, timedelta
 from typing import Optional
 from sqlalchemy import (
-    create_engine, Column, String, Float, DateTime, Text, func, insert
+    create_engine, Column, String, Float, Date, DateTime, Text, Integer, Boolean, func, insert, text, or_, and_, case, cast,
+    table, column, select, inspect
 )
 from sqlalchemy.orm import declarative_base, Session
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from src.utils import geohash
+from src.utils.metrics import INSERT_BATCH_ROWS, INSERT_SECONDS, INSERT_DUPLICATES, POOL_WAIT_SECONDS, \
+    POOL_CONNECTIONS, project_label
+from src.utils.tracing import span
+from src.utils.query_stats import QUERY_STATS_ENABLED, enable_query_stats
 
 DATABASE_URL = os.getenv("POSTGRES_URL")
 
@@ -23,6 +36,8 @@ class SensorMetadata(Base):
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
     project_id = Column(String(50), nullable=False)
+    # Geohash of (latitude, longitude); its B-tree index serves bounding-box lookups
+    geohash = Column(String(12), nullable=True, index=True)
 
 
 class SensorData(Base):
@@ -35,6 +50,76 @@ class SensorData(Base):
     project_id = Column(String(50), nullable=False)
 
 
+class SyncJob(Base):
+    """Background job history (history syncs, reconciliations, backfills)"""
+    __tablename__ = "sync_jobs"
+    job_id = Column(String(36), primary_key=True, nullable=False)
+    job_type = Column(String(20), nullable=False, default="history")
+    state = Column(String(20), nullable=False, default="queued")  # queued | running | success | failed | cancelled
+    scope = Column(Text, nullable=False, default="")  # comma separated projects (or sensors), empty = all
+    params = Column(Text, nullable=True)  # JSON of the remaining job options (sensors, range, workers)
+    current_project = Column(String(50), nullable=True)
+    docs_read = Column(Integer, nullable=False, default=0)
+    docs_total = Column(Integer, nullable=True)  # estimate, used for the ETA
+    rows_written = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class UnconfiguredSensorSummary(Base):
+    """Discovery summary of a sensor sending data without a config, maintained incrementally"""
+    __tablename__ = "unconfigured_sensor_summaries"
+    sensor_id = Column(String(50), primary_key=True, nullable=False)
+    reading_count = Column(Integer, nullable=False, default=0)
+    first_seen = Column(DateTime(timezone=True), nullable=True)
+    last_seen = Column(DateTime(timezone=True), nullable=True)
+    raw_keys = Column(Text, nullable=False, default="[]")  # JSON list, union of payload keys seen
+    sample = Column(Text, nullable=False, default="[]")  # JSON list, reservoir sample of payloads
+    watermark = Column(DateTime(timezone=True), nullable=True)  # received_at of the last reading counted
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class ReconciledDay(Base):
+    """Firestore reading count of a sensor-day when reconciliation last re-synced it. Firestore can
+    hold more documents than sensor_data has timestamps (rejected readings, shared timestamps), so
+    a day is only re-synced again when its Firestore count changes."""
+    __tablename__ = "reconciled_days"
+    project_id = Column(String(50), primary_key=True, nullable=False)
+    sensor_id = Column(String(100), primary_key=True, nullable=False)  # Firestore sensor document id
+    day = Column(Date, primary_key=True, nullable=False)
+    firestore_count = Column(Integer, nullable=False)
+    reconciled_at = Column(DateTime(timezone=True), nullable=False)
+
+
+ACTIVE_JOB_STATES = ("queued", "running")
+
+# An active job whose heartbeat is older than this is considered dead (e.g. worker restart)
+STALE_JOB_SECONDS = int(os.getenv("SYNC_JOB_STALE_SECONDS", "120"))
+
+
+# Series API: the hourly continuous aggregate (docker/init.sql) serves buckets of whole hours
+SERIES_AGGREGATIONS = ("avg", "min", "max", "sum", "count")
+ROLLUP_VIEW = "sensor_data_hourly"
+ROLLUP_BUCKET_SECONDS = 3600
+NUMERIC_PATTERN = "^[-+]?[0-9]*[.]?[0-9]+([eE][-+]?[0-9]+)?$"
+_rollup_available: Optional[bool] = None
+
+# Version of sensor_metadata as seen by this process, for the metadata snapshot
+_metadata_version = 0
+_metadata_version_lock = threading.Lock()
+
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Mark naive datetimes as UTC; SQLite drops the timezone of stored datetimes."""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
 # Database Functions
 def get_engine(max_retries=10, delay=5):
     """Create or reuse DB engine with retry logic."""
@@ -44,6 +129,8 @@ def get_engine(max_retries=10, delay=5):
     for attempt in range(max_retries):
         try:
             ENGINE = create_engine(DATABASE_URL)
+            if QUERY_STATS_ENABLED:
+                enable_query_stats(ENGINE)
             ENGINE.connect()
             print("Connected to TimescaleDB.")
             return ENGINE
@@ -58,6 +145,23 @@ def init_db():
     engine = get_engine()
     with engine.connect() as conn:
         print("Database connection verified.")
+    Base.metadata.create_all(
+        engine, tables=[SyncJob.__table__, UnconfiguredSensorSummary.__table__, ReconciledDay.__table__]
+    )
+    migrate_sync_jobs()
+    backfill_sensor_geohashes()
+
+
+def migrate_sync_jobs():
+    """Bring a sync_jobs table created by an older version up to the current columns."""
+    engine = get_engine()
+    columns = {c["name"] for c in inspect(engine).get_columns(SyncJob.__tablename__)}
+    with engine.begin() as connection:
+        if "project_ids" in columns and "scope" not in columns:
+            # Renamed once jobs could be scoped to sensors (backfills) as well as projects
+            connection.execute(text("ALTER TABLE sync_jobs RENAME COLUMN project_ids TO scope"))
+        if "params" not in columns:
+            connection.execute(text("ALTER TABLE sync_jobs ADD COLUMN params TEXT NULL"))
 
 
 def sensor_exists_in_data(sensor_id: str) -> bool:
@@ -70,6 +174,17 @@ def sensor_exists_in_data(sensor_id: str) -> bool:
         return result is not None
 
 
+def get_metadata_version() -> int:
+    """Bumped by every sensor_metadata write made by this process."""
+    return _metadata_version
+
+
+def _bump_metadata_version():
+    global _metadata_version
+    with _metadata_version_lock:
+        _metadata_version += 1
+
+
 def get_all_sensor_metadata() -> list[dict]:
     """Retrieve all sensor metadata as a list of dictionaries."""
     engine = get_engine()
@@ -87,6 +202,12 @@ def get_all_sensor_metadata() -> list[dict]:
         ]
 
 
+def _geohash_of(latitude, longitude) -> Optional[str]:
+    if latitude is None or longitude is None:
+        return None
+    return geohash.encode(latitude, longitude)
+
+
 def insert_sensor_metadata(metadata_rows: list[dict]):
     """Insert sensor metadata rows. Validates that sensor_id exists in sensor_data table."""
     engine = get_engine()
@@ -94,24 +215,70 @@ def insert_sensor_metadata(metadata_rows: list[dict]):
         for row in metadata_rows:
             if isinstance(row, dict):
                 row = SensorMetadata(**row)
+            row.geohash = _geohash_of(row.latitude, row.longitude)
             session.merge(row)
 
         session.commit()
+        _bump_metadata_version()
         print(f"Saved {len(metadata_rows)} rows to sensor_metadata.")
 
 
+def upsert_sensor_metadata(metadata_rows: list[dict]) -> int:
+    """Insert or update many sensor metadata rows with a single INSERT ... ON CONFLICT statement."""
+    if not metadata_rows:
+        return 0
+    engine = get_engine()
+    dialect_insert = sqlite_insert if engine.dialect.name == "sqlite" else insert
+    stmt = dialect_insert(SensorMetadata).values([
+        {**row, "geohash": _geohash_of(row.get("latitude"), row.get("longitude"))} for row in metadata_rows
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SensorMetadata.sensor_id],
+        set_={
+            column: stmt.excluded[column]
+            for column in ("description", "latitude", "longitude", "project_id", "geohash")
+        },
+    )
+    with engine.begin() as connection:
+        connection.execute(stmt)
+    _bump_metadata_version()
+    print(f"Upserted {len(metadata_rows)} rows to sensor_metadata.")
+    return len(metadata_rows)
+
+
 def insert_sensor_rows(dict_rows: list[dict]):
     """Insert sensor data rows directly into the database."""
     engine = get_engine()
-    with engine.begin() as connection:
-        stmt = insert(SensorData).values(dict_rows)
+    project = project_label(dict_rows[0].get("project_id") if dict_rows else None)
+    with span("db.insert_sensor_rows", rows=len(dict_rows)) as insert_span:
+        waited = time.perf_counter()
+        with engine.begin() as connection:
+            started = time.perf_counter()
+            POOL_WAIT_SECONDS.observe(started - waited)
+            dialect_insert = sqlite_insert if engine.dialect.name == "sqlite" else insert
+            stmt = dialect_insert(SensorData).values(dict_rows)
 
-        on_conflict_stmt = stmt.on_conflict_do_nothing(
-            index_elements=['timestamp', 'sensor_id', 'metric_name']
-        )
+            on_conflict_stmt = stmt.on_conflict_do_nothing(
+                index_elements=['timestamp', 'sensor_id', 'metric_name']
+            )
 
-        connection.execute(on_conflict_stmt)
-        print(f"Saved {len(dict_rows)} rows to table {SensorData.__tablename__}.")
+            result = connection.execute(on_conflict_stmt)
+        INSERT_SECONDS.observe(time.perf_counter() - started, project=project)
+        INSERT_BATCH_ROWS.observe(len(dict_rows), project=project)
+        if result.rowcount is not None and result.rowcount >= 0:
+            INSERT_DUPLICATES.inc(len(dict_rows) - result.rowcount, project=project)
+        if insert_span:
+            insert_span.set(pool_wait_ms=round((started - waited) * 1000, 3), inserted=result.rowcount)
+    print(f"Saved {len(dict_rows)} rows to table {SensorData.__tablename__}.")
+
+
+def _pool_stats() -> dict:
+    if ENGINE is None or not hasattr(ENGINE.pool, "checkedout"):
+        return {}
+    return {("checked_out",): ENGINE.pool.checkedout(), ("size",): ENGINE.pool.size()}
+
+
+POOL_CONNECTIONS.callback = _pool_stats
 
 
 def delete_sensor_metadata(sensor_id: str) -> int:
@@ -122,29 +289,638 @@ def delete_sensor_metadata(sensor_id: str) -> int:
         ).delete()
 
         session.commit()
+        _bump_metadata_version()
         print(f"Deleted {deleted_count} metadata rows for sensor {sensor_id}.")
         return deleted_count
 
 
-def get_oldest_timestamp_from_db(project_id: str) -> Optional[datetime]:
+def backfill_sensor_geohashes() -> int:
+    """Add the geohash column to older databases and fill it in for rows that lack one."""
     engine = get_engine()
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as connection:
+            connection.execute(text("ALTER TABLE IF EXISTS sensor_metadata ADD COLUMN IF NOT EXISTS geohash VARCHAR(12)"))
+            connection.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_sensor_metadata_geohash ON sensor_metadata (geohash)"
+            ))
     with Session(engine) as session:
-        oldest = (
-            session.query(func.min(SensorData.timestamp))
+        rows = session.query(SensorMetadata).filter(SensorMetadata.geohash.is_(None)).all()
+        for row in rows:
+            row.geohash = _geohash_of(row.latitude, row.longitude)
+        session.commit()
+    if rows:
+        _bump_metadata_version()
+        print(f"Computed geohash for {len(rows)} sensor_metadata rows.")
+    return len(rows)
+
+
+def _bbox_filter(min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+    """Geohash prefix ranges narrow the scan through the index; the coordinate checks make it exact.
+    A box with min_lon > max_lon crosses the antimeridian."""
+    boxes = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+    conditions = []
+    for west, east in boxes:
+        for low, high in geohash.prefix_ranges(geohash.cover(min_lat, west, max_lat, east)):
+            in_range = [SensorMetadata.geohash >= low] if low else []
+            if high is not None:
+                in_range.append(SensorMetadata.geohash < high)
+            conditions.append(and_(
+                *in_range,
+                SensorMetadata.longitude >= west,
+                SensorMetadata.longitude <= east,
+            ))
+    return and_(
+        SensorMetadata.latitude >= min_lat,
+        SensorMetadata.latitude <= max_lat,
+        or_(*conditions),
+    )
+
+
+def get_sensors_in_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                        project_id: Optional[str] = None, limit: Optional[int] = None) -> list[dict]:
+    """Sensors whose location falls inside the bounding box, ordered by geohash."""
+    engine = get_engine()
+    with Session(engine) as session:
+        query = session.query(SensorMetadata).filter(_bbox_filter(min_lat, min_lon, max_lat, max_lon))
+        if project_id:
+            query = query.filter(SensorMetadata.project_id == project_id)
+        query = query.order_by(SensorMetadata.geohash, SensorMetadata.sensor_id)
+        if limit is not None:
+            query = query.limit(limit)
+        return [
+            {
+                "sensor_id": row.sensor_id,
+                "description": row.description,
+                "latitude": row.latitude,
+                "longitude": row.longitude,
+                "project_id": row.project_id,
+            }
+            for row in query
+        ]
+
+
+def cluster_sensors_in_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float, precision: int,
+                            project_id: Optional[str] = None) -> list[dict]:
+    """Group the sensors inside the bounding box by geohash cell of the given length."""
+    engine = get_engine()
+    cell = func.substr(SensorMetadata.geohash, 1, precision)
+    with Session(engine) as session:
+        query = session.query(
+            cell,
+            func.count(),
+            func.avg(SensorMetadata.latitude),
+            func.avg(SensorMetadata.longitude),
+            func.min(SensorMetadata.sensor_id),
+            func.min(SensorMetadata.project_id),
+        ).filter(_bbox_filter(min_lat, min_lon, max_lat, max_lon))
+        if project_id:
+            query = query.filter(SensorMetadata.project_id == project_id)
+        rows = query.group_by(cell).order_by(cell).all()
+
+    return [
+        {
+            "geohash": cell_hash,
+            "count": count,
+            "latitude": latitude,
+            "longitude": longitude,
+            # A cell holding a single sensor is reported as that sensor
+            "sensor_id": sensor_id if count == 1 else None,
+            "project_id": project if count == 1 else None,
+        }
+        for cell_hash, count, latitude, longitude, sensor_id, project in rows
+    ]
+
+
+def get_oldest_timestamp_from_db(project_id: str, sensor_id: Optional[str] = None) -> Optional[datetime]:
+    engine = get_engine()
+    with Session(engine) as session:
+        query = session.query(func.min(SensorData.timestamp)).filter(SensorData.project_id == project_id)
+        if sensor_id:
+            query = query.filter(SensorData.sensor_id == sensor_id)
+        return query.scalar()
+
+
+def get_newest_timestamp_from_db(project_id: str, sensor_id: Optional[str] = None) -> Optional[datetime]:
+    engine = get_engine()
+    with Session(engine) as session:
+        query = session.query(func.max(SensorData.timestamp)).filter(SensorData.project_id == project_id)
+        if sensor_id:
+            query = query.filter(SensorData.sensor_id == sensor_id)
+        return query.scalar()
+
+
+def get_daily_reading_counts(project_id: str, start: Optional[datetime] = None,
+                             end: Optional[datetime] = None) -> dict[tuple[str, date], int]:
+    """Count readings (distinct timestamps) per sensor per UTC day for a project."""
+    engine = get_engine()
+    if engine.dialect.name == "postgresql":
+        day = func.time_bucket(text("INTERVAL '1 day'"), SensorData.timestamp)
+    else:
+        day = func.date(SensorData.timestamp)
+
+    with Session(engine) as session:
+        query = (
+            session.query(SensorData.sensor_id, day.label("day"), func.count(func.distinct(SensorData.timestamp)))
             .filter(SensorData.project_id == project_id)
-            .scalar()
         )
-        return oldest
+        if start:
+            query = query.filter(SensorData.timestamp >= start)
+        if end:
+            query = query.filter(SensorData.timestamp < end)
+
+        return {
+            (sensor_id, _bucket_date(bucket)): count
+            for sensor_id, bucket, count in query.group_by(SensorData.sensor_id, day).all()
+        }
 
 
-def get_newest_timestamp_from_db(project_id: str) -> Optional[datetime]:
+def get_reconciled_counts(project_id: str, first_day: date, last_day: date) -> dict[tuple[str, date], int]:
+    """Firestore counts recorded by earlier reconciliations, per (sensor document id, day)."""
     engine = get_engine()
     with Session(engine) as session:
-        newest = (
-            session.query(func.max(SensorData.timestamp))
-            .filter(SensorData.project_id == project_id)
-            .scalar()
+        rows = (
+            session.query(ReconciledDay.sensor_id, ReconciledDay.day, ReconciledDay.firestore_count)
+            .filter(ReconciledDay.project_id == project_id, ReconciledDay.day >= first_day,
+                    ReconciledDay.day <= last_day)
+            .all()
         )
-        return newest
+        return {(sensor_id, day): count for sensor_id, day, count in rows}
 
 
+def record_reconciled_counts(project_id: str, counts: dict[tuple[str, date], int]):
+    """Store the Firestore count each re-synced sensor-day was reconciled against."""
+    if not counts:
+        return
+    engine = get_engine()
+    dialect_insert = sqlite_insert if engine.dialect.name == "sqlite" else insert
+    now = datetime.now(timezone.utc)
+    stmt = dialect_insert(ReconciledDay).values([
+        {"project_id": project_id, "sensor_id": sensor_id, "day": day, "firestore_count": count, "reconciled_at": now}
+        for (sensor_id, day), count in counts.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ReconciledDay.project_id, ReconciledDay.sensor_id, ReconciledDay.day],
+        set_={column: stmt.excluded[column] for column in ("firestore_count", "reconciled_at")},
+    )
+    with engine.begin() as connection:
+        connection.execute(stmt)
+
+
+def _export_filter(query, project_id: str, sensor_ids: Optional[list[str]], start: Optional[datetime],
+                   end: Optional[datetime], metrics: Optional[list[str]]):
+    query = query.where(SensorData.project_id == project_id)
+    if sensor_ids:
+        query = query.where(SensorData.sensor_id.in_(sensor_ids))
+    if metrics:
+        query = query.where(SensorData.metric_name.in_(metrics))
+    if start:
+        query = query.where(SensorData.timestamp >= start)
+    if end:
+        query = query.where(SensorData.timestamp < end)
+    return query
+
+
+def stream_sensor_data(project_id: str, sensor_ids: Optional[list[str]] = None, start: Optional[datetime] = None,
+                       end: Optional[datetime] = None, metrics: Optional[list[str]] = None,
+                       chunk_size: int = 10_000):
+    """Yield sensor_data rows as lists of (timestamp, sensor_id, metric_name, metric_value) tuples.
+
+    Uses a server-side cursor, so only one chunk is in memory at a time however large the export.
+    Rows are ordered by timestamp, sensor and metric (the primary key order).
+    """
+    query = _export_filter(
+        select(SensorData.timestamp, SensorData.sensor_id, SensorData.metric_name, SensorData.metric_value),
+        project_id, sensor_ids, start, end, metrics,
+    ).order_by(SensorData.timestamp, SensorData.sensor_id, SensorData.metric_name)
+
+    engine = get_engine()
+    with engine.connect().execution_options(stream_results=True, yield_per=chunk_size) as conn:
+        for partition in conn.execute(query).partitions():
+            yield [(as_utc(ts), sensor_id, name, value) for ts, sensor_id, name, value in partition]
+
+
+def get_export_metric_names(project_id: str, sensor_ids: Optional[list[str]] = None,
+                            start: Optional[datetime] = None, end: Optional[datetime] = None) -> list[str]:
+    """Distinct metric names of an export, the columns of a wide export."""
+    query = _export_filter(
+        select(SensorData.metric_name).distinct(), project_id, sensor_ids, start, end, None
+    ).order_by(SensorData.metric_name)
+    with get_engine().connect() as conn:
+        return list(conn.execute(query).scalars())
+
+
+def rollup_available() -> bool:
+    """Whether the hourly rollup view exists; checked once per process."""
+    global _rollup_available
+    if _rollup_available is None:
+        engine = get_engine()
+        if engine.dialect.name != "postgresql":
+            _rollup_available = False
+        else:
+            with engine.connect() as conn:
+                regclass = conn.execute(text("SELECT to_regclass(:name)"), {"name": ROLLUP_VIEW}).scalar()
+            _rollup_available = regclass is not None
+    return _rollup_available
+
+
+def get_sensor_series(sensor_id: str, metrics: Optional[list[str]], start: datetime, end: datetime,
+                      bucket_seconds: Optional[int] = None, aggregation: str = "avg",
+                      limit: Optional[int] = None) -> tuple[dict[str, list[tuple[datetime, float]]], str]:
+    """Numeric readings of a sensor in [start, end) per metric, optionally aggregated per time bucket.
+
+    Returns ({metric: [(timestamp, value), ...]}, source) where source is the table or view read.
+    Non-numeric values are skipped. On Postgres buckets are computed with time_bucket, from the
+    hourly rollup when the bucket is a whole number of hours and the range covers a whole hour;
+    other databases bucket in Python.
+    """
+    engine = get_engine()
+    if bucket_seconds and engine.dialect.name == "postgresql":
+        if bucket_seconds % ROLLUP_BUCKET_SECONDS == 0 and _whole_hours(start, end) and rollup_available():
+            rows = _rollup_series_rows(engine, sensor_id, metrics, start, end, bucket_seconds, aggregation)
+            return _group_series(rows), ROLLUP_VIEW
+        rows = _bucketed_series_rows(engine, sensor_id, metrics, start, end, bucket_seconds, aggregation)
+        return _group_series(rows), SensorData.__tablename__
+
+    with Session(engine) as session:
+        query = (
+            session.query(SensorData.timestamp, SensorData.metric_name, SensorData.metric_value)
+            .filter(SensorData.sensor_id == sensor_id, SensorData.timestamp >= start, SensorData.timestamp < end)
+        )
+        if metrics:
+            query = query.filter(SensorData.metric_name.in_(metrics))
+        query = query.order_by(SensorData.timestamp)
+        if limit:
+            query = query.limit(limit)
+        rows = [(as_utc(ts), name, _to_float(value)) for ts, name, value in query.all()]
+
+    rows = [row for row in rows if row[2] is not None]
+    if bucket_seconds:
+        rows = _bucket_rows(rows, bucket_seconds, aggregation)
+    return _group_series(rows), SensorData.__tablename__
+
+
+def _numeric_metric_value():
+    return case((SensorData.metric_value.op("~")(NUMERIC_PATTERN), cast(SensorData.metric_value, Float)))
+
+
+def _bucketed_series_rows(engine, sensor_id, metrics, start, end, bucket_seconds, aggregation):
+    bucket = func.time_bucket(text(f"INTERVAL '{int(bucket_seconds)} seconds'"), SensorData.timestamp).label("bucket")
+    value = getattr(func, aggregation)(_numeric_metric_value())
+    with Session(engine) as session:
+        query = (
+            session.query(bucket, SensorData.metric_name, value)
+            .filter(SensorData.sensor_id == sensor_id, SensorData.timestamp >= start, SensorData.timestamp < end)
+        )
+        if metrics:
+            query = query.filter(SensorData.metric_name.in_(metrics))
+        return query.group_by(bucket, SensorData.metric_name).order_by(bucket).all()
+
+
+_rollup = table(
+    ROLLUP_VIEW,
+    column("bucket", DateTime(timezone=True)), column("sensor_id", String), column("metric_name", String),
+    column("value_count", Integer), column("value_sum", Float), column("value_min", Float), column("value_max", Float),
+)
+
+
+def _hour_floor(value: datetime) -> datetime:
+    epoch = int(value.timestamp()) // ROLLUP_BUCKET_SECONDS * ROLLUP_BUCKET_SECONDS
+    return datetime.fromtimestamp(epoch, tz=timezone.utc)
+
+
+def _whole_hours(start: datetime, end: datetime) -> Optional[tuple[datetime, datetime]]:
+    """The whole rollup hours inside [start, end), or None when there are none."""
+    first = _hour_floor(start)
+    if first < start:
+        first += timedelta(seconds=ROLLUP_BUCKET_SECONDS)
+    last = _hour_floor(end)
+    return (first, last) if first < last else None
+
+
+def _rollup_series_rows(engine, sensor_id, metrics, start, end, bucket_seconds, aggregation):
+    """Buckets of [start, end) from the hourly rollup, with the partial hours at either end read from
+    sensor_data, so the edge buckets are the same as those of _bucketed_series_rows."""
+    first, last = _whole_hours(start, end)
+    parts = _rollup_components(engine, sensor_id, metrics, first, last, bucket_seconds)
+    edges = [(low, high) for low, high in ((start, first), (last, end)) if low < high]
+    if edges:
+        parts += _raw_components(engine, sensor_id, metrics, edges, bucket_seconds)
+    return _combine_components(parts, aggregation)
+
+
+def _rollup_components(engine, sensor_id, metrics, start, end, bucket_seconds):
+    c = _rollup.c
+    bucket = func.time_bucket(text(f"INTERVAL '{int(bucket_seconds)} seconds'"), c.bucket).label("bucket")
+    query = (
+        select(bucket, c.metric_name, func.sum(c.value_count), func.sum(c.value_sum), func.min(c.value_min),
+               func.max(c.value_max))
+        .where(c.sensor_id == sensor_id, c.bucket >= start, c.bucket < end)
+        .group_by(bucket, c.metric_name)
+    )
+    if metrics:
+        query = query.where(c.metric_name.in_(metrics))
+    with engine.connect() as conn:
+        return conn.execute(query).all()
+
+
+def _raw_components(engine, sensor_id, metrics, ranges, bucket_seconds):
+    """(bucket, metric, count, sum, min, max) of the numeric readings in the given [low, high) ranges."""
+    bucket = func.time_bucket(text(f"INTERVAL '{int(bucket_seconds)} seconds'"), SensorData.timestamp).label("bucket")
+    value = _numeric_metric_value()
+    query = (
+        select(bucket, SensorData.metric_name, func.count(value), func.sum(value), func.min(value), func.max(value))
+        .where(SensorData.sensor_id == sensor_id,
+               or_(*(and_(SensorData.timestamp >= low, SensorData.timestamp < high) for low, high in ranges)))
+        .group_by(bucket, SensorData.metric_name)
+    )
+    if metrics:
+        query = query.where(SensorData.metric_name.in_(metrics))
+    with engine.connect() as conn:
+        return conn.execute(query).all()
+
+
+def _combine(current, value, merge):
+    if current is None or value is None:
+        return value if current is None else current
+    return merge(current, value)
+
+
+def _combine_components(parts, aggregation: str):
+    combined: dict[tuple[datetime, str], list] = {}
+    for bucket, name, count, total, low, high in parts:
+        key = (as_utc(bucket), name)
+        if key not in combined:
+            combined[key] = [count or 0, total, low, high]
+            continue
+        entry = combined[key]
+        entry[0] += count or 0
+        entry[1] = _combine(entry[1], total, lambda a, b: a + b)
+        entry[2] = _combine(entry[2], low, min)
+        entry[3] = _combine(entry[3], high, max)
+
+    def value(count, total, low, high):
+        if aggregation == "count":
+            return count
+        if aggregation == "avg":
+            return total / count if count else None
+        return {"min": low, "max": high, "sum": total}[aggregation]
+
+    return [(bucket, name, value(*entry)) for (bucket, name), entry in sorted(combined.items())]
+
+
+def _bucket_rows(rows, bucket_seconds: int, aggregation: str):
+    buckets: dict[tuple[datetime, str], list[float]] = {}
+    for ts, name, value in rows:
+        epoch = int(ts.timestamp()) // bucket_seconds * bucket_seconds
+        buckets.setdefault((datetime.fromtimestamp(epoch, tz=timezone.utc), name), []).append(value)
+
+    aggregate = {
+        "avg": lambda values: sum(values) / len(values),
+        "min": min,
+        "max": max,
+        "sum": sum,
+        "count": len,
+    }[aggregation]
+    return [(bucket, name, aggregate(values)) for (bucket, name), values in sorted(buckets.items())]
+
+
+def _group_series(rows) -> dict[str, list[tuple[datetime, float]]]:
+    series: dict[str, list[tuple[datetime, float]]] = {}
+    for ts, name, value in rows:
+        if value is not None:
+            series.setdefault(name, []).append((ts, float(value)))
+    return series
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _bucket_date(bucket) -> date:
+    if isinstance(bucket, str):
+        bucket = datetime.fromisoformat(bucket)
+    if isinstance(bucket, datetime):
+        return bucket.astimezone(timezone.utc).date() if bucket.tzinfo else bucket.date()
+    return bucket
+
+
+def _sync_job_to_dict(job: SyncJob) -> dict:
+    return {
+        "job_id": job.job_id,
+        "job_type": job.job_type,
+        "state": job.state,
+        "scope": [key for key in job.scope.split(",") if key],
+        "params": json.loads(job.params) if job.params else None,
+        "current_project": job.current_project,
+        "docs_read": job.docs_read,
+        "docs_total": job.docs_total,
+        "rows_written": job.rows_written,
+        "error": job.error,
+        "cancel_requested": job.cancel_requested,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "heartbeat_at": job.heartbeat_at,
+    }
+
+
+def _active_jobs_filter(job_type: str):
+    stale_before = datetime.now(timezone.utc) - timedelta(seconds=STALE_JOB_SECONDS)
+    return (
+        SyncJob.job_type == job_type,
+        SyncJob.state.in_(ACTIVE_JOB_STATES),
+        or_(
+            and_(SyncJob.heartbeat_at.is_(None), SyncJob.created_at >= stale_before),
+            SyncJob.heartbeat_at >= stale_before,
+        ),
+    )
+
+
+def _overlaps(job: SyncJob, scope: list[str]) -> bool:
+    running = {key for key in job.scope.split(",") if key}
+    return not running or not scope or bool(running & set(scope))
+
+
+def create_sync_job(job_type: str, scope: Optional[list[str]] = None,
+                    params: Optional[dict] = None) -> tuple[Optional[dict], Optional[dict]]:
+    """Create a queued job unless an active job of the same type covers any of the scope keys.
+
+    The scope is the list of projects (history jobs) or sensors (backfill jobs) the job works on;
+    an empty scope means everything.
+
+    Returns (new_job, None) on success and (None, conflicting_job) otherwise. The check and
+    insert are serialized with a transaction-level advisory lock so workers cannot race.
+    """
+    scope = scope or []
+    engine = get_engine()
+    with Session(engine) as session, session.begin():
+        if engine.dialect.name == "postgresql":
+            session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"jobs:{job_type}"})
+
+        for active in session.query(SyncJob).filter(*_active_jobs_filter(job_type)).all():
+            if _overlaps(active, scope):
+                return None, _sync_job_to_dict(active)
+
+        job = SyncJob(
+            job_id=str(uuid.uuid4()),
+            job_type=job_type,
+            state="queued",
+            scope=",".join(scope),
+            params=json.dumps(params, default=str) if params else None,
+            docs_read=0,
+            rows_written=0,
+            cancel_requested=False,
+            created_at=datetime.now(timezone.utc),
+        )
+        session.add(job)
+        session.flush()
+        return _sync_job_to_dict(job), None
+
+
+def update_sync_job(job_id: str, **fields) -> bool:
+    """Update columns of a job. Returns True when the job has been asked to cancel."""
+    engine = get_engine()
+    with Session(engine) as session:
+        job = session.get(SyncJob, job_id)
+        if job is None:
+            return False
+        for key, value in fields.items():
+            setattr(job, key, value)
+        session.commit()
+        return job.cancel_requested
+
+
+def touch_queued_sync_jobs(job_ids: list[str]) -> int:
+    """Refresh the heartbeat of jobs still waiting to start, so they are not taken for dead."""
+    engine = get_engine()
+    with Session(engine) as session:
+        updated = (
+            session.query(SyncJob)
+            .filter(SyncJob.job_id.in_(job_ids), SyncJob.state == "queued")
+            .update({SyncJob.heartbeat_at: datetime.now(timezone.utc)}, synchronize_session=False)
+        )
+        session.commit()
+        return updated
+
+
+def get_sync_job(job_id: str) -> Optional[dict]:
+    engine = get_engine()
+    with Session(engine) as session:
+        job = session.get(SyncJob, job_id)
+        return _sync_job_to_dict(job) if job else None
+
+
+def list_sync_jobs(job_type: str, limit: int = 20) -> list[dict]:
+    """Return the most recent jobs of a type, newest first."""
+    engine = get_engine()
+    with Session(engine) as session:
+        jobs = (
+            session.query(SyncJob)
+            .filter(SyncJob.job_type == job_type)
+            .order_by(SyncJob.created_at.desc())
+            .limit(limit)
+            .all()
+        )
+        return [_sync_job_to_dict(job) for job in jobs]
+
+
+def request_sync_job_cancel(job_id: str) -> Optional[dict]:
+    """Flag an active job for cancellation. The running worker picks the flag up on its next heartbeat."""
+    engine = get_engine()
+    with Session(engine) as session:
+        job = session.get(SyncJob, job_id)
+        if job is None:
+            return None
+        if job.state in ACTIVE_JOB_STATES:
+            job.cancel_requested = True
+            session.commit()
+        return _sync_job_to_dict(job)
+
+
+@contextmanager
+def advisory_lock(key: str):
+    """Try to take a cross-process lock by name; yields whether it was acquired.
+
+    Uses a session-level Postgres advisory lock held on a dedicated connection, so the lock is
+    released automatically if the worker dies. Other databases always acquire.
+    """
+    engine = get_engine()
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+
+    with engine.connect() as conn:
+        acquired = conn.execute(text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": key}).scalar()
+        try:
+            yield bool(acquired)
+        finally:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": key})
+
+
+def project_sync_lock(project_id: str):
+    """Lock held while a job syncs one project, so two jobs never sync the same project."""
+    return advisory_lock(f"sync:{project_id}")
+
+
+def _summary_to_dict(summary: UnconfiguredSensorSummary) -> dict:
+    return {
+        "sensor_id": summary.sensor_id,
+        "reading_count": summary.reading_count,
+        "first_seen": as_utc(summary.first_seen),
+        "last_seen": as_utc(summary.last_seen),
+        "raw_keys": json.loads(summary.raw_keys),
+        "sample": json.loads(summary.sample),
+        "watermark": as_utc(summary.watermark),
+        "updated_at": summary.updated_at,
+    }
+
+
+def get_unconfigured_sensor_summaries(sensor_ids: Optional[list[str]] = None) -> list[dict]:
+    """Return discovery summaries, most recently seen first."""
+    engine = get_engine()
+    with Session(engine) as session:
+        query = session.query(UnconfiguredSensorSummary)
+        if sensor_ids is not None:
+            query = query.filter(UnconfiguredSensorSummary.sensor_id.in_(sensor_ids))
+        summaries = query.order_by(UnconfiguredSensorSummary.last_seen.desc()).all()
+        return [_summary_to_dict(summary) for summary in summaries]
+
+
+def get_unconfigured_sensor_summary(sensor_id: str) -> Optional[dict]:
+    engine = get_engine()
+    with Session(engine) as session:
+        summary = session.get(UnconfiguredSensorSummary, sensor_id)
+        return _summary_to_dict(summary) if summary else None
+
+
+def save_unconfigured_sensor_summary(summary: dict):
+    engine = get_engine()
+    with Session(engine) as session:
+        session.merge(UnconfiguredSensorSummary(
+            sensor_id=summary["sensor_id"],
+            reading_count=summary["reading_count"],
+            first_seen=summary["first_seen"],
+            last_seen=summary["last_seen"],
+            raw_keys=json.dumps(summary["raw_keys"]),
+            sample=json.dumps(summary["sample"], default=str),
+            watermark=summary["watermark"],
+            updated_at=datetime.now(timezone.utc),
+        ))
+        session.commit()
+
+
+def delete_unconfigured_sensor_summaries(sensor_ids: list[str]) -> int:
+    if not sensor_ids:
+        return 0
+    engine = get_engine()
+    with Session(engine) as session:
+        deleted_count = session.query(UnconfiguredSensorSummary).filter(
+            UnconfiguredSensorSummary.sensor_id.in_(sensor_ids)
+        ).delete(synchronize_session=False)
+        session.commit()
+        return deleted_count
@@ -1,13 +1,63 @@
-from fastapi import Depends, HTTPException, status
+import hashlib
+import logging
+import os
+import time
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Request, status
 from src.auth import auth0
+from src.utils.cache import TTLCache
+from src.utils.tracing import span
 
 ADMIN_CLAIM = "https://envidata-api.metropolia.fi/admin"
 
+# Verified claims of a Bearer token are reused for this long, never past the token's exp; 0 disables
+AUTH_CLAIMS_CACHE_SECONDS = float(os.getenv("AUTH_CLAIMS_CACHE_SECONDS", "300"))
+AUTH_CLAIMS_CACHE_SIZE = int(os.getenv("AUTH_CLAIMS_CACHE_SIZE", "1024"))
+
+logger = logging.getLogger(__name__)
+
+_require_auth = auth0.require_auth()
+
+# Keyed by the SHA-256 of the token, so raw tokens are not kept in memory
+verified_claims = TTLCache(maxsize=AUTH_CLAIMS_CACHE_SIZE, ttl=AUTH_CLAIMS_CACHE_SECONDS)
+
+
+def _claims_cache_key(request: Request) -> Optional[str]:
+    """Cache key of a plain Bearer request. DPoP requests are never cached: their proof is bound
+    to the method, URL and time of each request and has to be checked every time."""
+    if AUTH_CLAIMS_CACHE_SECONDS <= 0 or "dpop" in request.headers:
+        return None
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    token = token.strip()
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def verify_token(request: Request) -> dict:
+    """auth0.require_auth() behind the verified-claims cache, timed as the "auth" stage of the
+    request trace."""
+    key = _claims_cache_key(request)
+    with span("auth") as auth_span:
+        claims = verified_claims.get(key) if key else None
+        if auth_span is not None:
+            auth_span.set(cached=claims is not None)
+        if claims is not None:
+            return claims
+        claims = await _require_auth(request)
+
+    if key:
+        ttl = min(AUTH_CLAIMS_CACHE_SECONDS, claims.get("exp", 0) - time.time())
+        if ttl > 0:
+            verified_claims.set(key, claims, ttl=ttl)
+    return claims
+
 
 def get_auth_claims(
-        claims: dict = Depends(auth0.require_auth()),
+        claims: dict = Depends(verify_token),
 ) -> dict:
-    print("Decoded JWT claims:", claims)
+    logger.debug("Decoded JWT claims: %s", claims)
     return claims
 
 
@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+from typing import Optional
+
+from google.cloud import firestore
+
+# One client (and so one gRPC channel) per process, created on first use
+project_id = os.getenv("GCP_PROJECT_ID")
+CLIENT = None
+_client_lock = threading.Lock()
+
+# Open the channel in the background at startup instead of on the first request
+WARMUP_ENABLED = os.getenv("FIRESTORE_WARMUP", "true").lower() == "true"
+
+# Result of the last warm-up, reported by /health/ready
+_health = {"ready": False, "error": None, "checked_at": None, "latency_ms": None}
+
+
+def get_firestore_client():
+    """Return the shared Firestore client, or None when it cannot be created (e.g. missing credentials)."""
+    global CLIENT
+    if CLIENT is None:
+        with _client_lock:
+            if CLIENT is None:
+                try:
+                    CLIENT = firestore.Client(project=project_id)
+                except Exception as e:
+                    print(f"Failed to initialize Firestore client: {e}")
+                    _health.update(ready=False, error=str(e), checked_at=time.time())
+                    return None
+                if not WARMUP_ENABLED:
+                    # Without a warm-up there is no probe read; a created client is as ready as it gets
+                    _health.update(ready=True, error=None, checked_at=time.time())
+    return CLIENT
+
+
+def require_firestore_client():
+    client = get_firestore_client()
+    if client is None:
+        raise RuntimeError("Firestore client not initialized (check credentials)")
+    return client
+
+
+def warm_up_firestore_client() -> bool:
+    """Create the client and make one small read, so channel and credential setup are not paid by a request."""
+    started = time.perf_counter()
+    client = get_firestore_client()
+    if client is None:
+        return False
+    try:
+        list(client.collection("sensor_config").limit(1).stream())
+    except Exception as e:
+        print(f"Firestore warm-up failed: {e}")
+        _health.update(ready=False, error=str(e), checked_at=time.time(), latency_ms=None)
+        return False
+
+    latency_ms = round((time.perf_counter() - started) * 1000, 1)
+    _health.update(ready=True, error=None, checked_at=time.time(), latency_ms=latency_ms)
+    print(f"Firestore client ready in {latency_ms} ms")
+    return True
+
+
+def start_firestore_warm_up(after=None) -> threading.Thread:
+    """Warm up in the background so startup is not blocked; `after` runs once the client is ready."""
+    def run():
+        if warm_up_firestore_client() and after is not None:
+            after()
+
+    thread = threading.Thread(target=run, name="firestore-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def firestore_health() -> dict:
+    return dict(_health)
+
+
+def reset_firestore_client(client: Optional[object] = None):
+    """Replace the shared client (tests, or after credentials changed)."""
+    global CLIENT
+    with _client_lock:
+        CLIENT = client
+        _health.update(ready=False, error=None, checked_at=None, latency_ms=None)
@@ -0,0 +1,214 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from google.cloud.firestore_v1 import FieldFilter
+
+from src.db import insert_sensor_rows, get_newest_timestamp_from_db, advisory_lock
+from src.live_stream import publish_live_rows
+from src.utils.metrics import FIRESTORE_READS
+from src.firestore_client import get_firestore_client
+from src.history_to_timescale import get_all_firestore_project_ids
+from src.SensorDataParser import SensorDataParser
+
+TAIL_ENABLED = os.getenv("FIRESTORE_TAIL_ENABLED", "false").lower() == "true"
+
+# Micro-batch limits: flush when either the batch is full or the interval has passed
+TAIL_BATCH_SIZE = int(os.getenv("FIRESTORE_TAIL_BATCH_SIZE", "500"))
+TAIL_FLUSH_SECONDS = float(os.getenv("FIRESTORE_TAIL_FLUSH_SECONDS", "1"))
+
+# How often new projects are discovered and dead listeners are restarted
+TAIL_DISCOVERY_SECONDS = float(os.getenv("FIRESTORE_TAIL_DISCOVERY_SECONDS", "300"))
+TAIL_RECONNECT_SECONDS = float(os.getenv("FIRESTORE_TAIL_RECONNECT_SECONDS", "5"))
+
+# A listener keeps every matched document in memory, so it is periodically re-opened
+# from the current watermark to drop the documents already written
+TAIL_RESUBSCRIBE_SECONDS = float(os.getenv("FIRESTORE_TAIL_RESUBSCRIBE_SECONDS", "3600"))
+# A re-opened listener starts this far before the watermark, so readings that reach Firestore late
+# with an older timestamp (buffering gateways, clocks running ahead) are still picked up; the
+# re-read ones are absorbed by ON CONFLICT DO NOTHING
+TAIL_RESUBSCRIBE_OVERLAP_SECONDS = float(os.getenv("FIRESTORE_TAIL_RESUBSCRIBE_OVERLAP_SECONDS", "3600"))
+
+TAIL_LOCK_KEY = "firestore-tail"
+
+
+class ProjectTail:
+    """Snapshot listener on one project's `readings`, resumed from the newest timestamp written."""
+
+    def __init__(self, client, project_id: str):
+        self.client = client
+        self.project_id = project_id
+        self.parser = SensorDataParser(project_id)
+        self.pending = queue.Queue()
+        # Rows of a batch whose insert failed, written before anything else on the next flush
+        self.retry_rows: list[dict] = []
+        self.watermark = None
+        self.watch = None
+        self.subscribed_at = 0.0
+        self.failed_at = 0.0
+
+    def subscribe(self):
+        # Documents already queued by the old listener stay pending and are still written
+        self.unsubscribe()
+        if self.watermark is None:
+            # Without any synced data start from now; older readings are the history sync's job
+            self.watermark = get_newest_timestamp_from_db(self.project_id) or datetime.now(timezone.utc)
+
+        query = self.client.collection_group("readings") \
+            .where(filter=FieldFilter("project_id", "==", self.project_id)) \
+            .where(filter=FieldFilter("timestamp", ">", self.resume_from()))
+
+        self.watch = query.on_snapshot(self._on_snapshot)
+        self.subscribed_at = time.monotonic()
+        print(f"Tailing readings of {self.project_id} after {self.resume_from()}")
+
+    def resume_from(self) -> datetime:
+        return self.watermark - timedelta(seconds=TAIL_RESUBSCRIBE_OVERLAP_SECONDS)
+
+    def unsubscribe(self):
+        if self.watch is not None:
+            try:
+                self.watch.unsubscribe()
+            except Exception as e:
+                print(f"Error closing listener for {self.project_id}: {e}")
+            self.watch = None
+
+    @property
+    def is_active(self) -> bool:
+        return self.watch is not None and self.watch.is_active
+
+    def needs_resubscribe(self) -> bool:
+        if not self.is_active:
+            return time.monotonic() - self.failed_at >= TAIL_RECONNECT_SECONDS
+        return time.monotonic() - self.subscribed_at >= TAIL_RESUBSCRIBE_SECONDS
+
+    def _on_snapshot(self, docs, changes, read_time):
+        # Runs on the listener's thread; only hand the documents over to the flusher
+        for change in changes:
+            if change.type.name in ("ADDED", "MODIFIED"):
+                FIRESTORE_READS.inc(project=self.project_id, source="tail")
+                self.pending.put(change.document.to_dict())
+
+    def flush(self) -> int:
+        """Normalize and write pending documents in micro-batches. Returns the number of rows written.
+
+        A batch whose insert fails is kept and retried first on the next flush, so a database
+        outage delays readings instead of dropping them.
+        """
+        written = 0
+        while self.retry_rows or not self.pending.empty():
+            if self.retry_rows:
+                rows, self.retry_rows = self.retry_rows, []
+            else:
+                rows = self._next_batch()
+                if not rows:
+                    continue
+
+            try:
+                insert_sensor_rows(rows)
+            except Exception:
+                self.retry_rows = rows
+                raise
+
+            # Re-read overlap and late readings are not news to live subscribers
+            fresh = [row for row in rows if self.watermark is None or row["timestamp"] > self.watermark]
+            publish_live_rows(fresh)
+            written += len(rows)
+            self.watermark = max(self.watermark, rows[-1]["timestamp"]) if self.watermark else rows[-1]["timestamp"]
+        return written
+
+    def _next_batch(self) -> list[dict]:
+        raw_docs = []
+        while len(raw_docs) < TAIL_BATCH_SIZE:
+            try:
+                raw_docs.append(self.pending.get_nowait())
+            except queue.Empty:
+                break
+
+        rows = []
+        for raw_data in raw_docs:
+            try:
+                rows.extend(self.parser.process_raw_sensor_data(raw_data))
+            except Exception as e:
+                print(f"Skipping unparseable reading in {self.project_id}: {e}")
+
+        for row in rows:
+            row["project_id"] = self.project_id
+        rows.sort(key=lambda x: x["timestamp"])
+        return rows
+
+
+class FirestoreTail:
+    """Keeps one snapshot listener per project and writes their changes to TimescaleDB.
+
+    Only one process tails at a time (Postgres advisory lock), so running several uvicorn
+    workers does not multiply the writes.
+    """
+
+    def __init__(self):
+        self.tails: dict[str, ProjectTail] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="firestore-tail", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=10)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with advisory_lock(TAIL_LOCK_KEY) as leader:
+                    if leader:
+                        self._tail_until_stopped()
+            except Exception as e:
+                print(f"Firestore tail failed: {e}")
+            finally:
+                for tail in self.tails.values():
+                    tail.unsubscribe()
+            self._stop.wait(TAIL_RECONNECT_SECONDS)
+
+    def _tail_until_stopped(self):
+        client = get_firestore_client()
+        if not client:
+            print("Firestore client not initialized, tail mode disabled until it is available.")
+            return
+
+        last_discovery = None
+        while not self._stop.is_set():
+            if last_discovery is None or time.monotonic() - last_discovery >= TAIL_DISCOVERY_SECONDS:
+                for pid in get_all_firestore_project_ids():
+                    if pid not in self.tails:
+                        self.tails[pid] = ProjectTail(client, pid)
+                last_discovery = time.monotonic()
+
+            self.step()
+            self._stop.wait(TAIL_FLUSH_SECONDS)
+
+    def step(self):
+        """Flush every project and reopen listeners that died or are due for a fresh watermark."""
+        for tail in self.tails.values():
+            try:
+                tail.flush()
+            except Exception as e:
+                # The listener keeps running; the failed batch stays in retry_rows for the next step
+                print(f"Failed to write tailed readings for {tail.project_id}: {e}")
+                continue
+
+            if tail.needs_resubscribe():
+                try:
+                    tail.subscribe()
+                except Exception as e:
+                    print(f"Failed to subscribe to {tail.project_id}: {e}")
+                    tail.unsubscribe()
+                    tail.failed_at = time.monotonic()
+
+
+def start_firestore_tail():
+    return FirestoreTail().start()
@@ -1,30 +1,38 @@
+import argparse
 import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
 
 from google.cloud import firestore
 from google.cloud.firestore_v1 import FieldFilter
 
-from src.db import insert_sensor_rows, get_oldest_timestamp_from_db, get_newest_timestamp_from_db
+from src.db import (
+    insert_sensor_rows, get_oldest_timestamp_from_db, get_newest_timestamp_from_db, project_sync_lock, create_sync_job,
+    get_sync_job
+)
+from src.firestore_client import get_firestore_client
 from src.SensorDataParser import SensorDataParser
-from src.utils.sync_status import sync_status
+from src.sensor_mappings import ensure_sensor_mappings
+from src.utils.sync_jobs import start_job, SyncCancelled
+from src.utils.metrics import FIRESTORE_READS, SYNC_DOCS_PER_SECOND
+from src.utils.tracing import span, current_span
+from src.utils.profiling import profile_call
 
-# Firestore client
-project_id = os.getenv("GCP_PROJECT_ID")
-CLIENT = None
+# Firestore collections to fetch history from
+COLLECTIONS = os.getenv("FIRESTORE_COLLECTIONS", "").split(",")
 
+# Number of timestamp-range shards read concurrently per collection-group query
+SYNC_PARTITIONS = int(os.getenv("FIRESTORE_SYNC_PARTITIONS", "4"))
 
-def get_firestore_client():
-    global CLIENT
-    if CLIENT is None:
-        try:
-            CLIENT = firestore.Client(project=project_id)
-        except Exception as e:
-            print(f"Failed to initialize Firestore client: {e}")
-            return None
-    return CLIENT
+# Max documents buffered between the shard readers and the parser
+PARTITION_QUEUE_SIZE = 10000
 
-
-# Firestore collections to fetch history from
-COLLECTIONS = os.getenv("FIRESTORE_COLLECTIONS", "").split(",")
+_SHARD_DONE = object()
 
 
 def get_all_firestore_project_ids():
@@ -35,81 +43,277 @@ def get_all_firestore_project_ids():
     return project_ids
 
 
-def sync_firestore_to_timescale():
-    sync_status["state"] = "running"
-    sync_status["error"] = None
+def sync_firestore_to_timescale(job_id: Optional[str] = None, project_ids: Optional[list[str]] = None,
+                                sensor_ids: Optional[list[str]] = None, start: Optional[datetime] = None,
+                                end: Optional[datetime] = None, workers: Optional[int] = None):
+    """Run a history sync, tracked as the given sync job (created with create_sync_job).
+
+    Without options every discovered project is synced incrementally from the newest and oldest
+    timestamps already stored. Project and sensor lists skip discovery, and an explicit
+    start/end range re-reads exactly that range regardless of what is stored.
+    """
+    progress = start_job(job_id)
 
     client = get_firestore_client()
     if not client:
-        sync_status["state"] = "failed"
-        sync_status["error"] = "Firestore client not initialized (check credentials)"
+        progress.finish("failed", "Firestore client not initialized (check credentials)")
         print("Firestore client initialization failed. Skipping sync.")
         return
 
+    # The CLI runs without the API's background refresher
+    ensure_sensor_mappings(client)
+
+    try:
+        with span("history_sync", root=True, job_id=progress.job_id):
+            for pid in project_ids or get_all_firestore_project_ids():
+                progress.check_cancelled()
+
+                with project_sync_lock(pid) as acquired:
+                    if not acquired:
+                        print(f"Project {pid} is already being synced by another job, skipping.")
+                        progress.skip_project(pid)
+                        continue
+                    with span("sync_project", project=pid):
+                        sync_project(client, pid, progress, sensor_ids=sensor_ids, start=start, end=end,
+                                     partitions=workers or SYNC_PARTITIONS)
+
+        progress.complete()
+    except SyncCancelled:
+        progress.finish("cancelled")
+        print(f"Synchronization job {progress.job_id} cancelled.")
+    except Exception as e:
+        progress.finish("failed", str(e))
+        print(f"Synchronization failed: {e}")
+    finally:
+        print("Synchronization process completed.")
+
+
+def sync_project(client, pid, progress=None, sensor_ids=None, start=None, end=None, partitions=SYNC_PARTITIONS):
+    parser = SensorDataParser(pid)
+
+    if sensor_ids:
+        sources = [
+            (sid.replace(":", ""),
+             client.collection("projects").document(pid).collection("sensors").document(sid).collection("readings"))
+            for sid in sensor_ids
+        ]
+    else:
+        sources = [(None, client.collection_group("readings").where(filter=FieldFilter("project_id", "==", pid)))]
+
+    for db_sensor_id, query_base in sources:
+        if start or end:
+            ranges = [{"since": start, "before": end}]
+        else:
+            newest_ts = get_newest_timestamp_from_db(pid, db_sensor_id)
+            oldest_ts = get_oldest_timestamp_from_db(pid, db_sensor_id)
+            ranges = [{"after": newest_ts}]
+            if oldest_ts:
+                ranges.append({"before": oldest_ts})
+
+        if progress:
+            estimates = [estimate_document_count(filter_by_timestamp(query_base, **r)) for r in ranges]
+            progress.set_project(pid, None if None in estimates else sum(estimates))
+
+        label = f"{pid}/{db_sensor_id}" if db_sensor_id else pid
+        for r in ranges:
+            print(f"Fetching records for {label} ({', '.join(f'{k} {v}' for k, v in r.items() if v) or 'all'})...")
+            process_and_batch_save(read_readings(query_base, partitions=partitions, **r), parser, pid, progress)
+
+
+def estimate_document_count(query) -> Optional[int]:
+    """Count matching documents with a server-side aggregation (billed per 1000 index entries)."""
     try:
-        project_ids = get_all_firestore_project_ids()
+        with span("firestore.count"):
+            result = query.count().get()
+        return int(result[0][0].value)
+    except Exception as e:
+        print(f"Could not count documents: {e}")
+        return None
 
-        for pid in project_ids:
 
-            newest_ts = get_newest_timestamp_from_db(pid)
-            oldest_ts = get_oldest_timestamp_from_db(pid)
+def filter_by_timestamp(query, after=None, before=None, since=None):
+    if after:
+        query = query.where(filter=FieldFilter("timestamp", ">", after))
+    if since:
+        query = query.where(filter=FieldFilter("timestamp", ">=", since))
+    if before:
+        query = query.where(filter=FieldFilter("timestamp", "<", before))
+    return query
 
-            parser = SensorDataParser(pid)
 
-            query_base = client.collection_group("readings").where(filter=FieldFilter("project_id", "==", pid))
-            all_docs = list(query_base.stream())
-            print(f"DEBUG: Collection group found {len(all_docs)} docs total for project {pid}")
+def read_readings(query_base, after=None, before=None, since=None, partitions=SYNC_PARTITIONS):
+    """Stream readings with after < timestamp < before (or since <= timestamp).
 
-            new_query = query_base
-            if newest_ts:
-                new_query = new_query.where("timestamp", ">", newest_ts)
+    With more than one partition the matching time range is split into shards that
+    are read concurrently, since a single query is limited to one gRPC stream.
+    """
+    query = filter_by_timestamp(query_base, after=after, before=before, since=since)
 
-            print(f"Fetching new records for {pid}...")
-            process_and_batch_save(new_query.stream(), parser, pid)
+    if partitions <= 1:
+        return query.stream()
 
-            if oldest_ts:
-                print(f"Checking for older history for {pid} (before {oldest_ts})...")
-                hist_query = query_base.where("timestamp", "<", oldest_ts) \
-                    .order_by("timestamp", direction=firestore.Query.DESCENDING)
-                process_and_batch_save(hist_query.stream(), parser, pid)
+    oldest, newest = get_timestamp_bounds(query)
+    if oldest is None:
+        return iter(())
+    if not isinstance(oldest, datetime) or not isinstance(newest, datetime) or oldest == newest:
+        return query.stream()
+
+    return stream_partitioned(query_base, oldest, newest, partitions)
 
-        sync_status["state"] = "success"
-    except Exception as e:
-        sync_status["state"] = "failed"
-        sync_status["error"] = str(e)
-        print(f"Synchronization failed: {e}")
-    finally:
-        print("Synchronization process completed.")
 
+def get_timestamp_bounds(query):
+    """Return the oldest and newest timestamp matched by the query, or (None, None) if it is empty."""
+    with span("firestore.timestamp_bounds"):
+        first = next(iter(query.order_by("timestamp").limit(1).stream()), None)
+        if first is None:
+            return None, None
 
-def process_and_batch_save(docs, parser, project_id):
+        last = next(iter(query.order_by("timestamp", direction=firestore.Query.DESCENDING).limit(1).stream()), None)
+    last = last or first
+    return first.to_dict().get("timestamp"), last.to_dict().get("timestamp")
+
+
+def split_time_range(start, end, partitions):
+    """Split [start, end] into `partitions` contiguous (lower, upper) ranges of equal length."""
+    if partitions <= 1 or end <= start:
+        return [(start, end)]
+
+    step = (end - start) / partitions
+    bounds = [start + step * i for i in range(partitions)] + [end]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def stream_partitioned(query_base, start, end, partitions=SYNC_PARTITIONS):
+    """Read start <= timestamp <= end in concurrent time shards and yield documents as they arrive."""
+    ranges = split_time_range(start, end, partitions)
+    queries = []
+    for i, (lower, upper) in enumerate(ranges):
+        upper_op = "<=" if i == len(ranges) - 1 else "<"
+        queries.append(
+            query_base.where(filter=FieldFilter("timestamp", ">=", lower))
+            .where(filter=FieldFilter("timestamp", upper_op, upper))
+        )
+
+    print(f"Reading {len(queries)} partitions between {start} and {end}...")
+
+    out = queue.Queue(maxsize=PARTITION_QUEUE_SIZE)
+    stop = threading.Event()
+    parent = current_span()
+
+    with ThreadPoolExecutor(max_workers=len(queries), thread_name_prefix="firestore-shard") as pool:
+        for i, query in enumerate(queries):
+            pool.submit(_read_shard, query, out, stop, parent, i)
+
+        remaining = len(queries)
+        try:
+            while remaining:
+                item = out.get()
+                if item is _SHARD_DONE:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stop.set()
+
+
+def _read_shard(query, out, stop, parent=None, shard=0):
+    with span("firestore.shard", parent=parent, shard=shard) as shard_span:
+        docs = 0
+        try:
+            for doc in query.stream():
+                docs += 1
+                if not _put_until_stopped(out, doc, stop):
+                    return
+            _put_until_stopped(out, _SHARD_DONE, stop)
+        except Exception as e:
+            _put_until_stopped(out, e, stop)
+        finally:
+            if shard_span:
+                shard_span.set(docs=docs)
+
+
+def _put_until_stopped(out, item, stop) -> bool:
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def process_and_batch_save(docs, parser, project_id, progress=None, source="history"):
     current_chunk = []
     total_processed = 0
+    docs_read = 0
+    started = time.monotonic()
+    batch = _BatchTimer()
 
-    doc_list = list(docs)
-
-    for doc in doc_list:
+    for doc in docs:
         raw_data = doc.to_dict()
+        docs_read += 1
+        FIRESTORE_READS.inc(project=project_id, source=source)
+        parse_started = time.perf_counter()
         rows = parser.process_raw_sensor_data(raw_data)
+        batch.add_doc(time.perf_counter() - parse_started)
 
         if rows:
             for row in rows:
                 row["project_id"] = project_id
             current_chunk.extend(rows)
 
+        if progress:
+            progress.add_docs()
+
         if len(current_chunk) >= 5000:
-            save_now(current_chunk)
+            if progress:
+                progress.check_cancelled()
+            batch.save(current_chunk)
             total_processed += len(current_chunk)
+            if progress:
+                progress.add_rows(len(current_chunk))
             current_chunk = []
 
     if current_chunk:
-        save_now(current_chunk)
+        batch.save(current_chunk)
         total_processed += len(current_chunk)
+        if progress:
+            progress.add_rows(len(current_chunk))
+
+    elapsed = time.monotonic() - started
+    if docs_read and elapsed > 0:
+        SYNC_DOCS_PER_SECOND.set(docs_read / elapsed, project=project_id, source=source)
 
     if total_processed > 0:
         print(f"Successfully synced {total_processed} rows for project {project_id}")
 
 
+class _BatchTimer:
+    """Splits the time taken to fill a batch into Firestore reading and parsing for the trace."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.docs = 0
+        self.parse_seconds = 0.0
+
+    def add_doc(self, parse_seconds: float):
+        self.docs += 1
+        self.parse_seconds += parse_seconds
+
+    def save(self, rows):
+        filled = time.perf_counter() - self.started
+        with span("sync.batch", docs=self.docs, rows=len(rows),
+                  firestore_ms=round((filled - self.parse_seconds) * 1000, 3),
+                  parse_ms=round(self.parse_seconds * 1000, 3)):
+            save_now(rows)
+        self.reset()
+
+
 def save_now(rows_to_save):
     print(f"Sorting and saving {len(rows_to_save)} rows...")
     rows_to_save.sort(key=lambda x: x['timestamp'])
@@ -117,3 +321,56 @@ def save_now(rows_to_save):
     for i in range(0, len(rows_to_save), 5000):
         batch = rows_to_save[i:i + 5000]
         insert_sensor_rows(batch)
+
+
+def _parse_cli_datetime(value: str) -> datetime:
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _split_list(value: str) -> list[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.history_to_timescale",
+        description="Synchronize Firestore readings into TimescaleDB outside the API process.",
+    )
+    parser.add_argument("--projects", type=_split_list, help="Comma separated project ids (default: all)")
+    parser.add_argument("--sensors", type=_split_list, help="Comma separated sensor ids (default: all)")
+    parser.add_argument("--from", dest="start", type=_parse_cli_datetime,
+                        help="Re-sync readings from this ISO timestamp (UTC if no offset)")
+    parser.add_argument("--to", dest="end", type=_parse_cli_datetime,
+                        help="Re-sync readings before this ISO timestamp (UTC if no offset)")
+    parser.add_argument("--workers", type=int, default=SYNC_PARTITIONS,
+                        help="Concurrent Firestore read shards per query")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="Run under cProfile and write the stats to PATH (read with pstats or snakeviz)")
+    args = parser.parse_args(argv)
+    if args.start and args.end and args.start >= args.end:
+        parser.error("--from must be before --to")
+
+    job, running = create_sync_job("history", args.projects, {
+        "sensor_ids": args.sensors, "start": args.start, "end": args.end, "workers": args.workers,
+    })
+    if job is None:
+        print(f"History synchronization already running (job {running['job_id']})")
+        return 1
+
+    print(f"Starting history sync job {job['job_id']}")
+    sync_args = dict(project_ids=args.projects, sensor_ids=args.sensors, start=args.start, end=args.end,
+                     workers=args.workers)
+    if args.profile:
+        profiler, _ = profile_call(sync_firestore_to_timescale, job["job_id"], **sync_args)
+        profiler.dump_stats(args.profile)
+        print(f"Profile written to {args.profile}")
+    else:
+        sync_firestore_to_timescale(job["job_id"], **sync_args)
+
+    finished = get_sync_job(job["job_id"])
+    return 0 if finished and finished["state"] == "success" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import hashlib
+import heapq
+import hmac
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from fastapi import HTTPException, Request, status
+
+from src.utils.metrics import INGEST_AUTH_FAILURES
+from src.utils.tracing import span
+
+# Shared secrets of machine callers as JSON: {"<source>": {"<key id>": "<secret>", ...}, ...}.
+# A source may have several keys at once, which is how a key is rotated: add the new key, move
+# the caller over, then remove the old one
+INGEST_KEYS = os.getenv("INGEST_KEYS", "")
+# Same JSON in a file (e.g. a Docker secret); takes precedence over INGEST_KEYS
+INGEST_KEYS_FILE = os.getenv("INGEST_KEYS_FILE", "")
+# Signatures older or further in the future than this are rejected
+INGEST_MAX_SKEW_SECONDS = int(os.getenv("INGEST_MAX_SKEW_SECONDS", "300"))
+# Signatures kept to reject replays of a captured request; when it is full of signatures whose
+# timestamps are still accepted, signed ingestion answers 503 instead of forgetting one
+INGEST_REPLAY_CACHE_SIZE = int(os.getenv("INGEST_REPLAY_CACHE_SIZE", "100000"))
+
+SOURCE_HEADER = "x-ingest-source"
+KEY_ID_HEADER = "x-ingest-key-id"
+TIMESTAMP_HEADER = "x-ingest-timestamp"
+SIGNATURE_HEADER = "x-ingest-signature"
+
+
+def sign(secret: str | bytes, timestamp: str, body: bytes) -> str:
+    """Hex HMAC-SHA256 of "<timestamp>." followed by the raw request body."""
+    if isinstance(secret, str):
+        secret = secret.encode()
+    return hmac.new(secret, timestamp.encode() + b"." + body, hashlib.sha256).hexdigest()
+
+
+class IngestKeyTable:
+    """In-memory (source, key id) -> secret table. Lookups are plain dict reads; replace() builds
+    a new table and swaps it in with one assignment, so readers never see a half-loaded table."""
+
+    def __init__(self, keys: Optional[dict] = None):
+        self._keys: dict[tuple[str, str], bytes] = {}
+        self.replace(keys or {})
+
+    def replace(self, keys: dict):
+        table = {}
+        for source, source_keys in keys.items():
+            if not isinstance(source_keys, dict):
+                raise ValueError(f"Keys of ingest source {source} must be an object of key id to secret")
+            for key_id, secret in source_keys.items():
+                if not secret:
+                    raise ValueError(f"Empty secret for ingest key {source}/{key_id}")
+                table[(str(source), str(key_id))] = str(secret).encode()
+        self._keys = table
+
+    def secret(self, source: str, key_id: str) -> Optional[bytes]:
+        return self._keys.get((source, key_id))
+
+    def key_ids(self) -> dict[str, list[str]]:
+        """Configured key ids per source, without the secrets."""
+        result: dict[str, list[str]] = {}
+        for source, key_id in sorted(self._keys):
+            result.setdefault(source, []).append(key_id)
+        return result
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+def load_ingest_keys() -> dict:
+    if INGEST_KEYS_FILE:
+        with open(INGEST_KEYS_FILE) as f:
+            return json.load(f)
+    return json.loads(INGEST_KEYS) if INGEST_KEYS else {}
+
+
+def reload_ingest_keys() -> int:
+    """Re-read the key table from INGEST_KEYS_FILE / INGEST_KEYS; returns the number of keys."""
+    INGEST_KEY_TABLE.replace(load_ingest_keys())
+    return len(INGEST_KEY_TABLE)
+
+
+INGEST_KEY_TABLE = IngestKeyTable()
+try:
+    reload_ingest_keys()
+except (OSError, ValueError) as e:
+    print(f"Error loading ingest keys, signed ingestion is disabled: {e}")
+
+class SeenSignatures:
+    """Accepted signatures, each kept until its timestamp falls out of the skew window.
+
+    Unlike an LRU cache, a live entry is never evicted to make room: an evicted signature could be
+    replayed while its timestamp is still accepted. add() reports a full table instead.
+    """
+
+    def __init__(self, maxsize: int = INGEST_REPLAY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._expiry: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def add(self, signature: str, expires_at: float) -> Optional[str]:
+        """Record a signature; returns None, "replay" when it was seen before or "full"."""
+        with self._lock:
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, expired = heapq.heappop(self._heap)
+                self._expiry.pop(expired, None)
+            if signature in self._expiry:
+                return "replay"
+            if len(self._expiry) >= self.maxsize:
+                return "full"
+            self._expiry[signature] = expires_at
+            heapq.heappush(self._heap, (expires_at, signature))
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._expiry.clear()
+            self._heap.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._expiry)
+
+
+seen_signatures = SeenSignatures()
+
+
+def _reject(source: Optional[str], reason: str, detail: str):
+    # Only configured sources become label values; the header is caller-controlled
+    INGEST_AUTH_FAILURES.inc(source=source or "unknown", reason=reason)
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
+
+async def verify_ingest_signature(request: Request) -> str:
+    """Authenticate a signed ingest request and return its source.
+
+    Callers send X-Ingest-Source, X-Ingest-Key-Id, X-Ingest-Timestamp (Unix seconds) and
+    X-Ingest-Signature: the hex HMAC-SHA256 of "<timestamp>.<body>" with the key's secret.
+    """
+    with span("auth", scheme="hmac"):
+        headers = request.headers
+        source = headers.get(SOURCE_HEADER)
+        key_id = headers.get(KEY_ID_HEADER)
+        timestamp = headers.get(TIMESTAMP_HEADER)
+        signature = headers.get(SIGNATURE_HEADER, "").lower().removeprefix("sha256=")
+        if not (source and key_id and timestamp and signature):
+            _reject(None, "missing", "Missing ingest signature headers")
+
+        secret = INGEST_KEY_TABLE.secret(source, key_id)
+        if secret is None:
+            _reject(None, "unknown_key", "Unknown ingest source or key")
+
+        try:
+            skew = abs(time.time() - int(timestamp))
+        except ValueError:
+            skew = None
+        if skew is None or skew > INGEST_MAX_SKEW_SECONDS:
+            _reject(source, "timestamp", "Ingest timestamp outside the allowed window")
+
+        body = await request.body()
+        if not hmac.compare_digest(sign(secret, timestamp, body), signature):
+            _reject(source, "signature", "Invalid ingest signature")
+
+        seen = seen_signatures.add(signature, int(timestamp) + INGEST_MAX_SKEW_SECONDS)
+        if seen == "replay":
+            _reject(source, "replay", "Ingest signature already used")
+        if seen == "full":
+            INGEST_AUTH_FAILURES.inc(source=source, reason="replay_cache_full")
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Too many signed requests, retry later")
+        return source
@@ -0,0 +1,164 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Iterable, Optional
+
+# Readings kept per sensor for replay to new subscribers
+LIVE_BUFFER_SIZE = int(os.getenv("LIVE_BUFFER_SIZE", "500"))
+# Sensors kept in memory; the least recently updated ones are dropped first
+LIVE_BUFFER_MAX_SENSORS = int(os.getenv("LIVE_BUFFER_MAX_SENSORS", "10000"))
+# Undelivered events per subscriber before it is disconnected as too slow
+LIVE_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("LIVE_SUBSCRIBER_QUEUE_SIZE", "1000"))
+LIVE_MAX_SUBSCRIBERS = int(os.getenv("LIVE_MAX_SUBSCRIBERS", "200"))
+
+
+class Subscriber:
+    """Receives the readings published after it subscribed, filtered by project and sensor."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, project_id: Optional[str] = None,
+                 sensor_ids: Optional[set[str]] = None):
+        self.loop = loop
+        self.project_id = project_id
+        self.sensor_ids = sensor_ids
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=LIVE_SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def wants(self, event: dict) -> bool:
+        if self.project_id and event["project_id"] != self.project_id:
+            return False
+        return not self.sensor_ids or event["sensor_id"] in self.sensor_ids
+
+    def _put(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        """Next event, or None when nothing arrived within timeout."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LiveBuffer:
+    """Ring buffer of the most recent readings of each sensor, fanned out to live subscribers.
+
+    Readings are grouped per (sensor, timestamp) into one event with a process-wide increasing
+    id, so a client can resume with Last-Event-ID. Publishing is safe from any thread.
+    """
+
+    def __init__(self, size: int = LIVE_BUFFER_SIZE, max_sensors: int = LIVE_BUFFER_MAX_SENSORS):
+        self.size = size
+        self.max_sensors = max_sensors
+        self._sensors: OrderedDict[str, deque] = OrderedDict()
+        self._subscribers: set[Subscriber] = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def publish(self, rows: Iterable[dict]) -> int:
+        """Add normalized sensor_data rows. Returns the number of events created."""
+        readings: dict[tuple, dict] = {}
+        for row in rows:
+            key = (row["sensor_id"], row["timestamp"])
+            event = readings.get(key)
+            if event is None:
+                event = readings[key] = {
+                    "sensor_id": row["sensor_id"],
+                    "project_id": row.get("project_id"),
+                    "timestamp": row["timestamp"],
+                    "metrics": {},
+                }
+            event["metrics"][row["metric_name"]] = row["metric_value"]
+
+        events = sorted(readings.values(), key=lambda e: (e["timestamp"], e["sensor_id"]))
+        with self._lock:
+            received_at = time.time()
+            for event in events:
+                event["id"] = next(self._ids)
+                event["received_at"] = received_at
+                buffer = self._sensors.get(event["sensor_id"])
+                if buffer is None:
+                    buffer = self._sensors[event["sensor_id"]] = deque(maxlen=self.size)
+                    if len(self._sensors) > self.max_sensors:
+                        self._sensors.popitem(last=False)
+                else:
+                    self._sensors.move_to_end(event["sensor_id"])
+                buffer.append(event)
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            for event in events:
+                if subscriber.wants(event):
+                    subscriber.loop.call_soon_threadsafe(subscriber._put, event)
+        return len(events)
+
+    def replay(self, project_id: Optional[str] = None, sensor_ids: Optional[set[str]] = None,
+               after_id: Optional[int] = None, since: Optional[float] = None) -> list[dict]:
+        """Buffered events matching the filter, oldest first. after_id wins over since."""
+        with self._lock:
+            if sensor_ids:
+                buffers = [self._sensors[s] for s in sensor_ids if s in self._sensors]
+            else:
+                buffers = list(self._sensors.values())
+            events = [event for buffer in buffers for event in buffer]
+
+        if after_id is not None:
+            events = [e for e in events if e["id"] > after_id]
+        elif since is not None:
+            events = [e for e in events if e["received_at"] >= since]
+        if project_id:
+            events = [e for e in events if e["project_id"] == project_id]
+        return sorted(events, key=lambda e: e["id"])
+
+    def subscribe(self, project_id: Optional[str] = None,
+                  sensor_ids: Optional[set[str]] = None) -> Optional[Subscriber]:
+        """Register a subscriber on the running event loop, or None when the limit is reached."""
+        subscriber = Subscriber(asyncio.get_running_loop(), project_id, sensor_ids)
+        with self._lock:
+            if len(self._subscribers) >= LIVE_MAX_SUBSCRIBERS:
+                return None
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sensors": len(self._sensors),
+                "events": sum(len(buffer) for buffer in self._sensors.values()),
+                "subscribers": len(self._subscribers),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._sensors.clear()
+
+
+LIVE_BUFFER = LiveBuffer()
+
+
+def publish_live_rows(rows: list[dict]):
+    """Feed freshly ingested rows to live subscribers; never fails the ingest itself."""
+    try:
+        LIVE_BUFFER.publish(rows)
+    except Exception as e:
+        print(f"Error publishing live readings: {e}")
+
+
+def event_payload(event: dict) -> dict:
+    timestamp = event["timestamp"]
+    return {
+        "sensor_id": event["sensor_id"],
+        "project_id": event["project_id"],
+        "timestamp": timestamp.isoformat() if isinstance(timestamp, datetime) else timestamp,
+        "metrics": event["metrics"],
+    }
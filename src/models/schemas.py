@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, Dict
+from datetime import datetime
+from typing import Optional, Dict, List
 
 
 class SensorMetadataInput(BaseModel):
@@ -35,6 +36,14 @@ class SensorMetadataInput(BaseModel):
     )
 
 
+class BulkSensorOnboardingRequest(BaseModel):
+    """Sensors to onboard at once, e.g. when a new site goes live"""
+    sensors: List[SensorMetadataInput] = Field(..., min_length=1, max_length=1000)
+    max_concurrent_backfills: Optional[int] = Field(
+        None, ge=1, le=32, description="Backfills of this request running at the same time, at most BACKFILL_MAX_JOBS"
+    )
+
+
 class WebhookData(BaseModel):
     """Flexible model for incoming webhook sensor data"""
     model_config = ConfigDict(
@@ -51,3 +60,24 @@ class WebhookData(BaseModel):
     )
 
     project_id: str = Field(..., description="What project the sensor belongs to")
+
+
+class HistorySyncRequest(BaseModel):
+    """Optional scope for a history synchronization run"""
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "project_ids": ["myyrmaki-test"],
+                "sensor_ids": ["C6:31:F5:..."],
+                "start": "2025-12-12T00:00:00Z",
+                "end": "2025-12-13T00:00:00Z",
+                "workers": 8
+            }
+        }
+    )
+
+    project_ids: Optional[List[str]] = Field(None, description="Projects to sync, default all discovered projects")
+    sensor_ids: Optional[List[str]] = Field(None, description="Sensors to sync, default all sensors")
+    start: Optional[datetime] = Field(None, description="Re-sync readings from this time (inclusive)")
+    end: Optional[datetime] = Field(None, description="Re-sync readings before this time (exclusive)")
+    workers: Optional[int] = Field(None, ge=1, le=64, description="Concurrent Firestore read shards per query")
@@ -1,24 +1,51 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
 from src.errors import (
     http_exception_handler,
     unhandled_exception_handler,
 )
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
+from src.auth import start_signing_key_refresher
 from src.db import init_db
-from src.routers import sensors, webhook, history
+from src.firestore_client import WARMUP_ENABLED, start_firestore_warm_up, firestore_health
+from src.firestore_tail import TAIL_ENABLED, start_firestore_tail
+from src.sensor_config import CONFIG_CACHE_WARMUP, warm_sensor_config_cache
+from src.sensor_discovery import start_discovery_refresher
+from src.sensor_mappings import start_mapping_refresher
+from src.routers import sensors, webhook, history, export, live, admin
+from src.utils.metrics import REGISTRY, CONTENT_TYPE
+from src.utils.tracing import TracingMiddleware
+import hmac
 import os
 
+# When set, /metrics requires "Authorization: Bearer <token>" (e.g. Prometheus bearer_token)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
     print("Database initialized")
+    if WARMUP_ENABLED or CONFIG_CACHE_WARMUP:
+        start_firestore_warm_up(after=_warm_caches if CONFIG_CACHE_WARMUP else None)
+    tail = start_firestore_tail() if TAIL_ENABLED else None
+    discovery = start_discovery_refresher()
+    mappings = start_mapping_refresher()
+    signing_keys = start_signing_key_refresher()
     yield
+    if tail:
+        tail.stop()
+    for refresher in (discovery, mappings, signing_keys):
+        if refresher:
+            refresher.stop()
     print("Application shutting down")
 
 
+def _warm_caches():
+    print(f"Cached {warm_sensor_config_cache()} sensor configs")
+
+
 app = FastAPI(
     title="Normalizer-API",
     description="API for normalizing and storing sensor data",
@@ -42,6 +69,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(TracingMiddleware)
+
 app.state.trust_proxy = True
 
 
@@ -52,10 +81,35 @@ async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/health/ready", tags=["health"])
+async def readiness_check():
+    """Check if the Firestore client has been warmed up and is usable"""
+    firestore = firestore_health()
+    # Without a warm-up the client is created by the first request that needs it
+    if not WARMUP_ENABLED and firestore["checked_at"] is None:
+        return {"status": "ok", "firestore": firestore}
+    if not firestore["ready"]:
+        raise HTTPException(status_code=503, detail=f"Firestore not ready: {firestore['error'] or 'warming up'}")
+    return {"status": "ok", "firestore": firestore}
+
+
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+async def metrics(request: Request):
+    """Prometheus text exposition of ingestion, database and sync metrics"""
+    if METRICS_TOKEN:
+        supplied = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(supplied, METRICS_TOKEN):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 # Include routers
 app.include_router(sensors.router)
 app.include_router(webhook.router)
 app.include_router(history.router)
+app.include_router(export.router)
+app.include_router(live.router)
+app.include_router(admin.router)
 
 
 
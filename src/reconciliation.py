@@ -0,0 +1,140 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional
+
+from google.cloud.firestore_v1 import FieldFilter
+
+from src.db import (
+    get_daily_reading_counts, get_oldest_timestamp_from_db, get_newest_timestamp_from_db, project_sync_lock,
+    get_reconciled_counts, record_reconciled_counts
+)
+from src.firestore_client import get_firestore_client
+from src.history_to_timescale import get_all_firestore_project_ids, estimate_document_count, process_and_batch_save
+from src.SensorDataParser import SensorDataParser
+from src.utils.sync_jobs import start_job, SyncCancelled
+from src.utils.tracing import span
+
+# Concurrent Firestore aggregation queries while counting
+RECONCILE_WORKERS = int(os.getenv("RECONCILE_WORKERS", "8"))
+
+
+def reconcile_firestore_to_timescale(job_id: Optional[str] = None, project_ids: Optional[list[str]] = None,
+                                     start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Find sensor-days missing from TimescaleDB and re-sync only those, tracked as a reconcile job."""
+    progress = start_job(job_id, job_type="reconcile")
+
+    client = get_firestore_client()
+    if not client:
+        progress.finish("failed", "Firestore client not initialized (check credentials)")
+        print("Firestore client initialization failed. Skipping reconciliation.")
+        return
+
+    try:
+        with span("reconciliation", root=True, job_id=progress.job_id):
+            for pid in project_ids or get_all_firestore_project_ids():
+                progress.check_cancelled()
+
+                with project_sync_lock(pid) as acquired:
+                    if not acquired:
+                        print(f"Project {pid} is already being synced by another job, skipping.")
+                        progress.skip_project(pid)
+                        continue
+                    with span("reconcile_project", project=pid):
+                        reconcile_project(client, pid, start, end, progress)
+
+        progress.complete()
+    except SyncCancelled:
+        progress.finish("cancelled")
+        print(f"Reconciliation job {progress.job_id} cancelled.")
+    except Exception as e:
+        progress.finish("failed", str(e))
+        print(f"Reconciliation failed: {e}")
+
+
+def reconcile_project(client, pid: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      progress=None) -> int:
+    """Re-sync the sensor-days of a project where Firestore has more readings than TimescaleDB.
+
+    Each sensor is first compared with a single count over the whole range; per-day counts are
+    only requested for sensors that differ. A re-synced day records its Firestore count, and is
+    treated as complete while that count stays the same: documents the parser rejects or that
+    share a timestamp never show up in sensor_data. Returns the number of re-synced buckets.
+    """
+    start = start or get_oldest_timestamp_from_db(pid)
+    end = end or get_newest_timestamp_from_db(pid) or datetime.now(timezone.utc)
+    if not start:
+        print(f"No synced data for {pid} yet, nothing to reconcile.")
+        return 0
+
+    days = day_range(start, end)
+    range_start, range_end = day_start(days[0]), day_start(days[-1]) + timedelta(days=1)
+
+    db_counts = get_daily_reading_counts(pid, range_start, range_end)
+    reconciled = get_reconciled_counts(pid, days[0], days[-1])
+
+    def known_count(ref, day) -> int:
+        return max(db_counts.get((_db_sensor_id(ref), day), 0), reconciled.get((ref.id, day), 0))
+
+    sensor_refs = list(client.collection("projects").document(pid).collection("sensors").list_documents())
+
+    with ThreadPoolExecutor(max_workers=RECONCILE_WORKERS) as pool:
+        totals = pool.map(lambda ref: count_readings(ref, range_start, range_end), sensor_refs)
+        mismatched = [
+            ref for ref, fs_total in zip(sensor_refs, totals)
+            if fs_total is not None and fs_total > sum(known_count(ref, day) for day in days)
+        ]
+
+        candidates = [(ref, day) for ref in mismatched for day in days]
+        day_totals = pool.map(
+            lambda item: count_readings(item[0], day_start(item[1]), day_start(item[1]) + timedelta(days=1)),
+            candidates,
+        )
+        buckets = [
+            (ref, day, fs_count) for (ref, day), fs_count in zip(candidates, day_totals)
+            if fs_count is not None and fs_count > known_count(ref, day)
+        ]
+
+    print(f"Reconciliation for {pid}: {len(mismatched)}/{len(sensor_refs)} sensors differ, "
+          f"{len(buckets)} sensor-days to re-sync")
+    if progress:
+        progress.set_project(pid, sum(fs_count for _, _, fs_count in buckets))
+
+    parser = SensorDataParser(pid)
+    for ref, day, fs_count in buckets:
+        if progress:
+            progress.check_cancelled()
+        query = _readings_between(ref, day_start(day), day_start(day) + timedelta(days=1))
+        process_and_batch_save(query.stream(), parser, pid, progress, source="reconciliation")
+        record_reconciled_counts(pid, {(ref.id, day): fs_count})
+
+    return len(buckets)
+
+
+def count_readings(sensor_ref, start: datetime, end: datetime) -> Optional[int]:
+    return estimate_document_count(_readings_between(sensor_ref, start, end))
+
+
+def day_range(start: datetime, end: datetime) -> list[date]:
+    """UTC days touched by [start, end]."""
+    first, last = _utc_date(start), _utc_date(end)
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def _utc_date(value: datetime) -> date:
+    return value.astimezone(timezone.utc).date() if value.tzinfo else value.date()
+
+
+def _readings_between(sensor_ref, start: datetime, end: datetime):
+    return sensor_ref.collection("readings") \
+        .where(filter=FieldFilter("timestamp", ">=", start)) \
+        .where(filter=FieldFilter("timestamp", "<", end))
+
+
+def _db_sensor_id(sensor_ref) -> str:
+    # SensorDataParser strips the colons from MAC-style ids
+    return sensor_ref.id.replace(":", "")
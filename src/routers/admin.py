@@ -0,0 +1,150 @@
+from typing import Optional
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+from src.dependencies import require_admin
+from src.db import create_sync_job, get_sync_job, get_engine
+from src.ingest_auth import INGEST_KEY_TABLE, reload_ingest_keys
+from src.models.schemas import HistorySyncRequest
+from src.utils import tracing
+from src.utils.profiling import PROFILE_MAX_SECONDS, ProfilerBusy, sample_stacks, collapsed, profile_history_sync, \
+    sync_profiles
+from src.utils.query_stats import QUERY_STATS, enable_query_stats, disable_query_stats, query_stats_enabled
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+QUERY_SORT_KEYS = ("total_ms", "mean_ms", "max_ms", "calls", "rows", "slow_calls")
+
+
+@router.get("/traces")
+async def get_recent_traces(
+        limit: int = Query(20, ge=1, le=200),
+        name: Optional[str] = Query(None, description="Only traces whose root span has this name"),
+        _=Depends(require_admin),
+):
+    return {"status": "success", "data": tracing.MEMORY.traces(limit, name)}
+
+
+@router.get("/traces/summary")
+async def get_trace_summary(_=Depends(require_admin)):
+    """Duration percentiles per stage over the spans kept in memory"""
+    return {"status": "success", "data": tracing.MEMORY.summary()}
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def profile_process(
+        seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+        interval_ms: float = Query(5, ge=1, le=1000, description="Time between samples"),
+        include_idle: bool = Query(False, description="Keep samples of threads blocked in waits"),
+        _=Depends(require_admin),
+):
+    """Sample every thread of this process and return collapsed stacks for flamegraph.pl or speedscope"""
+    try:
+        stacks = await run_in_threadpool(sample_stacks, seconds, interval_ms / 1000, include_idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return PlainTextResponse(collapsed(stacks), headers={"X-Profile-Samples": str(sum(stacks.values()))})
+
+
+@router.post("/profile/history-sync", status_code=status.HTTP_202_ACCEPTED)
+async def profile_history_sync_run(
+        background_tasks: BackgroundTasks,
+        params: Optional[HistorySyncRequest] = None,
+        _=Depends(require_admin),
+):
+    """Run one history sync under cProfile; the report is kept for a day"""
+    params = params or HistorySyncRequest()
+    if params.start and params.end and params.start >= params.end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    job, running = create_sync_job("history", params.project_ids, params.model_dump(exclude={"project_ids"}))
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"History synchronization already running (job {running['job_id']})",
+        )
+
+    background_tasks.add_task(
+        profile_history_sync,
+        job["job_id"],
+        project_ids=params.project_ids,
+        sensor_ids=params.sensor_ids,
+        start=params.start,
+        end=params.end,
+        workers=params.workers,
+    )
+    return {
+        "status": "accepted",
+        "message": "Profiled history synchronization started in background",
+        "job_id": job["job_id"],
+    }
+
+
+@router.get("/profile/history-sync/{job_id}")
+async def get_history_sync_profile(job_id: str, _=Depends(require_admin)):
+    profile = sync_profiles.get(job_id)
+    if profile is None:
+        job = get_sync_job(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return {"status": "success", "data": {"state": "running", "job_state": job["state"], "report": None}}
+    return {"status": "success", "data": profile}
+
+
+@router.get("/queries")
+async def get_query_stats(
+        sort: str = Query("total_ms", description="total_ms, mean_ms, max_ms, calls, rows or slow_calls"),
+        limit: int = Query(20, ge=1, le=500),
+        _=Depends(require_admin),
+):
+    """Per-statement timings collected by the engine event hooks (QUERY_STATS=true)"""
+    if sort not in QUERY_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(QUERY_SORT_KEYS)}")
+    return {
+        "status": "success",
+        "data": {
+            "enabled": query_stats_enabled(get_engine()),
+            "slow_query_ms": QUERY_STATS.slow_ms,
+            "statements": QUERY_STATS.top(sort, limit),
+        },
+    }
+
+
+@router.get("/queries/slow")
+async def get_slow_queries(_=Depends(require_admin)):
+    """Most recent statements above SLOW_QUERY_MS, newest first, with their plan when available"""
+    return {"status": "success", "data": list(reversed(QUERY_STATS.slow))}
+
+
+@router.put("/queries/enabled")
+async def set_query_stats_enabled(enabled: bool, _=Depends(require_admin)):
+    engine = get_engine()
+    if enabled:
+        enable_query_stats(engine)
+    else:
+        disable_query_stats(engine)
+    return {"status": "success", "data": {"enabled": query_stats_enabled(engine)}}
+
+
+@router.delete("/queries")
+async def reset_query_stats(_=Depends(require_admin)):
+    QUERY_STATS.reset()
+    return {"status": "success", "message": "Query statistics reset"}
+
+
+@router.get("/ingest-keys")
+async def get_ingest_keys(_=Depends(require_admin)):
+    """Key ids configured per signed-ingest source; secrets are never returned"""
+    return {"status": "success", "data": INGEST_KEY_TABLE.key_ids()}
+
+
+@router.post("/ingest-keys/reload")
+async def reload_ingest_key_table(_=Depends(require_admin)):
+    """Re-read INGEST_KEYS_FILE after a key was added or retired, without a restart"""
+    try:
+        reload_ingest_keys()
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid ingest key configuration: {e}")
+    return {"status": "success", "data": INGEST_KEY_TABLE.key_ids()}
@@ -0,0 +1,50 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from src.dependencies import get_auth_claims
+from src.db import stream_sensor_data, get_export_metric_names
+from src.utils.export import EXPORT_FORMATS, ENCODERS, LONG_COLUMNS, pivot_wide, parquet_available
+
+router = APIRouter(prefix="/api/export", tags=["export"])
+
+# Rows fetched from the server-side cursor per chunk; also the Parquet row group size
+EXPORT_CHUNK_ROWS = 50_000
+
+
+@router.get("")
+async def export_sensor_data(
+        project_id: str,
+        sensor_id: Optional[list[str]] = Query(None, description="Sensors to export, default all in the project"),
+        metric: Optional[list[str]] = Query(None, description="Metrics to export, default all"),
+        start: Optional[datetime] = Query(None, description="Range start (inclusive)"),
+        end: Optional[datetime] = Query(None, description="Range end (exclusive)"),
+        format: str = Query("csv", description="csv, ndjson or parquet"),
+        wide: bool = Query(False, description="One row per reading with a column per metric"),
+        _=Depends(get_auth_claims),
+):
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export is not available (pyarrow not installed)")
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    sensor_ids = [s.replace(":", "") for s in sensor_id] if sensor_id else None
+    chunks = stream_sensor_data(project_id, sensor_ids, start, end, metric, chunk_size=EXPORT_CHUNK_ROWS)
+
+    if wide:
+        metrics = metric or get_export_metric_names(project_id, sensor_ids, start, end)
+        columns = ["timestamp", "sensor_id", *metrics]
+        chunks = pivot_wide(chunks, metrics)
+    else:
+        columns = LONG_COLUMNS
+
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        ENCODERS[format](chunks, columns),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{project_id}_sensor_data.{extension}"'},
+    )
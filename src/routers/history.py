@@ -1,7 +1,13 @@
-from fastapi import APIRouter, BackgroundTasks, status, Depends
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, status, Depends
 from src.dependencies import get_auth_claims
+from src.models.schemas import HistorySyncRequest
+from src.db import create_sync_job, list_sync_jobs, request_sync_job_cancel
 from src.history_to_timescale import sync_firestore_to_timescale
-from src.utils.sync_status import sync_status
+from src.reconciliation import reconcile_firestore_to_timescale
+from src.utils.sync_jobs import cancel_job, describe_job, get_job_status
 
 
 router = APIRouter(prefix="/api/history", tags=["history"])
@@ -10,18 +16,94 @@ router = APIRouter(prefix="/api/history", tags=["history"])
 @router.post("", status_code=status.HTTP_202_ACCEPTED)
 async def sync_history(
     background_tasks: BackgroundTasks,
+    params: Optional[HistorySyncRequest] = None,
     _=Depends(get_auth_claims),
 ):
-    background_tasks.add_task(sync_firestore_to_timescale)
+    params = params or HistorySyncRequest()
+    if params.start and params.end and params.start >= params.end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    job, running = create_sync_job("history", params.project_ids, params.model_dump(exclude={"project_ids"}))
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"History synchronization already running (job {running['job_id']})",
+        )
+
+    background_tasks.add_task(
+        sync_firestore_to_timescale,
+        job["job_id"],
+        project_ids=params.project_ids,
+        sensor_ids=params.sensor_ids,
+        start=params.start,
+        end=params.end,
+        workers=params.workers,
+    )
     return {
         "status": "accepted",
         "message": "History synchronization started in background",
+        "job_id": job["job_id"],
+    }
+
+
+@router.post("/reconcile", status_code=status.HTTP_202_ACCEPTED)
+async def reconcile_history(
+    background_tasks: BackgroundTasks,
+    project_id: Optional[list[str]] = Query(None, description="Projects to reconcile, default all"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    _=Depends(get_auth_claims),
+):
+    job, running = create_sync_job("reconcile", project_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Reconciliation already running (job {running['job_id']})",
+        )
+
+    background_tasks.add_task(reconcile_firestore_to_timescale, job["job_id"], project_id, start, end)
+    return {
+        "status": "accepted",
+        "message": "Reconciliation started in background",
+        "job_id": job["job_id"],
     }
 
 
 @router.get("/status")
 async def get_history_sync_status(_=Depends(get_auth_claims)):
+    latest = list_sync_jobs("history", limit=1)
+    if not latest:
+        return {"state": "idle", "error": None, "job": None}
+
+    job = describe_job(latest[0])
     return {
-        "state": sync_status["state"],
-        "error": sync_status["error"],
+        "state": job["state"],
+        "error": job["error"],
+        "job": job,
     }
+
+
+@router.get("/jobs")
+async def list_history_jobs(job_type: str = "history", limit: int = 20, _=Depends(get_auth_claims)):
+    jobs = [describe_job(job) for job in list_sync_jobs(job_type, limit=limit)]
+    return {"status": "success", "data": jobs}
+
+
+@router.get("/jobs/{job_id}")
+async def get_history_job(job_id: str, _=Depends(get_auth_claims)):
+    job = get_job_status(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"status": "success", "data": job}
+
+
+@router.post("/jobs/{job_id}/cancel", status_code=status.HTTP_202_ACCEPTED)
+async def cancel_history_job(job_id: str, _=Depends(get_auth_claims)):
+    job = request_sync_job_cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["state"] not in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"Job already finished ({job['state']})")
+
+    cancel_job(job_id)
+    return {"status": "accepted", "message": f"Cancellation requested for job {job_id}"}
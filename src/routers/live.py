@@ -0,0 +1,79 @@
+import json
+import os
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from src.dependencies import get_auth_claims
+from src.live_stream import LIVE_BUFFER, event_payload
+
+router = APIRouter(prefix="/api/live", tags=["live"])
+
+# Replay window sent on connect when the client does not resume with Last-Event-ID
+LIVE_REPLAY_SECONDS = int(os.getenv("LIVE_REPLAY_SECONDS", "60"))
+# A comment line keeps proxies from closing idle streams
+LIVE_KEEPALIVE_SECONDS = float(os.getenv("LIVE_KEEPALIVE_SECONDS", "15"))
+
+
+def _format_event(event: dict) -> str:
+    return f"id: {event['id']}\nevent: reading\ndata: {json.dumps(event_payload(event))}\n\n"
+
+
+@router.get("/stream")
+async def stream_live_readings(
+        request: Request,
+        project_id: Optional[str] = None,
+        sensor_id: Optional[list[str]] = Query(None, description="Sensors to follow, default all"),
+        replay: int = Query(LIVE_REPLAY_SECONDS, ge=0, le=3600, description="Seconds of buffered readings sent first"),
+        _=Depends(get_auth_claims),
+):
+    sensor_ids = {s.replace(":", "") for s in sensor_id} if sensor_id else None
+    last_event_id = request.headers.get("last-event-id")
+    after_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+
+    subscriber = LIVE_BUFFER.subscribe(project_id, sensor_ids)
+    if subscriber is None:
+        raise HTTPException(status_code=503, detail="Too many live subscribers")
+    # Subscribing before the replay means nothing published in between is lost
+    backlog = LIVE_BUFFER.replay(project_id, sensor_ids, after_id=after_id, since=time.time() - replay)
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            sent = 0
+            for event in backlog:
+                sent = event["id"]
+                yield _format_event(event)
+            while not await request.is_disconnected():
+                if subscriber.overflowed:
+                    yield "event: overflow\ndata: {}\n\n"
+                    break
+                event = await subscriber.get(LIVE_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ": keepalive\n\n"
+                elif event["id"] > sent:
+                    yield _format_event(event)
+        finally:
+            LIVE_BUFFER.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/latest")
+async def get_latest_readings(
+        project_id: Optional[str] = None,
+        sensor_id: Optional[list[str]] = Query(None),
+        _=Depends(get_auth_claims),
+):
+    """Newest buffered reading of each sensor, for clients that poll instead of streaming."""
+    sensor_ids = {s.replace(":", "") for s in sensor_id} if sensor_id else None
+    latest = {}
+    for event in LIVE_BUFFER.replay(project_id, sensor_ids):
+        latest[event["sensor_id"]] = event_payload(event)
+    return {"status": "success", "data": list(latest.values())}
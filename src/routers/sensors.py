@@ -1,13 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse
 
 from src.dependencies import get_auth_claims, require_admin
-from src.models.schemas import SensorMetadataInput
-from src.db import insert_sensor_metadata, delete_sensor_metadata, get_all_sensor_metadata
+from src.models.schemas import SensorMetadataInput, BulkSensorOnboardingRequest
+from src.db import insert_sensor_metadata, upsert_sensor_metadata, delete_sensor_metadata, \
+    get_sensor_series, SERIES_AGGREGATIONS, get_sensors_in_bbox, cluster_sensors_in_bbox
 from src.sensor_config import update_sensor_config as update_sensor_config_fs, \
-    get_unconfigured_sensor_ids_from_firestore, trigger_backfill, get_sensor_config, delete_sensor_config
+    get_unconfigured_sensor_ids_from_firestore, start_backfill_job, get_backfill_status, get_sensor_config, \
+    delete_sensor_config, update_sensor_configs, start_backfill_jobs
+from src.sensor_discovery import get_discovery_summaries
+from src.utils.downsampling import lttb
+from src.utils.geohash import precision_for_zoom
+from src.utils.metadata_snapshot import get_metadata_snapshot, etag_matches, METADATA_FIELDS
 
 router = APIRouter(prefix="/api/sensors", tags=["sensors"])
 
+# Raw (unbucketed) series are capped; larger ranges need a bucket
+SERIES_MAX_RAW_POINTS = 200_000
+BUCKET_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# Map viewports at or beyond this zoom level list individual sensors instead of clusters
+MAP_CLUSTER_MAX_ZOOM = int(os.getenv("MAP_CLUSTER_MAX_ZOOM", "17"))
+MAP_MAX_SENSORS = int(os.getenv("MAP_MAX_SENSORS", "5000"))
+
 
 @router.post("", status_code=status.HTTP_201_CREATED)
 async def add_or_update_sensor(
@@ -35,18 +55,71 @@ async def add_or_update_sensor(
         }
         update_sensor_config_fs(sensor_id, fs_config)
 
-        moved_count = trigger_backfill(sensor_id, fs_config)
+        backfill_job = start_backfill_job(sensor_id, fs_config)
 
         return {
             "status": "success",
-            "message": f"Sensor saved and {moved_count} historical readings processed.",
+            "message": "Sensor saved, historical readings are being processed in background.",
             "data": sql_data,
+            "backfill_job_id": backfill_job["job_id"],
         }
     except Exception as e:
         print(f"Error processing sensor {sensor_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error during sensor processing")
 
 
+@router.post("/bulk", status_code=status.HTTP_201_CREATED)
+async def onboard_sensors(
+        request: BulkSensorOnboardingRequest,
+        _=Depends(require_admin),
+):
+    sensor_ids = [sensor.sensor_id for sensor in request.sensors]
+    if len(set(sensor_ids)) != len(sensor_ids):
+        raise HTTPException(status_code=400, detail="Duplicate sensor_id in request")
+
+    sql_rows = [
+        sensor.model_dump(include={"sensor_id", "project_id", "description", "latitude", "longitude"})
+        for sensor in request.sensors
+    ]
+    try:
+        upsert_sensor_metadata(sql_rows)
+    except Exception as e:
+        print(f"Error saving metadata of {len(sql_rows)} sensors: {e}")
+        raise HTTPException(status_code=500, detail="Failed to save sensor metadata")
+
+    fs_configs = {
+        sensor.sensor_id: sensor.model_dump(include={"project_id", "mapping", "ts_field"})
+        for sensor in request.sensors
+    }
+    config_errors = update_sensor_configs(fs_configs)
+
+    configured = {sensor_id: config for sensor_id, config in fs_configs.items() if not config_errors.get(sensor_id)}
+    try:
+        jobs = start_backfill_jobs(configured, request.max_concurrent_backfills)
+    except Exception as e:
+        print(f"Error starting backfills: {e}")
+        jobs = {}
+
+    results = []
+    for sensor_id in sensor_ids:
+        job = jobs.get(sensor_id)
+        error = config_errors.get(sensor_id) or (None if job else "Failed to start backfill")
+        results.append({
+            "sensor_id": sensor_id,
+            "status": "failed" if error else "accepted",
+            "backfill_job_id": job["job_id"] if job else None,
+            "error": error,
+        })
+
+    failed = sum(1 for result in results if result["status"] == "failed")
+    return {
+        "status": "success",
+        "message": f"{len(results) - failed} sensors saved, {failed} failed. "
+                   f"Historical readings are being processed in background.",
+        "data": results,
+    }
+
+
 @router.delete("/{sensor_id}")
 async def delete_sensor_endpoint(
         sensor_id: str,
@@ -82,20 +155,86 @@ async def delete_sensor_endpoint(
 
 @router.get("/metadata")
 async def get_sensor_metadata_endpoint(
+        request: Request,
+        limit: Optional[int] = Query(None, ge=1, le=10_000),
+        offset: int = Query(0, ge=0),
+        fields: Optional[str] = Query(None, description="Comma-separated subset of metadata fields"),
         _=Depends(get_auth_claims),
 ):
+    selected = None
+    if fields:
+        selected = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = sorted(set(selected) - set(METADATA_FIELDS))
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown metadata fields: {', '.join(unknown)}")
+
     try:
-        metadata = get_all_sensor_metadata()
+        snapshot = get_metadata_snapshot()
     except Exception:
         raise HTTPException(
             status_code=500,
             detail="Failed to retrieve sensor metadata",
         )
 
-    return {
+    full = limit is None and offset == 0 and selected is None
+    etag = snapshot.etag("" if full else f"{limit}:{offset}:{','.join(selected or [])}")
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if full:
+        return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+    return JSONResponse({
         "status": "success",
         "message": "Sensor metadata retrieved successfully",
-        "data": metadata,
+        "data": snapshot.page(offset, limit, selected),
+        "pagination": {"offset": offset, "limit": limit, "total": len(snapshot.rows)},
+    }, headers=headers)
+
+
+@router.get("/map")
+async def get_sensor_map(
+        min_lat: float = Query(..., ge=-90, le=90),
+        min_lon: float = Query(..., ge=-180, le=180),
+        max_lat: float = Query(..., ge=-90, le=90),
+        max_lon: float = Query(..., ge=-180, le=180, description="Smaller than min_lon when crossing the antimeridian"),
+        zoom: int = Query(MAP_CLUSTER_MAX_ZOOM, ge=0, le=24, description="Map zoom level, sets cluster size"),
+        project_id: Optional[str] = None,
+        _=Depends(get_auth_claims),
+):
+    if min_lat > max_lat:
+        raise HTTPException(status_code=400, detail="min_lat must not be greater than max_lat")
+
+    try:
+        if zoom >= MAP_CLUSTER_MAX_ZOOM:
+            sensors = get_sensors_in_bbox(min_lat, min_lon, max_lat, max_lon, project_id, limit=MAP_MAX_SENSORS + 1)
+            clusters, precision = [], None
+        else:
+            precision = precision_for_zoom(zoom)
+            cells = cluster_sensors_in_bbox(min_lat, min_lon, max_lat, max_lon, precision, project_id)
+            sensors = [
+                {"sensor_id": cell["sensor_id"], "latitude": cell["latitude"], "longitude": cell["longitude"],
+                 "project_id": cell["project_id"]}
+                for cell in cells if cell["count"] == 1
+            ]
+            clusters = [
+                {"geohash": cell["geohash"], "count": cell["count"], "latitude": cell["latitude"],
+                 "longitude": cell["longitude"]}
+                for cell in cells if cell["count"] > 1
+            ]
+    except Exception as e:
+        print(f"Error fetching sensors in bounding box: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve sensor map")
+
+    return {
+        "status": "success",
+        "data": {
+            "precision": precision,
+            "sensors": sensors[:MAP_MAX_SENSORS],
+            "clusters": clusters,
+            "truncated": len(sensors) > MAP_MAX_SENSORS,
+        },
     }
 
 
@@ -105,9 +244,82 @@ async def get_unknown_sensors(_=Depends(require_admin)):
     return {"status": "success", "data": unknown_ids}
 
 
+@router.get("/unknown/summary")
+async def get_unknown_sensor_summaries(_=Depends(require_admin)):
+    try:
+        summaries = get_discovery_summaries()
+    except Exception as e:
+        print(f"Error fetching discovery summaries: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve unknown sensor summaries")
+    return {"status": "success", "data": summaries}
+
+
+@router.get("/backfill/{job_id}")
+async def get_backfill_status_endpoint(job_id: str, _=Depends(require_admin)):
+    job = get_backfill_status(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Backfill job not found")
+    return {"status": "success", "data": job}
+
+
 @router.get("/{sensor_id}/config")
 async def get_sensor_config_endpoint(sensor_id: str, _=Depends(get_auth_claims)):
     config = get_sensor_config(sensor_id)
     if not config:
         raise HTTPException(status_code=404, detail="Configuration not found")
     return {"status": "success", "data": config}
+
+
+@router.get("/{sensor_id}/series")
+async def get_sensor_series_endpoint(
+        sensor_id: str,
+        metric: Optional[list[str]] = Query(None, description="Metrics to return, default all"),
+        start: Optional[datetime] = Query(None, description="Range start (inclusive), default 24 h before end"),
+        end: Optional[datetime] = Query(None, description="Range end (exclusive), default now"),
+        bucket: Optional[str] = Query(None, description="Bucket size, e.g. 30s, 5m, 1h, 1d. Default raw points"),
+        agg: str = Query("avg", description=f"Bucket aggregation: {', '.join(SERIES_AGGREGATIONS)}"),
+        points: Optional[int] = Query(None, ge=3, le=10_000, description="Reduce each metric to this many points (LTTB)"),
+        _=Depends(get_auth_claims),
+):
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if agg not in SERIES_AGGREGATIONS:
+        raise HTTPException(status_code=400, detail=f"agg must be one of {', '.join(SERIES_AGGREGATIONS)}")
+    bucket_seconds = _parse_bucket(bucket) if bucket else None
+
+    try:
+        series, source = get_sensor_series(
+            sensor_id.replace(":", ""), metric, start, end, bucket_seconds, agg,
+            limit=None if bucket_seconds else SERIES_MAX_RAW_POINTS + 1,
+        )
+    except Exception as e:
+        print(f"Error fetching series of {sensor_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve sensor series")
+
+    if not bucket_seconds and sum(len(values) for values in series.values()) > SERIES_MAX_RAW_POINTS:
+        raise HTTPException(status_code=400, detail="Too many points for a raw series, use a bucket")
+
+    if points:
+        series = {name: lttb(values, points) for name, values in series.items()}
+
+    return {
+        "status": "success",
+        "data": {
+            "sensor_id": sensor_id,
+            "start": start,
+            "end": end,
+            "bucket_seconds": bucket_seconds,
+            "aggregation": agg if bucket_seconds else None,
+            "source": source,
+            "series": {name: [[ts, value] for ts, value in values] for name, values in series.items()},
+        },
+    }
+
+
+def _parse_bucket(bucket: str) -> int:
+    match = re.fullmatch(r"(\d+)([smhd]?)", bucket.strip())
+    if not match or int(match.group(1)) <= 0:
+        raise HTTPException(status_code=400, detail="bucket must look like 30s, 5m, 1h or 1d")
+    return int(match.group(1)) * BUCKET_UNITS[match.group(2) or "s"]
@@ -1,39 +1,96 @@
-from fastapi import APIRouter, status, Depends, HTTPException
+from fastapi import APIRouter, Body, status, Depends, HTTPException
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
 import json
 import datetime
+import time
 
 from src.dependencies import get_auth_claims
+from src.ingest_auth import verify_ingest_signature
 from src.models.schemas import WebhookData
 from src.db import insert_sensor_rows
+from src.live_stream import publish_live_rows
+from src.utils.metrics import WEBHOOK_REQUESTS, WEBHOOK_SECONDS, project_label
+from src.utils.tracing import span
 from src.SensorDataParser import SensorDataParser
 
 router = APIRouter(tags=["webhook"])
 
+# The body is taken as a plain dict and validated in the endpoint, so validation is a stage of
+# the request trace; this keeps WebhookData as the documented request body
+WEBHOOK_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": WebhookData.model_json_schema()}},
+    }
+}
+
 
-@router.post("/api/webhook", status_code=status.HTTP_201_CREATED)
+@router.post("/api/webhook", status_code=status.HTTP_201_CREATED, openapi_extra=WEBHOOK_BODY)
 async def firestore_webhook(
-    webhook_data: WebhookData,
+    payload: dict = Body(...),
     _=Depends(get_auth_claims),
 ):
-    data = webhook_data.model_dump()
+    return store_webhook_data(validate_webhook_data(payload).model_dump())
+
+
+@router.post("/api/ingest", status_code=status.HTTP_201_CREATED, openapi_extra=WEBHOOK_BODY)
+async def signed_ingest(
+    payload: dict = Body(...),
+    _=Depends(verify_ingest_signature),
+):
+    """The webhook for machine callers (Pub/Sub forwarder, gateways), authenticated with a
+    per-source HMAC signature instead of an Auth0 token."""
+    return store_webhook_data(validate_webhook_data(payload).model_dump())
 
-    parser = SensorDataParser(data.get("project_id"))
-    sensor_rows = parser.process_raw_sensor_data(data)
 
-    if not sensor_rows:
-        raise HTTPException(
-            status_code=400,
-            detail="Message didn't contain valid sensor data",
-        )
+def validate_webhook_data(payload: dict) -> WebhookData:
+    with span("validate WebhookData"):
+        try:
+            return WebhookData.model_validate(payload)
+        except ValidationError as e:
+            # Same 422 response as a body validated by FastAPI
+            raise RequestValidationError(
+                [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+            )
+
+
+def store_webhook_data(data: dict) -> dict:
+    project = data.get("project_id")
+    started = time.perf_counter()
+    outcome = "error"
 
     try:
-        insert_sensor_rows(sensor_rows)
-        log_webhook(data, len(sensor_rows))
-    except Exception:
-        raise HTTPException(
-            status_code=500,
-            detail="Failed to insert sensor data",
-        )
+        with span("parse", project=project) as parse_span:
+            parser = SensorDataParser(project)
+            sensor_rows = parser.process_raw_sensor_data(data)
+            if parse_span:
+                parse_span.set(rows=len(sensor_rows))
+
+        if not sensor_rows:
+            outcome = "rejected"
+            raise HTTPException(
+                status_code=400,
+                detail="Message didn't contain valid sensor data",
+            )
+
+        try:
+            insert_sensor_rows(sensor_rows)
+            with span("log_webhook"):
+                log_webhook(data, len(sensor_rows))
+        except Exception:
+            raise HTTPException(
+                status_code=500,
+                detail="Failed to insert sensor data",
+            )
+        outcome = "success"
+    finally:
+        # project_id is caller-controlled, so unseen projects past the label limit count as "other"
+        label = project_label(project)
+        WEBHOOK_REQUESTS.inc(project=label, status=outcome)
+        WEBHOOK_SECONDS.observe(time.perf_counter() - started, project=label)
+
+    publish_live_rows(sensor_rows)
 
     return {
         "status": "success",
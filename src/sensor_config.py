@@ -1,112 +1,360 @@
+import copy
 import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timezone
+from typing import Optional
 from zoneinfo import ZoneInfo
-from google.cloud import firestore
+
+from src.db import create_sync_job, insert_sensor_rows, delete_unconfigured_sensor_summaries
+from src.firestore_client import require_firestore_client
+from src.SensorDataParser import SensorDataParser
+from src.sensor_mappings import SENSOR_MAPPINGS, SensorMapping
+from src.utils.cache import TTLCache
+from src.utils.metrics import FIRESTORE_READS
+from src.utils.sync_jobs import start_job, queue_job, get_job_status, SyncCancelled
 
 TIMEZONE = ZoneInfo("Europe/Helsinki")
-CLIENT = firestore.Client(project=os.getenv("GCP_PROJECT_ID"))
+
+# Moves per write batch; each move is a set and a delete and a batch holds at most 500 writes
+BACKFILL_BATCH_SIZE = min(int(os.getenv("BACKFILL_BATCH_SIZE", "250")), 250)
+BACKFILL_MAX_WORKERS = int(os.getenv("BACKFILL_MAX_WORKERS", "4"))
+BACKFILL_MAX_RETRIES = 3
+BACKFILL_RETRY_DELAY = 0.5
+
+# Backfill jobs running at the same time; further jobs wait in the queue
+BACKFILL_MAX_JOBS = int(os.getenv("BACKFILL_MAX_JOBS", "2"))
+_backfill_jobs = ThreadPoolExecutor(max_workers=BACKFILL_MAX_JOBS, thread_name_prefix="backfill-job")
+
+# Config writes per Firestore write batch (batch limit is 500)
+CONFIG_BATCH_SIZE = 500
+
+# Read-through caches; writes through this module invalidate them, the TTL bounds staleness
+# from changes made elsewhere (console, other workers)
+CONFIG_CACHE_TTL = float(os.getenv("SENSOR_CONFIG_CACHE_TTL", "300"))
+CONFIG_CACHE_SIZE = int(os.getenv("SENSOR_CONFIG_CACHE_SIZE", "2048"))
+UNCONFIGURED_CACHE_TTL = float(os.getenv("UNCONFIGURED_SENSORS_CACHE_TTL", "30"))
+CONFIG_CACHE_WARMUP = os.getenv("SENSOR_CONFIG_CACHE_WARMUP", "false").lower() == "true"
+
+_config_cache = TTLCache(maxsize=CONFIG_CACHE_SIZE, ttl=CONFIG_CACHE_TTL)
+_unconfigured_cache = TTLCache(maxsize=1, ttl=UNCONFIGURED_CACHE_TTL)
 
 
 def update_sensor_config(sensor_id: str, config: dict):
     try:
-        doc_ref = CLIENT.collection("sensor_config").document(sensor_id)
+        doc_ref = require_firestore_client().collection("sensor_config").document(sensor_id)
         doc_ref.set(config, merge=True)
+        if "mapping" in config:
+            SENSOR_MAPPINGS.set(sensor_id, config)
         return True
     except Exception as e:
         print(f"Error updating Firestore config: {e}")
         return False
+    finally:
+        # merge=True means the stored document may differ from `config`; reload on next read
+        _config_cache.invalidate(sensor_id)
+        _unconfigured_cache.clear()
+
+
+def update_sensor_configs(configs: dict[str, dict]) -> dict[str, Optional[str]]:
+    """Write many sensor configs with batched writes. Returns an error message (or None) per sensor."""
+    results = {}
+    items = list(configs.items())
+    try:
+        client = require_firestore_client()
+    except Exception as e:
+        return {sensor_id: str(e) for sensor_id, _ in items}
+
+    for chunk in _chunked(items, CONFIG_BATCH_SIZE):
+        batch = client.batch()
+        for sensor_id, config in chunk:
+            batch.set(client.collection("sensor_config").document(sensor_id), config, merge=True)
+        try:
+            batch.commit()
+            error = None
+        except Exception as e:
+            print(f"Error updating {len(chunk)} Firestore configs: {e}")
+            error = str(e)
+        for sensor_id, config in chunk:
+            results[sensor_id] = error
+            _config_cache.invalidate(sensor_id)
+            if error is None and "mapping" in config:
+                SENSOR_MAPPINGS.set(sensor_id, config)
+
+    _unconfigured_cache.clear()
+    return results
 
 
 def get_unconfigured_sensor_ids_from_firestore():
+    cached = _unconfigured_cache.get("ids")
+    if cached is not None:
+        return list(cached)
     try:
-        docs = CLIENT.collection("unconfigured_sensors").list_documents()
-        return [doc.id for doc in docs]
+        docs = require_firestore_client().collection("unconfigured_sensors").list_documents()
+        ids = [doc.id for doc in docs]
     except Exception as e:
         print(f"Error fetching unknown sensors: {e}")
         return []
+    _unconfigured_cache.set("ids", ids)
+    return list(ids)
+
+
+def start_backfill_job(sensor_id: str, config: dict) -> dict:
+    """Queue a backfill job for the sensor, or return the one already queued or running."""
+    job, running = create_sync_job("backfill", [sensor_id], {"project_id": config.get("project_id")})
+    if job is None:
+        return running
+
+    queue_job(job["job_id"])
+    _backfill_jobs.submit(run_backfill_job, job["job_id"], sensor_id, config)
+    return job
+
+
+def start_backfill_jobs(configs: dict[str, dict], max_concurrent: Optional[int] = None) -> dict[str, dict]:
+    """Queue a backfill job per sensor on the shared backfill executor, so they count against
+    BACKFILL_MAX_JOBS like single backfills. `max_concurrent` limits this batch further.
+
+    Sensors that already have an active backfill get that job back. Returns the job per sensor.
+    """
+    jobs, pending = {}, deque()
+    for sensor_id, config in configs.items():
+        job, running = create_sync_job("backfill", [sensor_id], {"project_id": config.get("project_id")})
+        jobs[sensor_id] = job or running
+        if job is not None:
+            queue_job(job["job_id"])
+            pending.append((job["job_id"], sensor_id, config))
+
+    for _ in range(min(max_concurrent or len(pending), len(pending))):
+        _submit_next_backfill(pending)
+    return jobs
+
+
+def _submit_next_backfill(pending: deque):
+    """Submit the next job of a bulk onboarding; when it is done it submits the one after it."""
+    try:
+        job_id, sensor_id, config = pending.popleft()
+    except IndexError:
+        return
+    future = _backfill_jobs.submit(run_backfill_job, job_id, sensor_id, config)
+    future.add_done_callback(lambda _: _submit_next_backfill(pending))
+
+
+def run_backfill_job(job_id: str, sensor_id: str, config: dict):
+    progress = start_job(job_id, job_type="backfill")
+    try:
+        progress.set_project(config.get("project_id"), count_unconfigured_readings(sensor_id))
+        trigger_backfill(sensor_id, config, progress)
+        # Every reading has been moved, the discovery summary no longer describes anything
+        delete_unconfigured_sensor_summaries([sensor_id])
+        progress.finish("success")
+    except SyncCancelled:
+        progress.finish("cancelled")
+    except Exception as e:
+        progress.finish("failed", str(e))
+        print(f"Backfill of {sensor_id} failed: {e}")
+    finally:
+        _unconfigured_cache.clear()
+
+
+def get_backfill_status(job_id: str):
+    job = get_job_status(job_id)
+    if not job or job["job_type"] != "backfill":
+        return None
+    job["moved"] = job["docs_read"]
+    job["remaining"] = max((job["docs_total"] or 0) - job["docs_read"], 0) if job["docs_total"] is not None else None
+    return job
 
 
-def trigger_backfill(sensor_id: str, config: dict):
+def count_unconfigured_readings(sensor_id: str):
+    try:
+        result = require_firestore_client().collection("unconfigured_sensors").document(sensor_id) \
+            .collection("readings").count().get()
+        return int(result[0][0].value)
+    except Exception as e:
+        print(f"Could not count unconfigured readings of {sensor_id}: {e}")
+        return None
+
 
+def trigger_backfill(sensor_id: str, config: dict, progress=None):
+    """Move a sensor's unconfigured readings under its project, mapped with the sensor config.
+
+    Each copy and the delete of its source are committed in the same write batch, so a reading is
+    never duplicated or lost. Batches are committed concurrently and retried on failure. After a
+    batch is committed the metrics of the sensor's mapping are written to sensor_data as well, so
+    they do not have to be read back from Firestore by the next history sync. Without a mapping
+    nothing is written to sensor_data.
+    """
     project_id = config.get("project_id")
-    mapping = config.get("mapping", {})
-    ts_field = config.get("ts_field", "ts")
+    mapping = SensorMapping(config.get("mapping") or {}, config.get("ts_field") or "ts", config.get("decoders"))
+    write_rows = bool(mapping.fields)
+    db_sensor_id = sensor_id.replace(":", "")
 
-    unknown_readings_ref = CLIENT.collection("unconfigured_sensors") \
+    client = require_firestore_client()
+    unknown_readings_ref = client.collection("unconfigured_sensors") \
         .document(sensor_id) \
         .collection("readings")
 
-    docs = unknown_readings_ref.stream()
+    target_readings_ref = client.collection("projects").document(project_id) \
+        .collection("sensors").document(sensor_id) \
+        .collection("readings")
+
+    parser = SensorDataParser(project_id)
     moved_count = 0
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=BACKFILL_MAX_WORKERS, thread_name_prefix="backfill") as pool:
+        try:
+            for chunk in _chunked(unknown_readings_ref.stream(), BACKFILL_BATCH_SIZE):
+                FIRESTORE_READS.inc(len(chunk), project=project_id, source="backfill")
+                moves = []
+                rows = []
+                for doc in chunk:
+                    final_doc_id, final_data = _build_backfill_document(doc, sensor_id, project_id, mapping, parser)
+                    moves.append((doc.reference, target_readings_ref.document(final_doc_id), final_data))
+                    if write_rows:
+                        rows.extend(parser.rows_from_metrics(final_data["measurements"], db_sensor_id,
+                                                             final_data["timestamp"]))
+
+                pending.add(pool.submit(_commit_moves, moves, rows))
+                if len(pending) >= BACKFILL_MAX_WORKERS * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    moved_count += _collect(done, progress)
+                if progress:
+                    progress.check_cancelled()
+
+            moved_count += _collect(pending, progress)
+            pending = set()
+        except Exception:
+            for future in pending:
+                future.cancel()
+            raise
+
+    return moved_count
+
+
+def _collect(futures, progress) -> int:
+    moved = rows_written = 0
+    for future in futures:
+        batch_moved, batch_rows = future.result()
+        moved += batch_moved
+        rows_written += batch_rows
+    if progress:
+        progress.add_docs(moved)
+        progress.add_rows(rows_written)
+    return moved
 
-    for doc in docs:
-        item = doc.to_dict()
-        raw_payload = item.get("raw_data", {})
-        received_at = item.get("received_at")
 
-        raw_ts = raw_payload.get(ts_field)
+def _build_backfill_document(doc, sensor_id: str, project_id: str, mapping: SensorMapping,
+                             parser: SensorDataParser):
+    item = doc.to_dict()
+    raw_payload = item.get("raw_data", {})
+    received_at = item.get("received_at")
+
+    # Same timestamp and value decoding as the webhook and the history sync
+    raw_ts = raw_payload.get(mapping.ts_field)
+    dt_utc = None
+    if raw_ts:
         try:
-            if raw_ts:
-                dt_utc = datetime.fromtimestamp(float(raw_ts), tz=timezone.utc)
-            else:
-                dt_utc = received_at if received_at else datetime.now(timezone.utc)
+            dt_utc = parser.parse_timestamp_value(raw_ts)
         except Exception as e:
             print(f"Backfill timestamp error: {e}")
-            dt_utc = received_at if received_at else datetime.now(timezone.utc)
-
-        measurements_map = {}
-        processed_keys = {ts_field, "mac", "sensor_id", "id"}
+    dt_utc = dt_utc or received_at or datetime.now(timezone.utc)
 
-        for raw_key, clean_name in mapping.items():
-            if raw_key in raw_payload:
-                measurements_map[clean_name] = raw_payload[raw_key]
-                processed_keys.add(raw_key)
+    final_data = {
+        "sensor_id": sensor_id,
+        "project_id": project_id,
+        "timestamp": dt_utc,
+        "measurements": mapping.measurements(raw_payload),
+        "extra": mapping.extra(raw_payload),
+        "backfilled": True,
+        "original_received_at": received_at
+    }
 
-        extra = {k: v for k, v in raw_payload.items() if k not in processed_keys}
+    dt_local = dt_utc.astimezone(TIMEZONE)
 
-        final_data = {
-            "sensor_id": sensor_id,
-            "project_id": project_id,
-            "timestamp": dt_utc,
-            "measurements": measurements_map,
-            "extra": extra,
-            "backfilled": True,
-            "original_received_at": received_at
-        }
+    base_id = dt_local.strftime("%Y-%m-%d-%H:%M:%S")
+    return f"{base_id}_{doc.id[:5]}", final_data
 
-        dt_local = dt_utc.astimezone(TIMEZONE)
 
-        base_id = dt_local.strftime("%Y-%m-%d-%H:%M:%S")
-        final_doc_id = f"{base_id}_{doc.id[:5]}"
+def _commit_moves(moves, rows) -> tuple[int, int]:
+    """Insert the normalized rows, then write the copies and delete the sources in one atomic batch,
+    retrying with backoff. Returns (readings moved, rows written)."""
+    # Rows go in first so a failed insert leaves the sources in place; the insert ignores
+    # duplicates, so a retried backfill after a failed batch is harmless
+    if rows:
+        rows.sort(key=lambda x: x["timestamp"])
+        insert_sensor_rows(rows)
 
-        target_ref = CLIENT.collection("projects").document(project_id) \
-            .collection("sensors").document(sensor_id) \
-            .collection("readings").document(final_doc_id)
+    for attempt in range(1, BACKFILL_MAX_RETRIES + 1):
+        batch = require_firestore_client().batch()
+        for source_ref, target_ref, data in moves:
+            batch.set(target_ref, data)
+            batch.delete(source_ref)
+        try:
+            batch.commit()
+            break
+        except Exception as e:
+            if attempt == BACKFILL_MAX_RETRIES:
+                raise
+            print(f"Backfill batch of {len(moves)} failed (attempt {attempt}): {e}")
+            time.sleep(BACKFILL_RETRY_DELAY * 2 ** (attempt - 1))
 
-        target_ref.set(final_data)
+    return len(moves), len(rows)
 
-        doc.reference.delete()
-        moved_count += 1
 
-    return moved_count
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 
 def get_sensor_config(sensor_id: str):
     try:
-        doc = CLIENT.collection("sensor_config").document(sensor_id).get()
-        if doc.exists:
-            return doc.to_dict()
-        return None
+        # Missing configs are cached too, the unconfigured sensor listing asks for them repeatedly;
+        # failed reads raise and are not cached
+        config = _config_cache.get_or_load(sensor_id, lambda: _load_sensor_config(sensor_id))
     except Exception as e:
         print(f"Error fetching config: {e}")
         return None
+    return _copy(config)
+
+
+def _load_sensor_config(sensor_id: str):
+    doc = require_firestore_client().collection("sensor_config").document(sensor_id).get()
+    return doc.to_dict() if doc.exists else None
 
 
 def delete_sensor_config(sensor_id: str):
     try:
-        doc_ref = CLIENT.collection("sensor_config").document(sensor_id)
+        doc_ref = require_firestore_client().collection("sensor_config").document(sensor_id)
         doc_ref.delete()
         return True
     except Exception as e:
         print(f"Error deleting Firestore config: {e}")
         return False
+    finally:
+        _config_cache.invalidate(sensor_id)
+        SENSOR_MAPPINGS.remove(sensor_id)
+
+
+def warm_sensor_config_cache() -> int:
+    """Load every sensor config with a single collection read. Returns the number of configs cached."""
+    try:
+        docs = list(require_firestore_client().collection("sensor_config").stream())
+    except Exception as e:
+        print(f"Error warming sensor config cache: {e}")
+        return 0
+    for doc in docs:
+        _config_cache.set(doc.id, doc.to_dict())
+    return len(docs)
+
+
+def _copy(config):
+    # Callers mutate the returned dict (e.g. the routers), keep the cached one intact
+    return copy.deepcopy(config)
@@ -0,0 +1,167 @@
+import os
+import random
+import threading
+from typing import Optional
+
+from google.cloud.firestore_v1 import FieldFilter
+
+from src.db import (
+    get_unconfigured_sensor_summaries, get_unconfigured_sensor_summary, save_unconfigured_sensor_summary,
+    delete_unconfigured_sensor_summaries, advisory_lock
+)
+from src.firestore_client import get_firestore_client
+from src.sensor_config import get_unconfigured_sensor_ids_from_firestore
+
+# Payloads kept per sensor as examples for the admin configuring it
+SUMMARY_SAMPLE_SIZE = int(os.getenv("DISCOVERY_SAMPLE_SIZE", "5"))
+
+# Background refresh interval of the summaries, 0 disables the refresher
+DISCOVERY_REFRESH_SECONDS = float(os.getenv("DISCOVERY_REFRESH_SECONDS", "300"))
+
+# Summaries are saved after every chunk, so an interrupted first scan resumes where it stopped
+DISCOVERY_CHUNK_SIZE = 1000
+
+DISCOVERY_LOCK_KEY = "sensor-discovery"
+
+
+def empty_summary(sensor_id: str) -> dict:
+    return {
+        "sensor_id": sensor_id,
+        "reading_count": 0,
+        "first_seen": None,
+        "last_seen": None,
+        "raw_keys": [],
+        "sample": [],
+        "watermark": None,
+    }
+
+
+def merge_readings(summary: dict, readings: list[dict], rng=random) -> dict:
+    """Fold unconfigured readings ({"raw_data", "received_at"}) into a summary.
+
+    The sample is a reservoir sample (Algorithm R) over every reading counted so far, so it
+    stays uniform without re-reading older readings.
+    """
+    keys = set(summary["raw_keys"])
+    sample = list(summary["sample"])
+    count = summary["reading_count"]
+    first_seen, last_seen, watermark = summary["first_seen"], summary["last_seen"], summary["watermark"]
+
+    for reading in readings:
+        payload = reading.get("raw_data") or {}
+        received_at = reading.get("received_at")
+        count += 1
+        keys.update(payload.keys())
+
+        if len(sample) < SUMMARY_SAMPLE_SIZE:
+            sample.append(payload)
+        else:
+            slot = rng.randrange(count)
+            if slot < SUMMARY_SAMPLE_SIZE:
+                sample[slot] = payload
+
+        if received_at is not None:
+            first_seen = received_at if first_seen is None else min(first_seen, received_at)
+            last_seen = received_at if last_seen is None else max(last_seen, received_at)
+            watermark = received_at if watermark is None else max(watermark, received_at)
+
+    return {
+        **summary,
+        "reading_count": count,
+        "first_seen": first_seen,
+        "last_seen": last_seen,
+        "raw_keys": sorted(keys),
+        "sample": sample,
+        "watermark": watermark,
+    }
+
+
+def refresh_sensor_summary(client, sensor_id: str) -> dict:
+    """Fold the readings received since the summary's watermark into it.
+
+    Only the first refresh of a sensor reads its whole subcollection. Readings without
+    `received_at` cannot be ordered and are not counted.
+    """
+    summary = get_unconfigured_sensor_summary(sensor_id) or empty_summary(sensor_id)
+
+    query = client.collection("unconfigured_sensors").document(sensor_id).collection("readings")
+    if summary["watermark"] is not None:
+        query = query.where(filter=FieldFilter("received_at", ">", summary["watermark"]))
+    query = query.order_by("received_at")
+
+    chunk = []
+    for doc in query.stream():
+        chunk.append(doc.to_dict())
+        if len(chunk) >= DISCOVERY_CHUNK_SIZE:
+            summary = merge_readings(summary, chunk)
+            save_unconfigured_sensor_summary(summary)
+            chunk = []
+
+    if chunk or summary["watermark"] is None:
+        summary = merge_readings(summary, chunk)
+        save_unconfigured_sensor_summary(summary)
+    return summary
+
+
+def refresh_discovery_summaries(client=None) -> int:
+    """Refresh every unconfigured sensor's summary and drop the ones no longer listed."""
+    client = client or get_firestore_client()
+    if not client:
+        print("Firestore client not initialized, skipping discovery refresh.")
+        return 0
+
+    sensor_ids = get_unconfigured_sensor_ids_from_firestore()
+    refreshed = 0
+    for sensor_id in sensor_ids:
+        try:
+            refresh_sensor_summary(client, sensor_id)
+            refreshed += 1
+        except Exception as e:
+            print(f"Failed to refresh discovery summary of {sensor_id}: {e}")
+
+    listed = set(sensor_ids)
+    gone = [s["sensor_id"] for s in get_unconfigured_sensor_summaries() if s["sensor_id"] not in listed]
+    delete_unconfigured_sensor_summaries(gone)
+    return refreshed
+
+
+def get_discovery_summaries() -> list[dict]:
+    """Summaries of the currently unconfigured sensors; sensors not summarized yet have empty ones."""
+    sensor_ids = get_unconfigured_sensor_ids_from_firestore()
+    summaries = get_unconfigured_sensor_summaries(sensor_ids)
+    summarized = {s["sensor_id"] for s in summaries}
+    return summaries + [empty_summary(sensor_id) for sensor_id in sensor_ids if sensor_id not in summarized]
+
+
+class DiscoveryRefresher:
+    """Periodically refreshes the summaries; one process at a time via an advisory lock."""
+
+    def __init__(self, interval: float = DISCOVERY_REFRESH_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sensor-discovery", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=10)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with advisory_lock(DISCOVERY_LOCK_KEY) as leader:
+                    if leader:
+                        refresh_discovery_summaries()
+            except Exception as e:
+                print(f"Discovery refresh failed: {e}")
+            self._stop.wait(self.interval)
+
+
+def start_discovery_refresher() -> Optional[DiscoveryRefresher]:
+    if DISCOVERY_REFRESH_SECONDS <= 0:
+        return None
+    return DiscoveryRefresher().start()
@@ -0,0 +1,185 @@
+import os
+import threading
+from typing import Callable, Optional
+
+from src.firestore_client import get_firestore_client
+
+# How often the mapping table is reloaded from the sensor_config collection, 0 disables the refresher
+MAPPING_REFRESH_SECONDS = float(os.getenv("SENSOR_MAPPING_REFRESH_SECONDS", "60"))
+
+
+def _scale(factor: float) -> Callable:
+    return lambda value: float(value) * factor
+
+
+def _to_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+# Named value decoders a config can pick per raw key, e.g. {"decoders": {"t": "scale:0.01"}}
+DECODERS = {
+    "float": float,
+    "int": int,
+    "str": str,
+    "bool": _to_bool,
+}
+
+
+def get_decoder(name: Optional[str]) -> Optional[Callable]:
+    if not name:
+        return None
+    if name.startswith("scale:"):
+        return _scale(float(name.split(":", 1)[1]))
+    if name not in DECODERS:
+        raise ValueError(f"Unknown decoder: {name}")
+    return DECODERS[name]
+
+
+class SensorMapping:
+    """A sensor config compiled for the parser: raw key -> (clean name, decoder) and the timestamp field."""
+
+    __slots__ = ("ts_field", "fields", "ignored")
+
+    def __init__(self, mapping: dict, ts_field: str = "ts", decoders: Optional[dict] = None):
+        decoders = decoders or {}
+        self.ts_field = ts_field
+        self.fields = tuple(
+            (raw_key, clean_name, get_decoder(decoders.get(raw_key)))
+            for raw_key, clean_name in mapping.items()
+        )
+        self.ignored = frozenset({ts_field, "mac", "sensor_id", "id", "project_id"}) | set(mapping)
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["SensorMapping"]:
+        if not config or not config.get("mapping"):
+            return None
+        return cls(config["mapping"], config.get("ts_field") or "ts", config.get("decoders"))
+
+    def measurements(self, raw_data: dict) -> dict:
+        """Mapped and decoded measurements of a raw payload; values that fail to decode are skipped."""
+        measurements = {}
+        for raw_key, clean_name, decoder in self.fields:
+            value = raw_data.get(raw_key)
+            if value is None:
+                continue
+            if decoder is not None:
+                try:
+                    value = decoder(value)
+                except (TypeError, ValueError):
+                    continue
+            measurements[clean_name] = value
+        return measurements
+
+    def extra(self, raw_data: dict) -> dict:
+        """Payload keys the mapping does not cover."""
+        return {k: v for k, v in raw_data.items() if k not in self.ignored}
+
+
+def mapping_key(sensor_id: str) -> str:
+    # The parser strips the colons from MAC-style ids, configs are stored under the raw id
+    return str(sensor_id).replace(":", "")
+
+
+class MappingRegistry:
+    """In-memory table of compiled mappings by sensor id, swapped as a whole on refresh."""
+
+    def __init__(self):
+        self._mappings: dict[str, SensorMapping] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def get(self, sensor_id: Optional[str]) -> Optional[SensorMapping]:
+        if not sensor_id:
+            return None
+        return self._mappings.get(mapping_key(sensor_id))
+
+    def set(self, sensor_id: str, config: dict):
+        try:
+            mapping = SensorMapping.from_config(config)
+        except ValueError as e:
+            print(f"Invalid mapping for {sensor_id}: {e}")
+            mapping = None
+        with self._lock:
+            mappings = dict(self._mappings)
+            if mapping is None:
+                mappings.pop(mapping_key(sensor_id), None)
+            else:
+                mappings[mapping_key(sensor_id)] = mapping
+            self._mappings = mappings
+
+    def remove(self, sensor_id: str):
+        self.set(sensor_id, {})
+
+    def replace(self, configs: dict[str, dict]):
+        mappings = {}
+        for sensor_id, config in configs.items():
+            try:
+                mapping = SensorMapping.from_config(config)
+            except ValueError as e:
+                print(f"Invalid mapping for {sensor_id}: {e}")
+                continue
+            if mapping is not None:
+                mappings[mapping_key(sensor_id)] = mapping
+        with self._lock:
+            self._mappings = mappings
+            self.loaded = True
+
+    def clear(self):
+        with self._lock:
+            self._mappings = {}
+            self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._mappings)
+
+
+SENSOR_MAPPINGS = MappingRegistry()
+
+
+def refresh_sensor_mappings(client=None) -> bool:
+    """Reload every sensor's mapping with a single read of the sensor_config collection."""
+    client = client or get_firestore_client()
+    if not client:
+        return False
+    try:
+        configs = {doc.id: doc.to_dict() for doc in client.collection("sensor_config").stream()}
+    except Exception as e:
+        print(f"Error refreshing sensor mappings: {e}")
+        return False
+    SENSOR_MAPPINGS.replace(configs)
+    return True
+
+
+def ensure_sensor_mappings(client=None):
+    """Load the mappings unless they have been loaded already (e.g. by the refresher)."""
+    if not SENSOR_MAPPINGS.loaded:
+        refresh_sensor_mappings(client)
+
+
+class MappingRefresher:
+    def __init__(self, interval: float = MAPPING_REFRESH_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sensor-mappings", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=10)
+
+    def _run(self):
+        while not self._stop.is_set():
+            refresh_sensor_mappings()
+            self._stop.wait(self.interval)
+
+
+def start_mapping_refresher() -> Optional[MappingRefresher]:
+    if MAPPING_REFRESH_SECONDS <= 0:
+        return None
+    return MappingRefresher().start()
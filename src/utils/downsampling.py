@@ -0,0 +1,35 @@
+from datetime import datetime
+
+
+def lttb(points: list[tuple[datetime, float]], threshold: int) -> list[tuple[datetime, float]]:
+    """Largest-Triangle-Three-Buckets: reduce a time-ordered series to `threshold` points
+    while keeping its visual shape. The first and last points are always kept."""
+    if threshold >= len(points) or threshold < 3:
+        return list(points)
+
+    xs = [p[0].timestamp() for p in points]
+    ys = [p[1] for p in points]
+    sampled = [points[0]]
+    every = (len(points) - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third corner of the triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, len(points))
+        avg_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
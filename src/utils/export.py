@@ -0,0 +1,114 @@
+import csv
+import io
+import json
+from typing import Iterable, Iterator
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+LONG_COLUMNS = ["timestamp", "sensor_id", "metric_name", "metric_value"]
+
+
+def pivot_wide(chunks: Iterable[list[tuple]], metrics: list[str]) -> Iterator[list[tuple]]:
+    """Turn EAV rows ordered by (timestamp, sensor_id) into one row per reading:
+    (timestamp, sensor_id, value of each metric or None). A reading split over two chunks
+    is held back until it is complete."""
+    positions = {name: i for i, name in enumerate(metrics)}
+    key, values = None, None
+    for chunk in chunks:
+        rows = []
+        for timestamp, sensor_id, name, value in chunk:
+            if (timestamp, sensor_id) != key:
+                if key is not None:
+                    rows.append((*key, *values))
+                key, values = (timestamp, sensor_id), [None] * len(metrics)
+            if name in positions:
+                values[positions[name]] = value
+        if rows:
+            yield rows
+    if key is not None:
+        yield [(*key, *values)]
+
+
+def _cell(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def encode_csv(chunks: Iterable[list[tuple]], columns: list[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows([_cell(v) for v in row] for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def encode_ndjson(chunks: Iterable[list[tuple]], columns: list[str]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(
+            json.dumps({column: _cell(value) for column, value in zip(columns, row)}) + "\n" for row in rows
+        ).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object collecting what the Parquet writer produced since the last take()."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def encode_parquet(chunks: Iterable[list[tuple]], columns: list[str]) -> Iterator[bytes]:
+    """One Parquet row group per chunk; bytes are yielded as soon as a row group is written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [pa.field("timestamp", pa.timestamp("us", tz="UTC"))] + [pa.field(c, pa.string()) for c in columns[1:]]
+    )
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in chunks:
+            arrays = [list(column) for column in zip(*rows)]
+            arrays[1:] = [[None if v is None else str(v) for v in column] for column in arrays[1:]]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson, "parquet": encode_parquet}
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
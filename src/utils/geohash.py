@@ -0,0 +1,89 @@
+from typing import Optional
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 12
+
+# Approximate web-map zoom level at which a geohash cell of each length fits a map tile
+_ZOOM_PRECISION = [(3, 1), (5, 2), (8, 3), (10, 4), (13, 5), (15, 6), (18, 7)]
+
+
+def encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        target, point = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (target[0] + target[1]) / 2
+        value <<= 1
+        if point >= mid:
+            value |= 1
+            target[0] = mid
+        else:
+            target[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> tuple[float, float]:
+    """(height, width) in degrees of a cell of the given length."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def precision_for_zoom(zoom: int) -> int:
+    for max_zoom, precision in _ZOOM_PRECISION:
+        if zoom <= max_zoom:
+            return precision
+    return 8
+
+
+def cover(min_lat: float, min_lon: float, max_lat: float, max_lon: float, max_cells: int = 32) -> list[str]:
+    """Geohash prefixes whose cells together cover the box, as long as possible while
+    staying within max_cells. The cells may extend past the box."""
+    best = [""]
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = cell_size(precision)
+        rows = int((max_lat + 90) // height) - int((min_lat + 90) // height) + 1
+        columns = int((max_lon + 180) // width) - int((min_lon + 180) // width) + 1
+        if rows * columns > max_cells:
+            break
+        cells = set()
+        for row in range(rows):
+            lat = min(min_lat + row * height, max_lat)
+            for column in range(columns):
+                cells.add(encode(lat, min(min_lon + column * width, max_lon), precision))
+            cells.add(encode(lat, max_lon, precision))
+        for column in range(columns):
+            cells.add(encode(max_lat, min(min_lon + column * width, max_lon), precision))
+        cells.add(encode(max_lat, max_lon, precision))
+        best = sorted(cells)
+    return best
+
+
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+    """Smallest string sorting after every geohash starting with prefix, or None if there is none.
+    Only geohash characters are used so the bound holds under any collation."""
+    chars = list(prefix)
+    while chars:
+        position = BASE32.index(chars[-1])
+        if position + 1 < len(BASE32):
+            chars[-1] = BASE32[position + 1]
+            return "".join(chars)
+        chars.pop()
+    return None
+
+
+def prefix_ranges(prefixes: list[str]) -> list[tuple[str, Optional[str]]]:
+    """Half-open [low, high) string ranges matching the prefixes, with neighbouring cells merged."""
+    ranges = []
+    for prefix in sorted(prefixes):
+        high = prefix_upper_bound(prefix)
+        if ranges and ranges[-1][1] == prefix:
+            ranges[-1] = (ranges[-1][0], high)
+        else:
+            ranges.append((prefix, high))
+    return ranges
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from src.db import get_all_sensor_metadata, get_metadata_version
+
+# Writes made by this process invalidate the snapshot at once; the TTL bounds how long
+# writes made by other workers go unnoticed
+METADATA_SNAPSHOT_TTL = float(os.getenv("METADATA_SNAPSHOT_TTL", "30"))
+
+METADATA_FIELDS = ("sensor_id", "description", "latitude", "longitude", "project_id")
+
+
+class MetadataSnapshot:
+    """All sensor metadata rows with a content hash, serialized once."""
+
+    def __init__(self, rows: list[dict], version: int):
+        self.rows = rows
+        self.version = version
+        self.built_at = time.monotonic()
+        self.body = json.dumps({
+            "status": "success",
+            "message": "Sensor metadata retrieved successfully",
+            "data": rows,
+        }).encode()
+        # Same content gives the same tag in every worker
+        self.digest = hashlib.sha1(json.dumps(rows, sort_keys=True).encode()).hexdigest()[:16]
+
+    def etag(self, variant: str = "") -> str:
+        if not variant:
+            return f'"{self.digest}"'
+        return f'"{self.digest}-{hashlib.sha1(variant.encode()).hexdigest()[:8]}"'
+
+    def page(self, offset: int = 0, limit: Optional[int] = None, fields: Optional[list[str]] = None) -> list[dict]:
+        rows = self.rows[offset:offset + limit if limit is not None else None]
+        if fields:
+            rows = [{field: row[field] for field in fields} for row in rows]
+        return rows
+
+
+_snapshot: Optional[MetadataSnapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def _is_fresh(snapshot: Optional[MetadataSnapshot]) -> bool:
+    return snapshot is not None and snapshot.version == get_metadata_version() \
+        and time.monotonic() - snapshot.built_at < METADATA_SNAPSHOT_TTL
+
+
+def get_metadata_snapshot() -> MetadataSnapshot:
+    global _snapshot
+    snapshot = _snapshot
+    if not _is_fresh(snapshot):
+        with _snapshot_lock:
+            # Threads that waited for the lock use the snapshot the first one built
+            snapshot = _snapshot
+            if not _is_fresh(snapshot):
+                version = get_metadata_version()
+                rows = sorted(get_all_sensor_metadata(), key=lambda row: row["sensor_id"])
+                snapshot = _snapshot = MetadataSnapshot(rows, version)
+    return snapshot
+
+
+def invalidate_metadata_snapshot():
+    global _snapshot
+    _snapshot = None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison; proxies may add the W/ prefix
+    return etag in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
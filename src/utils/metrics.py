@@ -0,0 +1,252 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+# Seconds; covers a fast webhook up to a slow Firestore page or a large batch insert
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 2500, 5000, 10000)
+# Distinct project label values; project ids come from request bodies, so any further ones are "other"
+METRICS_MAX_PROJECTS = int(os.getenv("METRICS_MAX_PROJECTS", "100"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric:
+    """A named family of time series told apart by label values."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) if labels[name] is not None else "" for name in self.labelnames)
+
+    def _label_text(self, key: tuple, extra: Optional[tuple] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._label_text(key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(Metric):
+    """Set directly, or computed at scrape time by a callback returning {label values: value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 callback: Optional[Callable[[], dict]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> Optional[float]:
+        return self._values.get(self._key(labels))
+
+    def samples(self) -> list[str]:
+        if self.callback is not None:
+            try:
+                items = sorted(self.callback().items())
+            except Exception as e:
+                print(f"Error collecting metric {self.name}: {e}")
+                return []
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [f"{self.name}{self._label_text(key)} {_number(value)}" for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state["count"] if state else 0
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, dict(state, counts=list(state["counts"]))) for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._label_text(key, ('le', _number(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._label_text(key, ('le', '+Inf'))} {state['count']}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {_number(state['sum'])}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {state['count']}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._projects: set[str] = set()
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def project_label(self, project_id: Optional[str]) -> Optional[str]:
+        """The project label value: the project id for the first METRICS_MAX_PROJECTS projects
+        seen, "other" for the rest."""
+        if project_id is None:
+            return None
+        with self._lock:
+            if project_id in self._projects:
+                return project_id
+            if len(self._projects) < METRICS_MAX_PROJECTS:
+                self._projects.add(project_id)
+                return project_id
+        return "other"
+
+    def clear(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            self._projects.clear()
+        for metric in metrics:
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+
+def project_label(project_id: Optional[str]) -> Optional[str]:
+    return REGISTRY.project_label(project_id)
+
+
+def counter(name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: tuple[str, ...] = (),
+          callback: Optional[Callable[[], dict]] = None) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames, callback))
+
+
+def histogram(name: str, documentation: str, labelnames: tuple[str, ...] = (),
+              buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if value.is_integer() and abs(value) < 1e15:
+            return str(int(value))
+        return repr(value)
+    return str(value)
+
+
+# Ingestion
+WEBHOOK_REQUESTS = counter("webhook_requests_total", "Webhook requests by outcome", ("project", "status"))
+WEBHOOK_SECONDS = histogram("webhook_request_seconds", "Webhook handling time", ("project",))
+ROWS_PARSED = counter("sensor_rows_parsed_total", "sensor_data rows produced by the parser", ("project",))
+READINGS_REJECTED = counter(
+    "sensor_readings_rejected_total", "Readings the parser could not turn into any rows", ("project",)
+)
+INGEST_AUTH_FAILURES = counter(
+    "ingest_auth_failures_total", "Rejected signed ingest requests by reason", ("source", "reason")
+)
+
+# Database writer
+INSERT_BATCH_ROWS = histogram("db_insert_batch_rows", "Rows per sensor_data insert", ("project",), SIZE_BUCKETS)
+INSERT_SECONDS = histogram("db_insert_seconds", "sensor_data insert time, pool wait excluded", ("project",))
+INSERT_DUPLICATES = counter(
+    "db_insert_duplicate_rows_total", "Rows skipped by ON CONFLICT DO NOTHING", ("project",)
+)
+POOL_WAIT_SECONDS = histogram("db_pool_wait_seconds", "Time spent waiting for a pooled connection")
+# Filled in at scrape time from the engine's pool (src.db)
+POOL_CONNECTIONS = gauge("db_pool_connections", "Connections checked out and pool size", ("state",))
+
+# Firestore and synchronization
+FIRESTORE_READS = counter(
+    "firestore_documents_read_total", "Firestore documents read", ("project", "source")
+)
+SYNC_DOCS_PER_SECOND = gauge(
+    "sync_documents_per_second", "Read rate of the last synchronization pass", ("project", "source")
+)
@@ -0,0 +1,112 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from src.utils.cache import TTLCache
+
+# Upper bound on a single sampling run
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "120"))
+
+# Leaf frames of threads that are blocked waiting, not working
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("socket.py", "accept"),
+    ("socket.py", "readinto"),
+    ("ssl.py", "read"),
+    ("thread.py", "_worker"),
+}
+
+# Only one profiler runs at a time; two would mostly measure each other
+_profile_lock = threading.Lock()
+
+# cProfile reports of profiled history syncs, by job id
+sync_profiles = TTLCache(maxsize=20, ttl=24 * 3600)
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle(frame) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+
+def sample_stacks(seconds: float, interval: float = 0.005, include_idle: bool = False) -> Counter:
+    """Sample the Python stack of every thread for `seconds`.
+
+    Returns a Counter of collapsed stacks ("thread;outer;...;leaf") to the number of samples,
+    the input format of flamegraph.pl and speedscope.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        own = threading.get_ident()
+        stacks = Counter()
+        deadline = time.monotonic() + min(seconds, PROFILE_MAX_SECONDS)
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (not include_idle and _is_idle(frame)):
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(labels))] += 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _profile_lock.release()
+
+
+def collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def profile_call(func, *args, **kwargs) -> tuple[cProfile.Profile, object]:
+    """Run func under cProfile. Only the calling thread is profiled."""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(func, *args, **kwargs)
+        return profiler, result
+    finally:
+        _profile_lock.release()
+
+
+def profile_report(profiler: cProfile.Profile, sort: str = "cumulative", limit: int = 60) -> str:
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def profile_history_sync(job_id: str, **sync_args) -> Optional[str]:
+    """Run one history sync under cProfile and keep its report for the admin endpoint."""
+    from src.history_to_timescale import sync_firestore_to_timescale
+
+    try:
+        profiler, _ = profile_call(sync_firestore_to_timescale, job_id, **sync_args)
+    except ProfilerBusy:
+        # The job was already created; run it unprofiled rather than leave it queued
+        sync_profiles.set(job_id, {"state": "skipped", "report": None})
+        sync_firestore_to_timescale(job_id, **sync_args)
+        return None
+    report = profile_report(profiler)
+    sync_profiles.set(job_id, {"state": "done", "report": report})
+    return report
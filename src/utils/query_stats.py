@@ -0,0 +1,178 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from sqlalchemy import event
+
+# Statement statistics are collected only when enabled; disabled engines have no listeners at all
+QUERY_STATS_ENABLED = os.getenv("QUERY_STATS", "false").lower() == "true"
+# Statements slower than this are logged and kept with their plan
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+# EXPLAIN a given statement at most this often, so a slow hot query does not double its own load
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "60"))
+SLOW_QUERY_LOG_SIZE = 100
+STATEMENT_TEXT_LIMIT = 2000
+
+_EXPLAINABLE = ("select", "insert", "update", "delete", "with")
+
+
+def normalize_statement(statement: str) -> str:
+    """Collapse what varies between executions of one query: whitespace, multi-row VALUES
+    lists and expanded IN lists."""
+    text = " ".join(statement.split())
+    text = re.sub(r"%\((\w+?)(?:_m?\d+)*\)s", r":\1", text)
+    text = re.sub(r"(\([^()]*\))(?:, \([^()]*\))+", r"\1, ...", text)
+    text = re.sub(r"(:\w+|\?)(?:, \1)+", r"\1, ...", text)
+    return text[:STATEMENT_TEXT_LIMIT]
+
+
+class QueryStats:
+    """Aggregated timings per normalized statement plus a log of the slowest executions."""
+
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS):
+        self.slow_ms = slow_ms
+        self.statements: dict[str, dict] = {}
+        self.slow: deque = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        self._explained_at: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, elapsed_ms: float, rows: int, param_sets: int) -> tuple[str, bool]:
+        """Add one execution; returns its normalized key and whether it was slow."""
+        key = normalize_statement(statement)
+        slow = elapsed_ms >= self.slow_ms
+        with self._lock:
+            entry = self.statements.get(key)
+            if entry is None:
+                entry = self.statements[key] = {
+                    "statement": key, "calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0,
+                    "param_sets": 0, "slow_calls": 0,
+                }
+            entry["calls"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["rows"] += max(rows, 0)
+            entry["param_sets"] += param_sets
+            entry["slow_calls"] += slow
+        return key, slow
+
+    def should_explain(self, key: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._explained_at.get(key, float("-inf")) < SLOW_QUERY_EXPLAIN_INTERVAL:
+                return False
+            self._explained_at[key] = now
+            return True
+
+    def add_slow(self, key: str, elapsed_ms: float, rows: int, param_sets: int, plan: Optional[str]):
+        self.slow.append({
+            "statement": key,
+            "duration_ms": round(elapsed_ms, 3),
+            "rows": rows,
+            "param_sets": param_sets,
+            "plan": plan,
+            "at": time.time(),
+        })
+
+    def top(self, sort: str = "total_ms", limit: int = 20) -> list[dict]:
+        with self._lock:
+            entries = [dict(entry) for entry in self.statements.values()]
+        for entry in entries:
+            entry["mean_ms"] = entry["total_ms"] / entry["calls"]
+            entry["total_ms"] = round(entry["total_ms"], 3)
+            entry["max_ms"] = round(entry["max_ms"], 3)
+            entry["mean_ms"] = round(entry["mean_ms"], 3)
+        return sorted(entries, key=lambda e: e[sort], reverse=True)[:limit]
+
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+            self.slow.clear()
+            self._explained_at.clear()
+
+
+QUERY_STATS = QueryStats()
+_instrumented: set = set()
+_instrument_lock = threading.Lock()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    param_sets = len(parameters) if executemany and parameters is not None else 1
+    rows = cursor.rowcount if cursor.rowcount is not None else -1
+
+    key, slow = QUERY_STATS.record(statement, elapsed_ms, rows, param_sets)
+    if not slow:
+        return
+    plan = None
+    if not executemany and QUERY_STATS.should_explain(key):
+        plan = explain(conn, statement, parameters)
+    QUERY_STATS.add_slow(key, elapsed_ms, rows, param_sets, plan)
+    print(f"Slow query ({elapsed_ms:.1f} ms, {rows} rows, {param_sets} parameter sets): {key[:500]}"
+          + (f"\n{plan}" if plan else ""))
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute; drop its start time
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def explain(conn, statement: str, parameters) -> Optional[str]:
+    """Plan of a statement, read on a separate DBAPI cursor so the results of the original
+    statement are untouched. A savepoint keeps a failing EXPLAIN from aborting the caller's
+    transaction. Only Postgres plans are collected."""
+    if conn.dialect.name != "postgresql" or not statement.lstrip().lower().startswith(_EXPLAINABLE):
+        return None
+    try:
+        cursor = conn.connection.dbapi_connection.cursor()
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+    try:
+        cursor.execute("SAVEPOINT query_stats_explain")
+        try:
+            cursor.execute("EXPLAIN " + statement, parameters)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT query_stats_explain")
+            plan = f"EXPLAIN failed: {e}"
+        cursor.execute("RELEASE SAVEPOINT query_stats_explain")
+        return plan
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+    finally:
+        cursor.close()
+
+
+def enable_query_stats(engine):
+    with _instrument_lock:
+        if id(engine) in _instrumented:
+            return
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+        _instrumented.add(id(engine))
+
+
+def disable_query_stats(engine):
+    with _instrument_lock:
+        if id(engine) not in _instrumented:
+            return
+        event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", _after_cursor_execute)
+        event.remove(engine, "handle_error", _handle_error)
+        _instrumented.discard(id(engine))
+
+
+def query_stats_enabled(engine) -> bool:
+    return id(engine) in _instrumented
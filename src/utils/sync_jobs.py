@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from src.db import as_utc, create_sync_job, update_sync_job, get_sync_job, touch_queued_sync_jobs
+
+# How often a running job writes its counters to the sync_jobs table and polls for cancellation
+PROGRESS_FLUSH_SECONDS = float(os.getenv("SYNC_JOB_FLUSH_SECONDS", "5"))
+
+# Jobs running in this process, by job_id
+_running_jobs: dict[str, "JobProgress"] = {}
+_running_lock = threading.Lock()
+
+# Jobs queued in this process that have not started yet; one thread keeps their heartbeat fresh
+_queued_jobs: set[str] = set()
+_queued_heartbeat: Optional[threading.Thread] = None
+
+
+class SyncCancelled(Exception):
+    """Raised inside a job when cancellation has been requested."""
+
+
+class JobProgress:
+    """Live counters of a running job.
+
+    The sync thread only bumps plain integers; a heartbeat thread flushes them to the
+    sync_jobs table every PROGRESS_FLUSH_SECONDS and picks up cancellation requests made
+    from any worker.
+    """
+
+    def __init__(self, job_id: str, flush_interval: float = PROGRESS_FLUSH_SECONDS):
+        self.job_id = job_id
+        self.flush_interval = flush_interval
+        self.current_project: Optional[str] = None
+        self.docs_read = 0
+        self.docs_total: Optional[int] = None
+        self.rows_written = 0
+        # Projects passed over because another job held their sync lock
+        self.skipped_projects: list[str] = []
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.monotonic()
+        self._cancel = threading.Event()
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name=f"job-{job_id[:8]}", daemon=True)
+
+    def start(self):
+        with _running_lock:
+            _queued_jobs.discard(self.job_id)
+            _running_jobs[self.job_id] = self
+        update_sync_job(self.job_id, state="running", started_at=self.started_at, heartbeat_at=self.started_at)
+        self._heartbeat.start()
+        return self
+
+    def set_project(self, project_id: str, docs_estimate: Optional[int] = None):
+        self.current_project = project_id
+        if docs_estimate is not None:
+            self.docs_total = (self.docs_total or 0) + docs_estimate
+
+    def skip_project(self, project_id: str):
+        self.skipped_projects.append(project_id)
+
+    def complete(self):
+        """Finish a job that went through all its projects; it failed if any had to be skipped."""
+        if self.skipped_projects:
+            self.finish("failed", "Skipped projects being synced by another job: "
+                                  + ", ".join(self.skipped_projects))
+        else:
+            self.finish("success")
+
+    def add_docs(self, count: int = 1):
+        self.docs_read += count
+
+    def add_rows(self, count: int):
+        self.rows_written += count
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise SyncCancelled(f"Job {self.job_id} was cancelled")
+
+    def snapshot(self) -> dict:
+        return {
+            "current_project": self.current_project,
+            "docs_read": self.docs_read,
+            "docs_total": self.docs_total,
+            "rows_written": self.rows_written,
+        }
+
+    def flush(self):
+        cancel_requested = update_sync_job(
+            self.job_id, heartbeat_at=datetime.now(timezone.utc), **self.snapshot()
+        )
+        if cancel_requested:
+            self._cancel.set()
+
+    def finish(self, state: str, error: Optional[str] = None):
+        self._stop.set()
+        if self._heartbeat.is_alive():
+            self._heartbeat.join()
+        with _running_lock:
+            _running_jobs.pop(self.job_id, None)
+
+        now = datetime.now(timezone.utc)
+        update_sync_job(
+            self.job_id, state=state, error=error, finished_at=now, heartbeat_at=now, **self.snapshot()
+        )
+        elapsed = time.monotonic() - self._started
+        print(f"Job {self.job_id} {state} after {elapsed:.1f}s: "
+              f"{self.docs_read} docs read, {self.rows_written} rows written")
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Failed to update progress of job {self.job_id}: {e}")
+
+
+def queue_job(job_id: str):
+    """Keep the heartbeat of a job waiting in an executor of this process fresh until it starts.
+
+    Without it a job queued behind others for longer than STALE_JOB_SECONDS would be taken for
+    dead and create_sync_job would accept a duplicate.
+    """
+    global _queued_heartbeat
+    with _running_lock:
+        _queued_jobs.add(job_id)
+        if _queued_heartbeat is None:
+            _queued_heartbeat = threading.Thread(target=_queued_heartbeat_loop, name="job-queue", daemon=True)
+            _queued_heartbeat.start()
+
+
+def _queued_heartbeat_loop():
+    global _queued_heartbeat
+    while True:
+        time.sleep(PROGRESS_FLUSH_SECONDS)
+        with _running_lock:
+            job_ids = list(_queued_jobs)
+            if not job_ids:
+                _queued_heartbeat = None
+                return
+        try:
+            touch_queued_sync_jobs(job_ids)
+        except Exception as e:
+            print(f"Failed to update heartbeat of queued jobs: {e}")
+
+
+def start_job(job_id: Optional[str] = None, job_type: str = "history") -> JobProgress:
+    """Start tracking a job created with create_sync_job, or create an unguarded one."""
+    if job_id is None:
+        job, _ = create_sync_job(job_type)
+        job_id = job["job_id"] if job else None
+    if job_id is None:
+        raise RuntimeError(f"Could not create {job_type} job")
+    return JobProgress(job_id).start()
+
+
+def cancel_job(job_id: str) -> bool:
+    """Cancel a job running in this process. Jobs on other workers are cancelled via the DB flag."""
+    with _running_lock:
+        progress = _running_jobs.get(job_id)
+    if progress is None:
+        return False
+    progress.cancel()
+    return True
+
+
+def describe_job(job: dict) -> dict:
+    """Add live counters (when the job runs in this process), throughput and ETA to a job row."""
+    job = dict(job)
+    with _running_lock:
+        progress = _running_jobs.get(job["job_id"])
+    if progress is not None:
+        job.update(progress.snapshot())
+        job["skipped_projects"] = list(progress.skipped_projects)
+
+    started_at = as_utc(job.get("started_at"))
+    ended_at = as_utc(job.get("finished_at")) or datetime.now(timezone.utc)
+    elapsed = (ended_at - started_at).total_seconds() if started_at else 0
+
+    job["elapsed_seconds"] = round(elapsed, 1)
+    job["rows_per_second"] = round(job["rows_written"] / elapsed, 1) if elapsed > 0 else 0.0
+    docs_per_second = job["docs_read"] / elapsed if elapsed > 0 else 0.0
+    job["docs_per_second"] = round(docs_per_second, 1)
+
+    job["eta_seconds"] = None
+    if job["state"] == "running" and job.get("docs_total") and docs_per_second > 0:
+        remaining = max(job["docs_total"] - job["docs_read"], 0)
+        job["eta_seconds"] = round(remaining / docs_per_second, 1)
+    return job
+
+
+def get_job_status(job_id: str) -> Optional[dict]:
+    job = get_sync_job(job_id)
+    return describe_job(job) if job else None
@@ -1,5 +0,0 @@
-sync_status = {
-    "state": "idle",   # idle | running | success | failed
-    "error": None
-}
-
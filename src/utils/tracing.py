@@ -0,0 +1,311 @@
+import contextvars
+import json
+import os
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+# memory (default), log, otlp or none
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "memory").lower()
+# Fraction of new traces that are recorded; an incoming sampled traceparent is always followed
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "1.0"))
+# Finished spans kept by the in-memory exporter
+TRACING_MEMORY_SPANS = int(os.getenv("TRACING_MEMORY_SPANS", "5000"))
+# Base URL of an OTLP/HTTP collector, e.g. http://otel-collector:4318
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "normalizer-api")
+
+
+class Span:
+    """One timed stage of a trace. Durations use a monotonic clock, start/end are wall time."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "end", "error", "_started")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, attributes: Optional[dict] = None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.end = self.start + (time.perf_counter() - self._started)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class MemoryExporter:
+    """Keeps the most recent finished spans for the trace endpoints."""
+
+    def __init__(self, size: int = TRACING_MEMORY_SPANS):
+        self.spans: deque = deque(maxlen=size)
+
+    def export(self, span: Span):
+        self.spans.append(span)
+
+    def traces(self, limit: int = 20, name: Optional[str] = None) -> list[dict]:
+        """Most recent traces, newest first, each with its spans in start order."""
+        spans = list(self.spans)
+        by_trace: dict[str, list[Span]] = {}
+        for span in spans:
+            by_trace.setdefault(span.trace_id, []).append(span)
+        span_ids = {span.span_id for span in spans}
+        roots = [span for span in reversed(spans) if span.parent_id not in span_ids]
+        result = []
+        for root in roots:
+            if name and root.name != name:
+                continue
+            members = sorted(by_trace[root.trace_id], key=lambda s: s.start)
+            result.append({
+                "trace_id": root.trace_id,
+                "name": root.name,
+                "duration_ms": round(root.duration * 1000, 3),
+                "spans": [s.to_dict() for s in members],
+            })
+            if len(result) >= limit:
+                break
+        return result
+
+    def summary(self) -> dict[str, dict]:
+        """Per span name: count and p50/p99/max duration in milliseconds."""
+        durations: dict[str, list[float]] = {}
+        for span in list(self.spans):
+            durations.setdefault(span.name, []).append(span.duration * 1000)
+        return {name: _stats(values) for name, values in sorted(durations.items())}
+
+    def clear(self):
+        self.spans.clear()
+
+
+class LogExporter:
+
+    def export(self, span: Span):
+        print(f"[trace {span.trace_id}] {span.name} {span.duration * 1000:.2f} ms"
+              + (f" {json.dumps(span.attributes, default=str)}" if span.attributes else "")
+              + (f" error={span.error}" if span.error else ""))
+
+
+class OTLPExporter:
+    """Sends spans as OTLP/HTTP JSON from a background thread, in batches."""
+
+    def __init__(self, endpoint: str = OTLP_ENDPOINT, batch_size: int = 512, interval: float = 5.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pending: queue.Queue = queue.Queue(maxsize=batch_size * 20)
+        self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        try:
+            self.pending.put_nowait(span)
+        except queue.Full:
+            pass
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.pending.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if batch:
+                self.send(batch)
+
+    def send(self, spans: list[Span]):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(otlp_payload(spans)).encode(), method="POST",
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            urllib.request.urlopen(request, timeout=10).close()
+        except Exception as e:
+            print(f"Error exporting {len(spans)} spans to {self.url}: {e}")
+
+
+def otlp_payload(spans: list[Span]) -> dict:
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+        "scopeSpans": [{
+            "scope": {"name": "src.utils.tracing"},
+            "spans": [
+                {
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                    "name": span.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(int(span.start * 1e9)),
+                    "endTimeUnixNano": str(int((span.end or span.start) * 1e9)),
+                    "attributes": [_otlp_attribute(k, v) for k, v in span.attributes.items()],
+                    "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+                }
+                for span in spans
+            ],
+        }],
+    }]}
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def _stats(values: list[float]) -> dict:
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50_ms": round(values[int(0.5 * (len(values) - 1))], 3),
+        "p99_ms": round(values[int(0.99 * (len(values) - 1))], 3),
+        "max_ms": round(values[-1], 3),
+    }
+
+
+def _create_exporter(kind: str):
+    if kind == "log":
+        return LogExporter()
+    if kind == "otlp":
+        return OTLPExporter()
+    if kind == "memory":
+        return MemoryExporter()
+    return None
+
+
+EXPORTER = _create_exporter(TRACING_EXPORTER)
+# Spans always land in memory as well so the trace endpoints work with any exporter
+MEMORY = EXPORTER if isinstance(EXPORTER, MemoryExporter) else MemoryExporter()
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, root: bool = False, parent: Optional[Span] = None, trace_id: Optional[str] = None,
+         parent_id: Optional[str] = None, **attributes):
+    """Time a stage as a child of the current span.
+
+    Outside of a trace this does nothing unless root=True, so library code can be instrumented
+    without creating traces for every background write. `parent` continues a trace on another
+    thread (contextvars do not follow work handed to a thread pool); trace_id/parent_id continue
+    one from an incoming traceparent header.
+    """
+    parent = parent or _current.get()
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    elif trace_id is None:
+        if not root or EXPORTER is None or random.random() >= TRACING_SAMPLE_RATE:
+            yield None
+            return
+        trace_id = secrets.token_hex(16)
+
+    current = Span(name, trace_id, parent_id, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        current.finish()
+        _export(current)
+
+
+def _export(finished: Span):
+    try:
+        if EXPORTER is not None and EXPORTER is not MEMORY:
+            EXPORTER.export(finished)
+        MEMORY.export(finished)
+    except Exception as e:
+        print(f"Error exporting span {finished.name}: {e}")
+
+
+TRACEPARENT = re.compile(r"([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})")
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[tuple[str, str]]:
+    """(trace_id, parent span id) of a sampled W3C traceparent header, None for anything else."""
+    match = TRACEPARENT.fullmatch(header.strip()) if header else None
+    if match is None:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or parent_id == "0" * 16 or not int(flags, 16) & 1:
+        return None
+    return trace_id, parent_id
+
+
+def format_traceparent(current: Span) -> str:
+    return f"00-{current.trace_id}-{current.span_id}-01"
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of each HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or EXPORTER is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        incoming = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        trace_id, parent_id = incoming or (None, None)
+
+        with span(f"{scope['method']} {scope['path']}", root=True, trace_id=trace_id, parent_id=parent_id,
+                  method=scope["method"], path=scope["path"]) as request_span:
+            if request_span is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    request_span.set(status=message["status"])
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"traceparent", format_traceparent(request_span).encode())
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
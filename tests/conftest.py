@@ -15,6 +15,7 @@ os.environ['FIRESTORE_COLLECTIONS'] = 'viherpysakki,ymparistomoduuli,suvilahti_u
 # Mock only Google Cloud Firestore to prevent authentication errors
 sys.modules['google.cloud'] = MagicMock()
 sys.modules['google.cloud.firestore'] = MagicMock()
+sys.modules['google.cloud.firestore_v1'] = MagicMock()
 
 
 @pytest.fixture(autouse=True)
@@ -28,7 +29,33 @@ def reset_env_vars():
 @pytest.fixture(autouse=True)
 def reset_firestore_client():
     """Reset the global CLIENT variable between tests"""
-    import src.history_to_timescale as hist_module
-    hist_module.CLIENT = None
+    from src.firestore_client import reset_firestore_client
+    reset_firestore_client()
     yield
-    hist_module.CLIENT = None
\ No newline at end of file
+    reset_firestore_client()
+
+@pytest.fixture(autouse=True)
+def reset_sensor_config_cache():
+    """Start every test with empty sensor config caches"""
+    import src.sensor_config as config_module
+    config_module._config_cache.clear()
+    config_module._unconfigured_cache.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def reset_sensor_mappings():
+    """Parsers fall back to field detection unless a test registers mappings"""
+    from src.sensor_mappings import SENSOR_MAPPINGS
+    SENSOR_MAPPINGS.clear()
+    yield
+    SENSOR_MAPPINGS.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_metadata_snapshot():
+    """Metadata snapshots must not leak between tests"""
+    from src.utils.metadata_snapshot import invalidate_metadata_snapshot
+    invalidate_metadata_snapshot()
+    yield
+    invalidate_metadata_snapshot()
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+os.environ.setdefault("VITE_AUTH0_DOMAIN", "test.auth0.com")
+os.environ.setdefault("VITE_AUTH0_AUDIENCE", "test-audience")
+
+from src import auth, dependencies  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def clear_claims_cache():
+    dependencies.verified_claims.clear()
+    yield
+    dependencies.verified_claims.clear()
+
+
+def _request(authorization: str = "Bearer token-1", **headers) -> Request:
+    raw = [(b"authorization", authorization.encode())] if authorization else []
+    raw += [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "POST", "path": "/api/webhook", "headers": raw})
+
+
+def _verify(request: Request) -> dict:
+    return asyncio.run(dependencies.verify_token(request))
+
+
+class TestVerifiedClaimsCache:
+
+    def test_repeat_token_is_verified_once(self):
+        claims = {"sub": "machine@clients", "exp": time.time() + 3600}
+        with patch.object(dependencies, "_require_auth", AsyncMock(return_value=claims)) as require_auth:
+            assert _verify(_request()) == claims
+            assert _verify(_request()) == claims
+            _verify(_request("Bearer token-2"))
+
+        assert require_auth.await_count == 2
+
+    def test_entries_end_with_the_token(self):
+        claims = {"sub": "machine@clients", "exp": time.time() + 60}
+        with patch.object(dependencies, "_require_auth", AsyncMock(return_value=claims)), \
+                patch.object(dependencies.verified_claims, "set") as cache_set:
+            _verify(_request())
+
+        ttl = cache_set.call_args.kwargs["ttl"]
+        assert 55 < ttl <= 60
+
+    def test_expired_or_dpop_tokens_are_not_cached(self):
+        expired = {"sub": "machine@clients", "exp": time.time() - 1}
+        with patch.object(dependencies, "_require_auth", AsyncMock(return_value=expired)):
+            _verify(_request())
+        assert len(dependencies.verified_claims) == 0
+
+        claims = {"sub": "machine@clients", "exp": time.time() + 3600}
+        with patch.object(dependencies, "_require_auth", AsyncMock(return_value=claims)) as require_auth:
+            _verify(_request("DPoP token-1", DPoP="proof"))
+            _verify(_request("DPoP token-1", DPoP="proof"))
+        assert require_auth.await_count == 2
+        assert len(dependencies.verified_claims) == 0
+
+    def test_failures_are_not_cached(self):
+        failing = AsyncMock(side_effect=HTTPException(status_code=401, detail="invalid_token"))
+        with patch.object(dependencies, "_require_auth", failing):
+            for _ in range(2):
+                with pytest.raises(HTTPException):
+                    _verify(_request())
+
+        assert failing.await_count == 2
+
+    def test_disabled(self):
+        claims = {"sub": "machine@clients", "exp": time.time() + 3600}
+        with patch.object(dependencies, "AUTH_CLAIMS_CACHE_SECONDS", 0), \
+                patch.object(dependencies, "_require_auth", AsyncMock(return_value=claims)) as require_auth:
+            _verify(_request())
+            _verify(_request())
+
+        assert require_auth.await_count == 2
+
+
+class TestSigningKeys:
+
+    def test_key_cache_adapter(self):
+        cache = auth.KeyCache()
+        cache.set("a", {"keys": []}, ttl_seconds=60)
+        cache.set("b", 1, ttl_seconds=0)
+        cache.set("c", 2)
+        assert cache.get("a") == {"keys": []}
+        assert cache.get("b") is None
+        assert cache.get("c") == 2
+        cache.delete("a")
+        assert cache.get("a") is None
+
+    def test_refresh_stores_keys_under_sdk_cache_keys(self):
+        metadata = {"issuer": "https://test.auth0.com/", "jwks_uri": "https://test.auth0.com/.well-known/jwks.json"}
+        jwks = {"keys": [{"kid": "k1"}]}
+        with patch.object(auth.auth0.api_client.options, "domain", "test.auth0.com"), \
+                patch.object(auth, "fetch_oidc_metadata", AsyncMock(return_value=(metadata, 15))), \
+                patch.object(auth, "fetch_jwks", AsyncMock(return_value=(jwks, 15))):
+            assert asyncio.run(auth.refresh_signing_keys()) is True
+
+        assert asyncio.run(auth.auth0.api_client._discover()) == metadata
+        assert asyncio.run(auth.auth0.api_client._fetch_jwks(metadata["jwks_uri"])) == jwks
+        auth.KEY_CACHE.clear()
+
+    def test_failed_refresh_keeps_previous_keys(self):
+        auth.KEY_CACHE.set("https://test.auth0.com/.well-known/jwks.json", {"keys": [{"kid": "old"}]})
+        with patch.object(auth.auth0.api_client.options, "domain", "test.auth0.com"), \
+                patch.object(auth, "fetch_oidc_metadata", AsyncMock(side_effect=OSError("unreachable"))):
+            assert asyncio.run(auth.refresh_signing_keys()) is False
+
+        assert auth.KEY_CACHE.get("https://test.auth0.com/.well-known/jwks.json") == {"keys": [{"kid": "old"}]}
+        auth.KEY_CACHE.clear()
@@ -0,0 +1,108 @@
+from argparse import Namespace
+from collections import namedtuple
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.pool import StaticPool
+
+from benchmarks import ingest
+from src import db
+
+# google.cloud is mocked in conftest; the fake Firestore reads these three attributes
+FieldFilter = namedtuple("FieldFilter", "field_path op_string value")
+
+
+@pytest.fixture
+def sqlite_engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    db.Base.metadata.create_all(engine)
+    with patch("src.db.get_engine", return_value=engine):
+        yield engine
+
+
+def test_insert_sensor_rows_on_sqlite_skips_duplicates(sqlite_engine):
+    rows = [{"timestamp": datetime(2024, 1, 1, tzinfo=timezone.utc), "sensor_id": "AABB", "metric_name": name,
+             "metric_value": "1", "project_id": "p"} for name in ("temperature", "humidity")]
+
+    db.insert_sensor_rows(rows)
+    db.insert_sensor_rows(rows)
+
+    with sqlite_engine.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(db.SensorData)).scalar() == 2
+
+
+class TestFakeFirestore:
+
+    def test_range_filters_and_ordering(self):
+        readings = ingest.generate_readings(100, sensors=10)
+        query = ingest.FakeFirestore(readings).collection_group("readings").where(
+            filter=FieldFilter("project_id", "==", ingest.PROJECT))
+        lower, upper = readings[20]["timestamp"], readings[50]["timestamp"]
+
+        docs = list(query.where(filter=FieldFilter("timestamp", ">=", lower))
+                    .where(filter=FieldFilter("timestamp", "<", upper)).stream())
+        newest = next(query.order_by("timestamp", direction="DESCENDING").limit(1).stream())
+
+        assert len(docs) == 30
+        assert newest.to_dict()["timestamp"] == readings[-1]["timestamp"]
+        assert query.count().get()[0][0].value == 100
+
+    def test_readings_are_repeatable(self):
+        assert ingest.generate_readings(10) == ingest.generate_readings(10)
+
+
+class TestScenarios:
+
+    def test_insert_scenario_on_sqlite(self, tmp_path):
+        args = Namespace(database_url=f"sqlite:///{tmp_path / 'bench.db'}", docs=200, batch_size=300)
+
+        with patch.object(db, "ENGINE", None):
+            result = ingest.run_scenario("insert", args)
+
+        assert result["scenario"] == "insert"
+        assert result["items"] == 800
+        assert result["throughput_per_second"] > 0
+        assert 0 < result["p50_ms"] <= result["p99_ms"] <= result["max_ms"]
+        assert result["peak_rss_mb"] > 0
+
+    def test_sync_scenario_reads_every_document(self, tmp_path):
+        args = Namespace(database_url=f"sqlite:///{tmp_path / 'bench.db'}", docs=300, partitions=3, repeat=2)
+
+        with patch.object(db, "ENGINE", None), \
+                patch("src.history_to_timescale.FieldFilter", FieldFilter), \
+                patch("src.history_to_timescale.firestore.Query.DESCENDING", "DESCENDING"):
+            result = ingest.run_scenario("sync", args)
+            with db.ENGINE.connect() as connection:
+                stored = connection.execute(select(func.count()).select_from(db.SensorData)).scalar()
+
+        assert result["items"] == 600
+        assert stored == 300 * 4
+
+
+class TestBaseline:
+
+    BASELINE = {"scenarios": [
+        {"scenario": "parser", "throughput_per_second": 1000.0, "p50_ms": 1.0, "p99_ms": 2.0, "peak_rss_mb": 100.0},
+    ]}
+
+    def test_within_tolerance(self):
+        results = {"scenarios": [
+            {"scenario": "parser", "throughput_per_second": 900.0, "p50_ms": 1.1, "p99_ms": 1.5, "peak_rss_mb": 110.0},
+            {"scenario": "sync", "throughput_per_second": 1.0, "p50_ms": 1.0, "p99_ms": 1.0, "peak_rss_mb": 1.0},
+        ]}
+
+        assert ingest.compare_to_baseline(results, self.BASELINE, 0.25) == []
+
+    def test_regressions_are_reported(self):
+        results = {"scenarios": [
+            {"scenario": "parser", "throughput_per_second": 500.0, "p50_ms": 1.0, "p99_ms": 4.0, "peak_rss_mb": 100.0},
+        ]}
+
+        regressions = ingest.compare_to_baseline(results, self.BASELINE, 0.25)
+
+        assert regressions == [
+            "parser: throughput_per_second 1000.0 -> 500.0 (-50%)",
+            "parser: p99_ms 2.0 -> 4.0 (+100%)",
+        ]
@@ -0,0 +1,112 @@
+import io
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+
+from src.utils.export import pivot_wide, encode_csv, encode_ndjson, encode_parquet, LONG_COLUMNS
+
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def t(minute):
+    return BASE_TIME + timedelta(minutes=minute)
+
+
+@pytest.fixture
+def export_engine():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from sqlalchemy.pool import StaticPool
+    from src.db import Base, SensorData
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        for minute in range(5):
+            for sensor_id in ("AABB", "CCDD"):
+                for metric in ("temperature", "humidity"):
+                    session.add(SensorData(timestamp=t(minute), sensor_id=sensor_id, metric_name=metric,
+                                           metric_value=str(minute), project_id="p"))
+        session.add(SensorData(timestamp=t(0), sensor_id="EEFF", metric_name="temperature",
+                               metric_value="1", project_id="other"))
+        session.commit()
+
+    with patch("src.db.get_engine", return_value=engine):
+        yield engine
+
+
+class TestStreamSensorData:
+
+    def test_rows_arrive_in_chunks(self, export_engine):
+        from src.db import stream_sensor_data
+
+        chunks = list(stream_sensor_data("p", chunk_size=6))
+
+        assert [len(chunk) for chunk in chunks] == [6, 6, 6, 2]
+        rows = [row for chunk in chunks for row in chunk]
+        assert rows == sorted(rows)
+        assert rows[0] == (t(0), "AABB", "humidity", "0")
+
+    def test_filters(self, export_engine):
+        from src.db import stream_sensor_data
+
+        rows = [row for chunk in stream_sensor_data("p", ["CCDD"], t(1), t(3), ["temperature"]) for row in chunk]
+
+        assert rows == [(t(1), "CCDD", "temperature", "1"), (t(2), "CCDD", "temperature", "2")]
+
+    def test_metric_names(self, export_engine):
+        from src.db import get_export_metric_names
+
+        assert get_export_metric_names("p") == ["humidity", "temperature"]
+
+
+class TestPivotWide:
+
+    def test_reading_split_across_chunks_is_joined(self):
+        chunks = [
+            [(t(0), "AABB", "humidity", "40"), (t(0), "AABB", "temperature", "20")],
+            [(t(1), "AABB", "humidity", "41")],
+            [(t(1), "AABB", "temperature", "21"), (t(1), "CCDD", "temperature", "22")],
+        ]
+
+        rows = [row for chunk in pivot_wide(chunks, ["humidity", "temperature"]) for row in chunk]
+
+        assert rows == [
+            (t(0), "AABB", "40", "20"),
+            (t(1), "AABB", "41", "21"),
+            (t(1), "CCDD", None, "22"),
+        ]
+
+    def test_empty_export(self):
+        assert list(pivot_wide(iter([]), ["temperature"])) == []
+
+
+class TestEncoders:
+
+    chunks = [[(t(0), "AABB", "temperature", "20")], [(t(1), "AABB", "temperature", "21")]]
+
+    def test_csv(self):
+        body = b"".join(encode_csv(self.chunks, LONG_COLUMNS)).decode()
+
+        assert body.splitlines() == [
+            "timestamp,sensor_id,metric_name,metric_value",
+            "2024-01-01T00:00:00+00:00,AABB,temperature,20",
+            "2024-01-01T00:01:00+00:00,AABB,temperature,21",
+        ]
+
+    def test_ndjson(self):
+        lines = b"".join(encode_ndjson(self.chunks, LONG_COLUMNS)).decode().splitlines()
+
+        assert json.loads(lines[1]) == {"timestamp": "2024-01-01T00:01:00+00:00", "sensor_id": "AABB",
+                                        "metric_name": "temperature", "metric_value": "21"}
+
+    def test_parquet_row_group_per_chunk(self):
+        pq = pytest.importorskip("pyarrow.parquet")
+
+        parts = list(encode_parquet(self.chunks, LONG_COLUMNS))
+        parquet_file = pq.ParquetFile(io.BytesIO(b"".join(parts)))
+
+        assert parquet_file.num_row_groups == 2
+        assert parquet_file.read().column("metric_value").to_pylist() == ["20", "21"]
@@ -0,0 +1,171 @@
+import pytest
+from datetime import datetime, timezone, timedelta
+from unittest.mock import Mock, patch
+
+
+@pytest.fixture
+def mock_insert():
+    with patch('src.firestore_tail.insert_sensor_rows') as mock:
+        yield mock
+
+
+@pytest.fixture
+def mock_newest_ts():
+    with patch('src.firestore_tail.get_newest_timestamp_from_db') as mock:
+        mock.return_value = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        yield mock
+
+
+def make_change(data, change_type="ADDED"):
+    change = Mock()
+    change.type.name = change_type
+    change.document.to_dict.return_value = data
+    return change
+
+
+def make_client():
+    client = Mock()
+    query = client.collection_group.return_value.where.return_value.where.return_value
+    watch = Mock()
+    watch.is_active = True
+    query.on_snapshot.return_value = watch
+    return client, query, watch
+
+
+class TestProjectTail:
+
+    def test_subscribe_resumes_from_db_watermark(self, mock_newest_ts):
+        from src.firestore_tail import ProjectTail
+
+        client, query, watch = make_client()
+        tail = ProjectTail(client, "project_a")
+        tail.subscribe()
+
+        assert tail.watermark == datetime(2024, 1, 1, tzinfo=timezone.utc)
+        mock_newest_ts.assert_called_once_with("project_a")
+        query.on_snapshot.assert_called_once()
+        assert tail.is_active
+
+    def test_snapshot_changes_are_flushed_in_batches(self, mock_newest_ts, mock_insert):
+        from src.firestore_tail import ProjectTail
+
+        client, query, watch = make_client()
+        tail = ProjectTail(client, "project_a")
+        tail.subscribe()
+
+        base = datetime(2024, 1, 2, tzinfo=timezone.utc)
+        changes = [
+            make_change({"sensor_id": "s1", "timestamp": base + timedelta(minutes=i), "temp": i})
+            for i in range(3)
+        ]
+        changes.append(make_change({"sensor_id": "s1"}, "REMOVED"))
+        tail._on_snapshot([], changes, None)
+
+        with patch('src.firestore_tail.TAIL_BATCH_SIZE', 2):
+            written = tail.flush()
+
+        assert written == 3
+        assert mock_insert.call_count == 2
+        assert tail.watermark == base + timedelta(minutes=2)
+        assert all(r["project_id"] == "project_a" for c in mock_insert.call_args_list for r in c.args[0])
+
+    def test_flush_skips_unparseable_documents(self, mock_newest_ts, mock_insert):
+        from src.firestore_tail import ProjectTail
+
+        client, query, watch = make_client()
+        tail = ProjectTail(client, "project_a")
+        tail.subscribe()
+        tail._on_snapshot([], [make_change({"sensor_id": "s1", "temp": 1})], None)
+
+        assert tail.flush() == 0
+        mock_insert.assert_not_called()
+
+
+class TestFirestoreTail:
+
+    def test_dead_listener_is_resubscribed_from_watermark(self, mock_newest_ts, mock_insert):
+        from src.firestore_tail import FirestoreTail, ProjectTail
+
+        client, query, watch = make_client()
+        tail = ProjectTail(client, "project_a")
+        tail.subscribe()
+        tail.watermark = datetime(2024, 3, 1, tzinfo=timezone.utc)
+        watch.is_active = False
+
+        manager = FirestoreTail()
+        manager.tails["project_a"] = tail
+        manager.step()
+
+        assert query.on_snapshot.call_count == 2
+        watch.unsubscribe.assert_called()
+        mock_newest_ts.assert_called_once()
+
+    def test_failed_batch_is_retried_without_dropping_the_listener(self, mock_newest_ts, mock_insert):
+        from src.firestore_tail import FirestoreTail, ProjectTail
+
+        client, query, watch = make_client()
+        tail = ProjectTail(client, "project_a")
+        tail.subscribe()
+        reading = {"sensor_id": "s1", "timestamp": datetime(2024, 2, 1, tzinfo=timezone.utc), "t": 1}
+        tail._on_snapshot([], [make_change(reading)], None)
+        mock_insert.side_effect = Exception("DB down")
+
+        manager = FirestoreTail()
+        manager.tails["project_a"] = tail
+        manager.step()
+
+        assert tail.watch is watch
+        assert tail.watermark == datetime(2024, 1, 1, tzinfo=timezone.utc)
+        assert len(tail.retry_rows) == 1
+
+        mock_insert.side_effect = None
+        manager.step()
+
+        assert mock_insert.call_count == 2
+        assert mock_insert.call_args.args[0][0]["sensor_id"] == "s1"
+        assert tail.retry_rows == []
+        assert tail.watermark == datetime(2024, 2, 1, tzinfo=timezone.utc)
+
+
+class TestResubscribe:
+
+    def test_resubscribe_overlaps_the_watermark(self, mock_newest_ts):
+        from src.firestore_tail import ProjectTail
+
+        client, query, watch = make_client()
+        tail = ProjectTail(client, "project_a")
+        with patch('src.firestore_tail.FieldFilter', side_effect=lambda field, op, value: (field, op, value)), \
+                patch('src.firestore_tail.TAIL_RESUBSCRIBE_OVERLAP_SECONDS', 600):
+            tail.subscribe()
+
+        timestamp_filter = client.collection_group.return_value.where.return_value.where.call_args.kwargs["filter"]
+        assert timestamp_filter == ("timestamp", ">", datetime(2023, 12, 31, 23, 50, tzinfo=timezone.utc))
+
+    def test_pending_documents_survive_a_resubscribe(self, mock_newest_ts, mock_insert):
+        from src.firestore_tail import ProjectTail
+
+        client, query, watch = make_client()
+        tail = ProjectTail(client, "project_a")
+        tail.subscribe()
+        reading = {"sensor_id": "s1", "timestamp": datetime(2024, 2, 1, tzinfo=timezone.utc), "t": 1}
+        tail._on_snapshot([], [make_change(reading)], None)
+
+        tail.subscribe()
+
+        assert tail.flush() == 1
+
+    def test_overlap_rows_are_written_but_not_republished(self, mock_newest_ts, mock_insert):
+        from src.firestore_tail import ProjectTail
+
+        client, query, watch = make_client()
+        tail = ProjectTail(client, "project_a")
+        tail.subscribe()
+        late = {"sensor_id": "s1", "timestamp": datetime(2023, 12, 31, 23, 55, tzinfo=timezone.utc), "t": 1}
+        new = {"sensor_id": "s2", "timestamp": datetime(2024, 1, 1, 0, 5, tzinfo=timezone.utc), "t": 2}
+        tail._on_snapshot([], [make_change(late), make_change(new)], None)
+
+        with patch('src.firestore_tail.publish_live_rows') as publish:
+            assert tail.flush() == 2
+
+        assert [row["sensor_id"] for row in mock_insert.call_args.args[0]] == ["s1", "s2"]
+        assert [row["sensor_id"] for row in publish.call_args.args[0]] == ["s2"]
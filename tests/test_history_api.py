@@ -0,0 +1,82 @@
+import os
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+os.environ.setdefault("VITE_AUTH0_DOMAIN", "test.auth0.com")
+os.environ.setdefault("VITE_AUTH0_AUDIENCE", "test-audience")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from src.db import Base, create_sync_job, list_sync_jobs  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def job_engine():
+    """In-memory SQLite engine for the sync_jobs table"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with patch("src.db.get_engine", return_value=engine):
+        yield engine
+
+
+@pytest.fixture
+def client():
+    from src.normalizer_api import app
+    from src.dependencies import get_auth_claims
+
+    app.dependency_overrides[get_auth_claims] = lambda: {"sub": "test"}
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def mock_sync_function():
+    with patch("src.routers.history.sync_firestore_to_timescale") as mock_sync:
+        yield mock_sync
+
+
+class TestSyncHistory:
+
+    def test_sync_history_with_scope(self, client, mock_sync_function):
+        """Project, sensor and range scope is passed to the sync"""
+        response = client.post("/api/history", json={
+            "project_ids": ["project_a"],
+            "sensor_ids": ["sensor_001"],
+            "start": "2024-01-01T00:00:00Z",
+            "end": "2024-01-02T00:00:00Z",
+            "workers": 8,
+        })
+
+        assert response.status_code == 202
+        job = list_sync_jobs("history")[0]
+        assert job["job_id"] == response.json()["job_id"]
+        assert job["scope"] == ["project_a"]
+        kwargs = mock_sync_function.call_args.kwargs
+        assert kwargs["project_ids"] == ["project_a"]
+        assert kwargs["sensor_ids"] == ["sensor_001"]
+        assert kwargs["workers"] == 8
+        assert kwargs["start"].isoformat() == "2024-01-01T00:00:00+00:00"
+
+    def test_sync_history_rejects_inverted_range(self, client, mock_sync_function):
+        """An empty time range is rejected before a job is created"""
+        response = client.post("/api/history", json={
+            "start": "2024-01-02T00:00:00Z",
+            "end": "2024-01-01T00:00:00Z",
+        })
+
+        assert response.status_code == 400
+        assert list_sync_jobs("history") == []
+        mock_sync_function.assert_not_called()
+
+    def test_sync_history_rejects_overlapping_sync(self, client, mock_sync_function):
+        """A second sync is refused while one covering the same projects is active"""
+        running, _ = create_sync_job("history", ["project_a"])
+
+        response = client.post("/api/history", json={"project_ids": ["project_a"]})
+
+        assert response.status_code == 409
+        assert running["job_id"] in response.json()["message"]
+        mock_sync_function.assert_not_called()
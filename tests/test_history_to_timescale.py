@@ -1,7 +1,7 @@
 import pytest
 import os
 from unittest.mock import Mock, patch, call, MagicMock
-from datetime import datetime
+from datetime import datetime, timedelta
 
 
 @pytest.fixture
@@ -16,9 +16,14 @@ def mock_firestore_client():
 @pytest.fixture
 def mock_db_functions():
     """Mock database functions"""
-    with patch('src.history_to_timescale.get_oldest_collection_timestamp_from_db') as mock_get_oldest, \
-         patch('src.history_to_timescale.insert_sensor_rows') as mock_insert:
+    with patch('src.history_to_timescale.get_newest_timestamp_from_db') as mock_get_newest, \
+         patch('src.history_to_timescale.get_oldest_timestamp_from_db') as mock_get_oldest, \
+         patch('src.history_to_timescale.insert_sensor_rows') as mock_insert, \
+         patch('src.history_to_timescale.ensure_sensor_mappings'):
+        mock_get_newest.return_value = None
+        mock_get_oldest.return_value = None
         yield {
+            'get_newest': mock_get_newest,
             'get_oldest': mock_get_oldest,
             'insert': mock_insert
         }
@@ -32,10 +37,29 @@ def mock_sensor_parser():
 
 
 @pytest.fixture
-def mock_sync_status():
-    """Mock sync_status"""
-    with patch('src.history_to_timescale.sync_status', {'state': None, 'error': None}) as mock_status:
-        yield mock_status
+def sync_job():
+    """A queued history job in an in-memory sync_jobs table"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import StaticPool
+    from src.db import Base, create_sync_job
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with patch("src.db.get_engine", return_value=engine):
+        job, _ = create_sync_job("history")
+        yield job
+
+
+def stored_job(job):
+    from src.db import get_sync_job
+    return get_sync_job(job["job_id"])
+
+
+def set_projects(client, project_ids, docs=()):
+    """Discovery finds the given projects, and each project's readings query returns the docs"""
+    client.collection.return_value.list_documents.return_value = [Mock(id=pid) for pid in project_ids]
+    patcher = patch('src.history_to_timescale.read_readings', side_effect=lambda *a, **k: iter(docs))
+    return patcher
 
 
 @pytest.fixture
@@ -56,16 +80,16 @@ class TestGetFirestoreClient:
 
     def test_client_initialization_success(self):
         """Test successful Firestore client initialization"""
-        import src.history_to_timescale as hist_module
+        import src.firestore_client as client_module
 
         # Reset CLIENT to None
-        hist_module.CLIENT = None
+        client_module.CLIENT = None
 
-        with patch('src.history_to_timescale.firestore.Client') as mock_client_class:
+        with patch('src.firestore_client.firestore.Client') as mock_client_class:
             mock_client_instance = Mock()
             mock_client_class.return_value = mock_client_instance
 
-            client = hist_module.get_firestore_client()
+            client = client_module.get_firestore_client()
 
             assert client == mock_client_instance
             mock_client_class.assert_called_once_with(project='test-project-id')
@@ -73,395 +97,447 @@ class TestGetFirestoreClient:
 
     def test_client_initialization_failure(self):
         """Test Firestore client initialization failure"""
-        import src.history_to_timescale as hist_module
+        import src.firestore_client as client_module
 
         # Reset CLIENT to None
-        hist_module.CLIENT = None
+        client_module.CLIENT = None
 
-        with patch('src.history_to_timescale.firestore.Client') as mock_client_class:
+        with patch('src.firestore_client.firestore.Client') as mock_client_class:
             mock_client_class.side_effect = Exception("Authentication failed")
 
-            client = hist_module.get_firestore_client()
+            client = client_module.get_firestore_client()
 
             assert client is None
 
 
     def test_client_reuses_existing_instance(self):
         """Test that client is only created once (singleton pattern)"""
-        import src.history_to_timescale as hist_module
+        import src.firestore_client as client_module
 
         # Set up existing client
         existing_client = Mock()
-        hist_module.CLIENT = existing_client
+        client_module.CLIENT = existing_client
 
-        with patch('src.history_to_timescale.firestore.Client') as mock_client_class:
-            client = hist_module.get_firestore_client()
+        with patch('src.firestore_client.firestore.Client') as mock_client_class:
+            client = client_module.get_firestore_client()
 
             # Should return existing client without creating a new one
             assert client == existing_client
             mock_client_class.assert_not_called()
 
 
-class TestSyncFirestoreToTimescale:
+    def test_warm_up_marks_client_ready(self):
+        """Test that a successful warm-up read is reported as ready"""
+        import src.firestore_client as client_module
 
-    def test_sync_with_no_oldest_timestamp(
-        self,
-        mock_firestore_client,
-        mock_db_functions,
-        mock_sensor_parser,
-        mock_sync_status,
-        sample_firestore_doc
-    ):
-        """Test sync when no oldest timestamp exists in database"""
-        from src.history_to_timescale import sync_firestore_to_timescale, COLLECTIONS
+        client_module.reset_firestore_client(MagicMock())
 
-        # Setup
-        mock_db_functions['get_oldest'].return_value = None
+        assert client_module.warm_up_firestore_client() is True
+        health = client_module.firestore_health()
+        assert health["ready"] is True
+        assert health["latency_ms"] is not None
 
-        mock_collection = Mock()
-        mock_collection.stream.return_value = [sample_firestore_doc]
-        mock_firestore_client.collection.return_value = mock_collection
 
-        mock_parser_instance = Mock()
-        mock_parser_instance.process_raw_sensor_data.return_value = [
-            {"sensor_id": "test", "value": 22.5}
-        ]
-        mock_sensor_parser.return_value = mock_parser_instance
+    def test_warm_up_failure_is_reported(self):
+        """Test that missing credentials show up in the health state instead of raising"""
+        import src.firestore_client as client_module
 
-        # Execute
-        sync_firestore_to_timescale()
+        with patch('src.firestore_client.firestore.Client', side_effect=Exception("No credentials")):
+            assert client_module.warm_up_firestore_client() is False
 
-        # Assert
-        assert mock_sync_status['state'] == 'success'
-        assert mock_sync_status['error'] is None
-        assert mock_db_functions['get_oldest'].call_count == len(COLLECTIONS)
-        assert mock_firestore_client.collection.call_count == len(COLLECTIONS)
-        assert mock_parser_instance.process_raw_sensor_data.called
-        assert mock_db_functions['insert'].called
+        health = client_module.firestore_health()
+        assert health["ready"] is False
+        assert "No credentials" in health["error"]
 
+    def test_client_is_ready_without_warm_up(self):
+        """Test that with FIRESTORE_WARMUP=false a created client is reported as ready"""
+        import src.firestore_client as client_module
 
-    def test_sync_with_oldest_timestamp(
-        self,
-        mock_firestore_client,
-        mock_db_functions,
-        mock_sensor_parser,
-        mock_sync_status,
-        sample_firestore_doc
-    ):
-        """Test sync when oldest timestamp exists in database"""
-        from src.history_to_timescale import sync_firestore_to_timescale
+        client_module.reset_firestore_client()
+        with patch('src.firestore_client.WARMUP_ENABLED', False), \
+                patch('src.firestore_client.firestore.Client', return_value=Mock()):
+            assert client_module.get_firestore_client() is not None
+
+        assert client_module.firestore_health()["ready"] is True
 
-        # Setup
-        oldest_ts = datetime(2024, 1, 15, 10, 0, 0)
-        mock_db_functions['get_oldest'].return_value = oldest_ts
 
-        mock_collection = Mock()
-        mock_where = Mock()
-        mock_where.stream.return_value = [sample_firestore_doc]
-        mock_collection.where.return_value = mock_where
-        mock_firestore_client.collection.return_value = mock_collection
+class TestSyncFirestoreToTimescale:
+
+    def test_sync_success(self, mock_firestore_client, mock_db_functions, mock_sensor_parser, sync_job,
+                          sample_firestore_doc):
+        """Test that a sync records its progress and success on the job"""
+        from src.history_to_timescale import sync_firestore_to_timescale
 
         mock_parser_instance = Mock()
         mock_parser_instance.process_raw_sensor_data.return_value = [
-            {"sensor_id": "test", "value": 22.5}
+            {"sensor_id": "test", "timestamp": datetime(2024, 1, 1), "value": 22.5}
         ]
         mock_sensor_parser.return_value = mock_parser_instance
 
-        # Execute
-        sync_firestore_to_timescale()
+        with set_projects(mock_firestore_client, ["project_a"], [sample_firestore_doc]):
+            sync_firestore_to_timescale(sync_job["job_id"])
+
+        job = stored_job(sync_job)
+        assert job['state'] == 'success'
+        assert job['error'] is None
+        assert job['docs_read'] == 1
+        assert job['rows_written'] == 1
+        assert job['current_project'] == 'project_a'
+        assert mock_db_functions['insert'].called
+
+    def test_sync_reads_after_newest_and_before_oldest(self, mock_firestore_client, mock_db_functions,
+                                                       mock_sensor_parser, sync_job):
+        """Test that an incremental sync reads around what is already stored"""
+        from src.history_to_timescale import sync_firestore_to_timescale
 
-        # Assert
-        assert mock_sync_status['state'] == 'success'
-        mock_collection.where.assert_called_with("timestamp", "<", oldest_ts)
+        newest, oldest = datetime(2024, 1, 15, 10, 0, 0), datetime(2024, 1, 1, 0, 0, 0)
+        mock_db_functions['get_newest'].return_value = newest
+        mock_db_functions['get_oldest'].return_value = oldest
 
+        with set_projects(mock_firestore_client, ["project_a"]) as mock_read:
+            sync_firestore_to_timescale(sync_job["job_id"])
 
-    def test_sync_with_no_parsed_rows(
-        self,
-        mock_firestore_client,
-        mock_db_functions,
-        mock_sensor_parser,
-        mock_sync_status,
-        sample_firestore_doc
-    ):
+        assert stored_job(sync_job)['state'] == 'success'
+        ranges = [{k: v for k, v in c.kwargs.items() if k != "partitions"} for c in mock_read.call_args_list]
+        assert ranges == [{"after": newest}, {"before": oldest}]
+
+    def test_sync_with_no_parsed_rows(self, mock_firestore_client, mock_db_functions, mock_sensor_parser, sync_job,
+                                      sample_firestore_doc):
         """Test sync when parser returns no rows"""
         from src.history_to_timescale import sync_firestore_to_timescale
 
-        # Setup
-        mock_db_functions['get_oldest'].return_value = None
+        mock_parser_instance = Mock()
+        mock_parser_instance.process_raw_sensor_data.return_value = []
+        mock_sensor_parser.return_value = mock_parser_instance
+
+        with set_projects(mock_firestore_client, ["project_a"], [sample_firestore_doc]):
+            sync_firestore_to_timescale(sync_job["job_id"])
 
-        mock_collection = Mock()
-        mock_collection.stream.return_value = [sample_firestore_doc]
-        mock_firestore_client.collection.return_value = mock_collection
+        job = stored_job(sync_job)
+        assert job['state'] == 'success'
+        assert job['rows_written'] == 0
+        assert not mock_db_functions['insert'].called
+
+    def test_sync_handles_exception_in_parsing(self, mock_firestore_client, mock_db_functions, mock_sensor_parser,
+                                               sync_job, sample_firestore_doc):
+        """Test sync handles exceptions during parsing"""
+        from src.history_to_timescale import sync_firestore_to_timescale
 
         mock_parser_instance = Mock()
-        mock_parser_instance.process_raw_sensor_data.return_value = []  # No rows
+        mock_parser_instance.process_raw_sensor_data.side_effect = Exception("Parse error")
         mock_sensor_parser.return_value = mock_parser_instance
 
-        # Execute
-        sync_firestore_to_timescale()
+        with set_projects(mock_firestore_client, ["project_a"], [sample_firestore_doc]):
+            sync_firestore_to_timescale(sync_job["job_id"])
 
-        # Assert
-        assert mock_sync_status['state'] == 'success'
+        job = stored_job(sync_job)
+        assert job['state'] == 'failed'
+        assert job['error'] == "Parse error"
         assert not mock_db_functions['insert'].called
 
+    def test_sync_handles_firestore_exception(self, mock_firestore_client, mock_db_functions, mock_sensor_parser,
+                                              sync_job):
+        """Test sync handles Firestore connection exceptions"""
+        from src.history_to_timescale import sync_firestore_to_timescale
 
-    def test_sync_with_multiple_documents(
-        self,
-        mock_firestore_client,
-        mock_db_functions,
-        mock_sensor_parser,
-        mock_sync_status
-    ):
-        """Test sync with multiple documents"""
-        from src.history_to_timescale import sync_firestore_to_timescale, COLLECTIONS
-
-        # Setup
-        mock_db_functions['get_oldest'].return_value = None
+        mock_firestore_client.collection.side_effect = Exception("Firestore connection error")
 
-        doc1 = Mock()
-        doc1.id = "doc_1"
-        doc1.to_dict.return_value = {"timestamp": datetime(2024, 1, 1), "temp": 20}
+        sync_firestore_to_timescale(sync_job["job_id"])
 
-        doc2 = Mock()
-        doc2.id = "doc_2"
-        doc2.to_dict.return_value = {"timestamp": datetime(2024, 1, 2), "temp": 21}
+        job = stored_job(sync_job)
+        assert job['state'] == 'failed'
+        assert job['error'] == "Firestore connection error"
 
-        mock_collection = Mock()
-        mock_collection.stream.return_value = [doc1, doc2]
-        mock_firestore_client.collection.return_value = mock_collection
+    def test_sync_handles_database_exception(self, mock_firestore_client, mock_db_functions, mock_sensor_parser,
+                                             sync_job, sample_firestore_doc):
+        """Test sync handles database insertion exceptions"""
+        from src.history_to_timescale import sync_firestore_to_timescale
 
+        mock_db_functions['insert'].side_effect = Exception("Database insert error")
         mock_parser_instance = Mock()
-        mock_parser_instance.process_raw_sensor_data.return_value = [{"sensor_id": "test"}]
+        mock_parser_instance.process_raw_sensor_data.return_value = [
+            {"sensor_id": "test", "timestamp": datetime(2024, 1, 1)}
+        ]
         mock_sensor_parser.return_value = mock_parser_instance
 
-        # Execute
-        sync_firestore_to_timescale()
+        with set_projects(mock_firestore_client, ["project_a"], [sample_firestore_doc]):
+            sync_firestore_to_timescale(sync_job["job_id"])
 
-        # Assert
-        assert mock_sync_status['state'] == 'success'
-        # Should be called twice per collection (2 docs * 5 collections = 10)
-        assert mock_parser_instance.process_raw_sensor_data.call_count == 2 * len(COLLECTIONS)
-        assert mock_db_functions['insert'].call_count == 2 * len(COLLECTIONS)
+        job = stored_job(sync_job)
+        assert job['state'] == 'failed'
+        assert job['error'] == "Database insert error"
 
+    def test_sync_handles_client_initialization_failure(self, mock_db_functions, sync_job):
+        """Test sync when Firestore client cannot be initialized"""
+        from src.history_to_timescale import sync_firestore_to_timescale
 
-    def test_sync_handles_exception_in_parsing(
-        self,
-        mock_firestore_client,
-        mock_db_functions,
-        mock_sensor_parser,
-        mock_sync_status,
-        sample_firestore_doc
-    ):
-        """Test sync handles exceptions during parsing"""
+        with patch('src.history_to_timescale.get_firestore_client', return_value=None):
+            sync_firestore_to_timescale(sync_job["job_id"])
+
+        job = stored_job(sync_job)
+        assert job['state'] == 'failed'
+        assert job['error'] == "Firestore client not initialized (check credentials)"
+        assert not mock_db_functions['get_newest'].called
+
+    def test_sync_processes_every_discovered_project(self, mock_firestore_client, mock_db_functions,
+                                                     mock_sensor_parser, sync_job):
+        """Test that sync processes each project found in Firestore once"""
         from src.history_to_timescale import sync_firestore_to_timescale
 
-        # Setup
-        mock_db_functions['get_oldest'].return_value = None
+        with set_projects(mock_firestore_client, ["project_a", "project_b"]):
+            sync_firestore_to_timescale(sync_job["job_id"])
 
-        mock_collection = Mock()
-        mock_collection.stream.return_value = [sample_firestore_doc]
-        mock_firestore_client.collection.return_value = mock_collection
+        assert stored_job(sync_job)['state'] == 'success'
+        assert [c.args for c in mock_sensor_parser.call_args_list] == [("project_a",), ("project_b",)]
+        assert [c.args[0] for c in mock_db_functions['get_newest'].call_args_list] == ["project_a", "project_b"]
 
-        mock_parser_instance = Mock()
-        mock_parser_instance.process_raw_sensor_data.side_effect = Exception("Parse error")
-        mock_sensor_parser.return_value = mock_parser_instance
+    def test_locked_projects_fail_the_job(self, mock_firestore_client, mock_db_functions, mock_sensor_parser,
+                                          sync_job):
+        """Test that a project locked by another job is reported instead of silently skipped"""
+        from contextlib import contextmanager
+        from src.history_to_timescale import sync_firestore_to_timescale
 
-        # Execute
-        sync_firestore_to_timescale()
+        @contextmanager
+        def lock(pid):
+            yield pid != "project_b"
 
-        # Assert
-        assert mock_sync_status['state'] == 'failed'
-        assert mock_sync_status['error'] == "Parse error"
-        assert not mock_db_functions['insert'].called
+        with set_projects(mock_firestore_client, ["project_a", "project_b"]), \
+             patch('src.history_to_timescale.project_sync_lock', side_effect=lock):
+            sync_firestore_to_timescale(sync_job["job_id"])
 
+        job = stored_job(sync_job)
+        assert job['state'] == 'failed'
+        assert job['error'] == "Skipped projects being synced by another job: project_b"
+        assert [c.args for c in mock_sensor_parser.call_args_list] == [("project_a",)]
 
-    def test_sync_handles_firestore_exception(
-        self,
-        mock_firestore_client,
-        mock_db_functions,
-        mock_sensor_parser,
-        mock_sync_status
-    ):
-        """Test sync handles Firestore connection exceptions"""
+    def test_sync_stops_when_cancelled(self, mock_firestore_client, mock_db_functions, mock_sensor_parser, sync_job):
+        """Test that a cancel request ends the job as cancelled before the next project"""
+        from src.db import request_sync_job_cancel
         from src.history_to_timescale import sync_firestore_to_timescale
+        from src.utils.sync_jobs import JobProgress
 
-        # Setup
-        mock_db_functions['get_oldest'].return_value = None
-        mock_firestore_client.collection.side_effect = Exception("Firestore connection error")
+        def start_cancelled_job(job_id):
+            request_sync_job_cancel(job_id)
+            progress = JobProgress(job_id, flush_interval=60).start()
+            progress.flush()
+            return progress
 
-        # Execute
-        sync_firestore_to_timescale()
+        with set_projects(mock_firestore_client, ["project_a"]), \
+             patch('src.history_to_timescale.start_job', side_effect=start_cancelled_job):
+            sync_firestore_to_timescale(sync_job["job_id"])
 
-        # Assert
-        assert mock_sync_status['state'] == 'failed'
-        assert mock_sync_status['error'] == "Firestore connection error"
+        assert stored_job(sync_job)['state'] == 'cancelled'
+        mock_sensor_parser.assert_not_called()
 
 
-    def test_sync_handles_database_exception(
-        self,
-        mock_firestore_client,
-        mock_db_functions,
-        mock_sensor_parser,
-        mock_sync_status,
-        sample_firestore_doc
-    ):
-        """Test sync handles database insertion exceptions"""
-        from src.history_to_timescale import sync_firestore_to_timescale
+class TestEnvironmentVariables:
+    """Test environment variable configuration"""
 
-        # Setup
-        mock_db_functions['get_oldest'].return_value = None
-        mock_db_functions['insert'].side_effect = Exception("Database insert error")
+    def test_collections_loaded_from_env(self):
+        """Test that COLLECTIONS is loaded from environment variable"""
+        from src.history_to_timescale import COLLECTIONS
 
-        mock_collection = Mock()
-        mock_collection.stream.return_value = [sample_firestore_doc]
-        mock_firestore_client.collection.return_value = mock_collection
+        expected_collections = ['viherpysakki', 'ymparistomoduuli', 'suvilahti_uusi', 'suvilahti', 'urban']
+        assert list(COLLECTIONS) == expected_collections
 
-        mock_parser_instance = Mock()
-        mock_parser_instance.process_raw_sensor_data.return_value = [{"sensor_id": "test"}]
-        mock_sensor_parser.return_value = mock_parser_instance
 
-        # Execute
-        sync_firestore_to_timescale()
+    def test_gcp_project_id_from_env(self):
+        """Test that GCP_PROJECT_ID is loaded from environment"""
+        from src.firestore_client import project_id
 
-        # Assert
-        assert mock_sync_status['state'] == 'failed'
-        assert mock_sync_status['error'] == "Database insert error"
+        assert project_id == 'test-project-id'
 
+class FakeReadingsQuery:
+    """Minimal stand-in for a Firestore query over documents with a `timestamp` field"""
 
-    def test_sync_handles_client_initialization_failure(
-        self,
-        mock_db_functions,
-        mock_sync_status
-    ):
-        """Test sync when Firestore client cannot be initialized"""
-        from src.history_to_timescale import sync_firestore_to_timescale
+    _ops = {
+        ">": lambda a, b: a > b,
+        ">=": lambda a, b: a >= b,
+        "<": lambda a, b: a < b,
+        "<=": lambda a, b: a <= b,
+    }
 
-        # Setup - make get_firestore_client return None
-        with patch('src.history_to_timescale.get_firestore_client') as mock_get_client:
-            mock_get_client.return_value = None
+    def __init__(self, docs, filters=(), order=None, limit_to=None):
+        self.docs = docs
+        self.filters = list(filters)
+        self.order = order
+        self.limit_to = limit_to
+        self.stream_calls = 0
 
-            # Execute
-            sync_firestore_to_timescale()
+    def where(self, filter):
+        return FakeReadingsQuery(self.docs, self.filters + [filter], self.order, self.limit_to)
 
-            # Assert
-            assert mock_sync_status['state'] == 'failed'
-            assert mock_sync_status['error'] == "Firestore client not initialized (check credentials)"
-            assert not mock_db_functions['get_oldest'].called
+    def order_by(self, field, direction=None):
+        return FakeReadingsQuery(self.docs, self.filters, direction or "ASC", self.limit_to)
 
+    def limit(self, count):
+        return FakeReadingsQuery(self.docs, self.filters, self.order, count)
 
-    def test_sync_processes_all_collections(
-        self,
-        mock_firestore_client,
-        mock_db_functions,
-        mock_sensor_parser,
-        mock_sync_status
-    ):
-        """Test that sync processes all defined collections"""
-        from src.history_to_timescale import sync_firestore_to_timescale, COLLECTIONS
+    def stream(self):
+        self.stream_calls += 1
+        matched = [
+            d for d in self.docs
+            if all(self._ops[op](d.to_dict()["timestamp"], value) for _, op, value in self.filters)
+        ]
+        if self.order is not None:
+            matched.sort(key=lambda d: d.to_dict()["timestamp"], reverse=self.order != "ASC")
+        if self.limit_to is not None:
+            matched = matched[:self.limit_to]
+        return iter(matched)
 
-        # Setup
-        mock_db_functions['get_oldest'].return_value = None
 
-        mock_collection = Mock()
-        mock_collection.stream.return_value = []
-        mock_firestore_client.collection.return_value = mock_collection
+@pytest.fixture
+def plain_field_filter():
+    """Make FieldFilter produce plain (field, op, value) tuples"""
+    with patch('src.history_to_timescale.FieldFilter', side_effect=lambda field, op, value: (field, op, value)):
+        yield
 
-        mock_parser_instance = Mock()
-        mock_sensor_parser.return_value = mock_parser_instance
 
-        # Execute
-        sync_firestore_to_timescale()
-
-        # Assert
-        assert mock_sync_status['state'] == 'success'
-        # Check that collection was called for each collection name
-        assert mock_firestore_client.collection.call_count == len(COLLECTIONS)
-        # Verify each collection name was used
-        collection_calls = [call_args[0][0] for call_args in mock_firestore_client.collection.call_args_list]
-        assert collection_calls == list(COLLECTIONS)
-
-
-    def test_sync_status_reset_on_new_run(
-        self,
-        mock_firestore_client,
-        mock_db_functions,
-        mock_sensor_parser,
-        mock_sync_status
-    ):
-        """Test that sync_status is properly reset at the start"""
-        from src.history_to_timescale import sync_firestore_to_timescale
+def make_reading_docs(count):
+    docs = []
+    for i in range(count):
+        doc = Mock()
+        doc.id = f"doc_{i}"
+        doc.to_dict.return_value = {"timestamp": datetime(2024, 1, 1) + timedelta(minutes=i), "temp": i}
+        docs.append(doc)
+    return docs
 
-        # Setup - set initial error state
-        mock_sync_status['state'] = 'failed'
-        mock_sync_status['error'] = 'Previous error'
 
-        mock_db_functions['get_oldest'].return_value = None
+class TestPartitionedReads:
+    """Test timestamp-range sharding of collection-group reads"""
 
-        mock_collection = Mock()
-        mock_collection.stream.return_value = []
-        mock_firestore_client.collection.return_value = mock_collection
+    def test_split_time_range_covers_whole_range(self):
+        from src.history_to_timescale import split_time_range
 
-        mock_parser_instance = Mock()
-        mock_sensor_parser.return_value = mock_parser_instance
+        start, end = datetime(2024, 1, 1), datetime(2024, 1, 5)
+        ranges = split_time_range(start, end, 4)
 
-        # Execute
-        sync_firestore_to_timescale()
+        assert len(ranges) == 4
+        assert ranges[0][0] == start
+        assert ranges[-1][1] == end
+        for (_, upper), (lower, _) in zip(ranges, ranges[1:]):
+            assert upper == lower
 
-        # Assert - should be reset at start then set to success
-        assert mock_sync_status['state'] == 'success'
-        assert mock_sync_status['error'] is None
+    def test_split_time_range_single_partition(self):
+        from src.history_to_timescale import split_time_range
 
+        start, end = datetime(2024, 1, 1), datetime(2024, 1, 5)
+        assert split_time_range(start, end, 1) == [(start, end)]
+        assert split_time_range(end, end, 4) == [(end, end)]
 
-def test_each_collection_individually(
-    mock_firestore_client,
-    mock_db_functions,
-    mock_sensor_parser,
-    mock_sync_status,
-    sample_firestore_doc
-):
-    """Test to verify each collection is processed correctly"""
-    from src.history_to_timescale import sync_firestore_to_timescale, COLLECTIONS
+    def test_partitioned_read_returns_every_document_once(self, plain_field_filter):
+        from src.history_to_timescale import read_readings
 
-    # Setup
-    mock_db_functions['get_oldest'].return_value = None
+        docs = make_reading_docs(101)
+        result = list(read_readings(FakeReadingsQuery(docs), partitions=4))
 
-    processed_collections = []
+        assert sorted(d.id for d in result) == sorted(d.id for d in docs)
 
-    def collection_side_effect(name):
-        processed_collections.append(name)
-        mock_collection = Mock()
-        mock_collection.stream.return_value = [sample_firestore_doc]
-        return mock_collection
+    def test_partitioned_read_respects_after_and_before(self, plain_field_filter):
+        from src.history_to_timescale import read_readings
 
-    mock_firestore_client.collection.side_effect = collection_side_effect
+        docs = make_reading_docs(50)
+        after = datetime(2024, 1, 1) + timedelta(minutes=9)
+        before = datetime(2024, 1, 1) + timedelta(minutes=40)
 
-    mock_parser_instance = Mock()
-    mock_parser_instance.process_raw_sensor_data.return_value = [{"sensor_id": "test"}]
-    mock_sensor_parser.return_value = mock_parser_instance
+        result = list(read_readings(FakeReadingsQuery(docs), after=after, before=before, partitions=3))
 
-    # Execute
-    sync_firestore_to_timescale()
+        assert sorted(d.to_dict()["temp"] for d in result) == list(range(10, 40))
 
-    # Assert
-    assert len(processed_collections) == len(COLLECTIONS)
-    for collection_name in COLLECTIONS:
-        assert collection_name in processed_collections
-    assert mock_sync_status['state'] == 'success'
+    def test_partitioned_read_empty_range(self, plain_field_filter):
+        from src.history_to_timescale import read_readings
 
+        docs = make_reading_docs(10)
+        after = datetime(2024, 2, 1)
 
-class TestEnvironmentVariables:
-    """Test environment variable configuration"""
+        assert list(read_readings(FakeReadingsQuery(docs), after=after, partitions=4)) == []
 
-    def test_collections_loaded_from_env(self):
-        """Test that COLLECTIONS is loaded from environment variable"""
-        from src.history_to_timescale import COLLECTIONS
+    def test_single_partition_streams_query_directly(self, plain_field_filter):
+        from src.history_to_timescale import read_readings
 
-        expected_collections = ['viherpysakki', 'ymparistomoduuli', 'suvilahti_uusi', 'suvilahti', 'urban']
-        assert list(COLLECTIONS) == expected_collections
+        docs = make_reading_docs(10)
+        assert len(list(read_readings(FakeReadingsQuery(docs), partitions=1))) == 10
 
+    def test_shard_error_is_raised_to_consumer(self, plain_field_filter):
+        from src.history_to_timescale import stream_partitioned
 
-    def test_gcp_project_id_from_env(self):
-        """Test that GCP_PROJECT_ID is loaded from environment"""
-        from src.history_to_timescale import project_id
+        failing = Mock()
+        failing.where.return_value = failing
+        failing.stream.side_effect = Exception("Shard read failed")
+
+        with pytest.raises(Exception, match="Shard read failed"):
+            list(stream_partitioned(failing, datetime(2024, 1, 1), datetime(2024, 1, 2), 2))
+
+
+class TestScopedSync:
+    """Test project/sensor/time-range scoped syncs"""
+
+    def test_explicit_range_ignores_db_watermarks(self, plain_field_filter):
+        from src.history_to_timescale import sync_project
+
+        client = Mock()
+        start, end = datetime(2024, 1, 1), datetime(2024, 1, 2)
+
+        with patch('src.history_to_timescale.get_newest_timestamp_from_db') as mock_newest, \
+             patch('src.history_to_timescale.read_readings', return_value=iter([])) as mock_read, \
+             patch('src.history_to_timescale.process_and_batch_save'):
+            sync_project(client, "project_a", start=start, end=end, partitions=2)
+
+        mock_newest.assert_not_called()
+        mock_read.assert_called_once()
+        assert mock_read.call_args.kwargs == {"since": start, "before": end, "partitions": 2}
+
+    def test_sensor_scope_reads_sensor_subcollections(self, plain_field_filter):
+        from src.history_to_timescale import sync_project
+
+        client = Mock()
+
+        with patch('src.history_to_timescale.get_newest_timestamp_from_db', return_value=None) as mock_newest, \
+             patch('src.history_to_timescale.get_oldest_timestamp_from_db', return_value=None), \
+             patch('src.history_to_timescale.read_readings', return_value=iter([])) as mock_read, \
+             patch('src.history_to_timescale.process_and_batch_save'):
+            sync_project(client, "project_a", sensor_ids=["AA:BB", "CC:DD"])
+
+        assert mock_read.call_count == 2
+        client.collection_group.assert_not_called()
+        sensor_docs = [c.args[0] for c in client.collection.return_value.document.return_value
+                       .collection.return_value.document.call_args_list]
+        assert sensor_docs == ["AA:BB", "CC:DD"]
+        assert [c.args for c in mock_newest.call_args_list] == [("project_a", "AABB"), ("project_a", "CCDD")]
+
+    def test_cli_runs_scoped_job(self):
+        from src.history_to_timescale import main
+
+        with patch('src.history_to_timescale.create_sync_job', return_value=({"job_id": "job-1"}, None)) as mock_create, \
+             patch('src.history_to_timescale.sync_firestore_to_timescale') as mock_sync, \
+             patch('src.history_to_timescale.get_sync_job', return_value={"state": "success"}):
+            exit_code = main(["--projects", "a,b", "--sensors", "s1", "--from", "2024-01-01",
+                              "--to", "2024-01-02T00:00:00+02:00", "--workers", "3"])
+
+        assert exit_code == 0
+        assert mock_create.call_args.args[:2] == ("history", ["a", "b"])
+        kwargs = mock_sync.call_args.kwargs
+        assert mock_sync.call_args.args == ("job-1",)
+        assert kwargs["project_ids"] == ["a", "b"]
+        assert kwargs["sensor_ids"] == ["s1"]
+        assert kwargs["start"].tzinfo is not None
+        assert kwargs["end"].utcoffset() == timedelta(hours=2)
+        assert kwargs["workers"] == 3
+
+    def test_cli_rejects_inverted_range(self):
+        from src.history_to_timescale import main
+
+        with patch('src.history_to_timescale.create_sync_job') as mock_create, \
+             pytest.raises(SystemExit) as exit_info:
+            main(["--from", "2024-01-02", "--to", "2024-01-01"])
+
+        assert exit_info.value.code == 2
+        mock_create.assert_not_called()
+
+    def test_cli_refuses_when_job_running(self):
+        from src.history_to_timescale import main
 
-        assert project_id == 'test-project-id'
\ No newline at end of file
+        with patch('src.history_to_timescale.create_sync_job', return_value=(None, {"job_id": "other"})), \
+             patch('src.history_to_timescale.sync_firestore_to_timescale') as mock_sync:
+            assert main([]) == 1
+        mock_sync.assert_not_called()
@@ -0,0 +1,165 @@
+import json
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+
+os.environ.setdefault("VITE_AUTH0_DOMAIN", "test.auth0.com")
+os.environ.setdefault("VITE_AUTH0_AUDIENCE", "test-audience")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from src import ingest_auth  # noqa: E402
+from src.ingest_auth import IngestKeyTable, INGEST_KEY_TABLE, sign  # noqa: E402
+from src.utils.metrics import INGEST_AUTH_FAILURES, WEBHOOK_REQUESTS, REGISTRY  # noqa: E402
+
+KEYS = {"forwarder": {"2026-10": "new-secret", "2026-04": "old-secret"}, "gateway-7": {"k1": "gw-secret"}}
+
+READING = {"project_id": "p", "sensor_id": "AABB", "timestamp": 1704067200, "measurements": {"temperature": 20}}
+
+
+@pytest.fixture(autouse=True)
+def key_table():
+    INGEST_KEY_TABLE.replace(KEYS)
+    ingest_auth.seen_signatures.clear()
+    REGISTRY.clear()
+    yield
+    INGEST_KEY_TABLE.replace({})
+    ingest_auth.seen_signatures.clear()
+    REGISTRY.clear()
+
+
+@pytest.fixture
+def client():
+    from src.normalizer_api import app
+    return TestClient(app)
+
+
+def _signed(body: dict, source: str = "forwarder", key_id: str = "2026-10", secret: str = "new-secret",
+            timestamp: int = None) -> dict:
+    raw = json.dumps(body).encode()
+    timestamp = str(int(time.time()) if timestamp is None else timestamp)
+    return {
+        "content": raw,
+        "headers": {
+            "Content-Type": "application/json",
+            "X-Ingest-Source": source,
+            "X-Ingest-Key-Id": key_id,
+            "X-Ingest-Timestamp": timestamp,
+            "X-Ingest-Signature": "sha256=" + sign(secret, timestamp, raw),
+        },
+    }
+
+
+class TestKeyTable:
+
+    def test_lookup_and_key_ids(self):
+        table = IngestKeyTable(KEYS)
+
+        assert table.secret("forwarder", "2026-04") == b"old-secret"
+        assert table.secret("forwarder", "k1") is None
+        assert table.key_ids() == {"forwarder": ["2026-04", "2026-10"], "gateway-7": ["k1"]}
+
+    def test_invalid_configuration_keeps_previous_table(self):
+        table = IngestKeyTable(KEYS)
+
+        with pytest.raises(ValueError):
+            table.replace({"forwarder": {"k": ""}})
+        assert len(table) == 3
+
+    def test_reload_from_file(self, tmp_path):
+        path = tmp_path / "ingest_keys.json"
+        path.write_text(json.dumps({"forwarder": {"2026-10": "new-secret"}}))
+
+        with patch.object(ingest_auth, "INGEST_KEYS_FILE", str(path)):
+            assert ingest_auth.reload_ingest_keys() == 1
+        assert INGEST_KEY_TABLE.secret("forwarder", "2026-04") is None
+
+
+class TestSignedIngest:
+
+    def test_signed_reading_is_stored(self, client):
+        with patch("src.routers.webhook.insert_sensor_rows") as insert, patch("src.routers.webhook.log_webhook"):
+            response = client.post("/api/ingest", **_signed(READING))
+
+        assert response.status_code == 201
+        assert insert.call_args.args[0][0]["sensor_id"] == "AABB"
+        assert WEBHOOK_REQUESTS.value(project="p", status="success") == 1
+
+    def test_both_keys_work_during_rotation(self, client):
+        with patch("src.routers.webhook.insert_sensor_rows"), patch("src.routers.webhook.log_webhook"):
+            new = client.post("/api/ingest", **_signed(READING))
+            old = client.post("/api/ingest", **_signed(READING, key_id="2026-04", secret="old-secret"))
+
+        assert (new.status_code, old.status_code) == (201, 201)
+
+    @pytest.mark.parametrize("kwargs, reason", [
+        ({"secret": "wrong"}, "signature"),
+        ({"key_id": "2026-01"}, "unknown_key"),
+        ({"source": "gateway-7", "key_id": "k1"}, "signature"),
+        ({"timestamp": int(time.time()) - 3600}, "timestamp"),
+    ])
+    def test_rejected(self, client, kwargs, reason):
+        with patch("src.routers.webhook.insert_sensor_rows") as insert:
+            response = client.post("/api/ingest", **_signed(READING, **kwargs))
+
+        assert response.status_code == 401
+        assert response.json()["status"] == "error"
+        insert.assert_not_called()
+        source = "unknown" if reason == "unknown_key" else kwargs.get("source", "forwarder")
+        assert INGEST_AUTH_FAILURES.value(source=source, reason=reason) == 1
+
+    def test_tampered_body_is_rejected(self, client):
+        request = _signed(READING)
+        request["content"] = request["content"].replace(b"20", b"99")
+
+        with patch("src.routers.webhook.insert_sensor_rows") as insert:
+            assert client.post("/api/ingest", **request).status_code == 401
+        insert.assert_not_called()
+
+    def test_replay_is_rejected(self, client):
+        request = _signed(READING)
+
+        with patch("src.routers.webhook.insert_sensor_rows") as insert, patch("src.routers.webhook.log_webhook"):
+            assert client.post("/api/ingest", **request).status_code == 201
+            replay = client.post("/api/ingest", **request)
+
+        assert replay.status_code == 401
+        assert insert.call_count == 1
+        assert INGEST_AUTH_FAILURES.value(source="forwarder", reason="replay") == 1
+
+    def test_replay_is_rejected_after_more_than_maxsize_requests(self, client):
+        first = _signed(READING)
+
+        with patch.object(ingest_auth, "seen_signatures", ingest_auth.SeenSignatures(maxsize=3)), \
+                patch("src.routers.webhook.insert_sensor_rows") as insert, patch("src.routers.webhook.log_webhook"):
+            statuses = [client.post("/api/ingest", **first).status_code]
+            for value in range(1, 4):
+                statuses.append(client.post("/api/ingest", **_signed({**READING, "temperature": value})).status_code)
+            replay = client.post("/api/ingest", **first)
+
+        assert statuses == [201, 201, 201, 503]
+        assert replay.status_code == 401
+        assert insert.call_count == 3
+        assert INGEST_AUTH_FAILURES.value(source="forwarder", reason="replay") == 1
+
+    def test_expired_signatures_make_room(self):
+        seen = ingest_auth.SeenSignatures(maxsize=1)
+
+        assert seen.add("old", time.time() - 1) is None
+        assert seen.add("new", time.time() + 300) is None
+        assert seen.add("new", time.time() + 300) == "replay"
+        assert seen.add("other", time.time() + 300) == "full"
+        assert len(seen) == 1
+
+    def test_missing_headers(self, client):
+        response = client.post("/api/ingest", json=READING)
+
+        assert response.status_code == 401
+        assert INGEST_AUTH_FAILURES.value(source="unknown", reason="missing") == 1
+
+    def test_auth0_token_is_not_accepted(self, client):
+        response = client.post("/api/ingest", json=READING, headers={"Authorization": "Bearer some.jwt.token"})
+
+        assert response.status_code == 401
@@ -0,0 +1,138 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src.live_stream import LiveBuffer, LIVE_BUFFER
+
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def rows(sensor_id, minute, project_id="p", **metrics):
+    return [
+        {"timestamp": BASE_TIME + timedelta(minutes=minute), "sensor_id": sensor_id, "metric_name": name,
+         "metric_value": str(value), "project_id": project_id}
+        for name, value in (metrics or {"temperature": minute}).items()
+    ]
+
+
+@pytest.fixture(autouse=True)
+def clear_live_buffer():
+    LIVE_BUFFER.clear()
+    yield
+    LIVE_BUFFER.clear()
+
+
+class TestLiveBuffer:
+
+    def test_rows_are_grouped_into_readings(self):
+        buffer = LiveBuffer()
+
+        assert buffer.publish(rows("AABB", 0, temperature=20, humidity=40) + rows("AABB", 1)) == 2
+
+        events = buffer.replay()
+        assert [event["id"] for event in events] == [1, 2]
+        assert events[0]["metrics"] == {"temperature": "20", "humidity": "40"}
+
+    def test_ring_buffer_keeps_newest_per_sensor(self):
+        buffer = LiveBuffer(size=3)
+        for minute in range(5):
+            buffer.publish(rows("AABB", minute))
+        buffer.publish(rows("CCDD", 0))
+
+        assert [e["metrics"]["temperature"] for e in buffer.replay(sensor_ids={"AABB"})] == ["2", "3", "4"]
+        assert buffer.stats() == {"sensors": 2, "events": 4, "subscribers": 0}
+
+    def test_least_recently_updated_sensor_is_evicted(self):
+        buffer = LiveBuffer(max_sensors=2)
+        buffer.publish(rows("AABB", 0))
+        buffer.publish(rows("CCDD", 0))
+        buffer.publish(rows("AABB", 1))
+        buffer.publish(rows("EEFF", 0))
+
+        assert {event["sensor_id"] for event in buffer.replay()} == {"AABB", "EEFF"}
+
+    def test_replay_filters(self):
+        buffer = LiveBuffer()
+        buffer.publish(rows("AABB", 0) + rows("CCDD", 0, project_id="q") + rows("AABB", 1))
+
+        assert [e["sensor_id"] for e in buffer.replay(project_id="q")] == ["CCDD"]
+        assert [e["id"] for e in buffer.replay(after_id=2)] == [3]
+
+    def test_subscribers_receive_matching_events(self):
+        async def scenario():
+            buffer = LiveBuffer()
+            subscriber = buffer.subscribe(sensor_ids={"AABB"})
+            buffer.publish(rows("CCDD", 0) + rows("AABB", 0))
+            event = await subscriber.get(1)
+            nothing = await subscriber.get(0.01)
+            buffer.unsubscribe(subscriber)
+            return event, nothing
+
+        event, nothing = asyncio.run(scenario())
+
+        assert event["sensor_id"] == "AABB"
+        assert nothing is None
+
+    def test_slow_subscriber_is_flagged(self):
+        async def scenario():
+            buffer = LiveBuffer()
+            with patch("src.live_stream.LIVE_SUBSCRIBER_QUEUE_SIZE", 1):
+                subscriber = buffer.subscribe()
+            buffer.publish(rows("AABB", 0) + rows("AABB", 1))
+            await asyncio.sleep(0)
+            return subscriber.overflowed
+
+        assert asyncio.run(scenario()) is True
+
+
+class TestLiveEndpoint:
+
+    @pytest.fixture
+    def client(self):
+        import os
+        os.environ.setdefault("VITE_AUTH0_DOMAIN", "test.auth0.com")
+        os.environ.setdefault("VITE_AUTH0_AUDIENCE", "test-audience")
+        from fastapi.testclient import TestClient
+        from src.normalizer_api import app
+        from src.dependencies import get_auth_claims
+
+        app.dependency_overrides[get_auth_claims] = lambda: {"sub": "test"}
+        yield TestClient(app)
+        app.dependency_overrides.pop(get_auth_claims, None)
+
+    def test_stream_replays_buffer(self, client):
+        LIVE_BUFFER.publish(rows("AABB", 0) + rows("CCDD", 0) + rows("AABB", 1))
+
+        with patch("starlette.requests.Request.is_disconnected", AsyncMock(return_value=True)), \
+             client.stream("GET", "/api/live/stream", params={"sensor_id": "AA:BB"}) as response:
+            body = "".join(response.iter_text())
+
+        assert response.headers["content-type"].startswith("text/event-stream")
+        data = [json.loads(line[6:]) for line in body.splitlines() if line.startswith("data: ")]
+        assert [(d["sensor_id"], d["metrics"]["temperature"]) for d in data] == [("AABB", "0"), ("AABB", "1")]
+        assert LIVE_BUFFER.stats()["subscribers"] == 0
+
+    def test_stream_resumes_after_last_event_id(self, client):
+        LIVE_BUFFER.publish(rows("AABB", 0) + rows("AABB", 1) + rows("AABB", 2))
+        ids = [event["id"] for event in LIVE_BUFFER.replay()]
+
+        with patch("starlette.requests.Request.is_disconnected", AsyncMock(return_value=True)), \
+             client.stream("GET", "/api/live/stream", headers={"Last-Event-ID": str(ids[1])}) as response:
+            body = "".join(response.iter_text())
+
+        assert [line for line in body.splitlines() if line.startswith("id: ")] == [f"id: {ids[2]}"]
+
+    def test_webhook_feeds_buffer(self, client):
+        with patch("src.routers.webhook.insert_sensor_rows"), patch("src.routers.webhook.log_webhook"):
+            response = client.post("/api/webhook", json={
+                "project_id": "p", "sensor_id": "AABB", "timestamp": "2024-01-01T00:00:00+00:00",
+                "measurements": {"temperature": 21.5},
+            })
+
+        assert response.status_code == 201
+        latest = client.get("/api/live/latest").json()["data"]
+        assert latest[0]["sensor_id"] == "AABB"
+        assert latest[0]["metrics"]["temperature"] == "21.5"
@@ -0,0 +1,134 @@
+from unittest.mock import patch
+
+import pytest
+
+from src.utils.metadata_snapshot import get_metadata_snapshot, etag_matches
+
+
+@pytest.fixture
+def metadata_engine():
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import StaticPool
+    from src.db import Base, upsert_sensor_metadata
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with patch("src.db.get_engine", return_value=engine):
+        upsert_sensor_metadata([
+            {"sensor_id": sensor_id, "description": f"Sensor {sensor_id}", "latitude": 60.1, "longitude": 24.9,
+             "project_id": "p"}
+            for sensor_id in ("CCDD", "AABB", "EEFF")
+        ])
+        yield engine
+
+
+@pytest.fixture
+def client(metadata_engine):
+    import os
+    os.environ.setdefault("VITE_AUTH0_DOMAIN", "test.auth0.com")
+    os.environ.setdefault("VITE_AUTH0_AUDIENCE", "test-audience")
+    from fastapi.testclient import TestClient
+    from src.normalizer_api import app
+    from src.dependencies import get_auth_claims
+
+    app.dependency_overrides[get_auth_claims] = lambda: {"sub": "test"}
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_auth_claims, None)
+
+
+class TestMetadataSnapshot:
+
+    def test_snapshot_is_reused_until_a_write(self, metadata_engine):
+        from src.db import delete_sensor_metadata
+
+        first = get_metadata_snapshot()
+        assert get_metadata_snapshot() is first
+        assert [row["sensor_id"] for row in first.rows] == ["AABB", "CCDD", "EEFF"]
+
+        delete_sensor_metadata("CCDD")
+        second = get_metadata_snapshot()
+
+        assert second is not first
+        assert second.etag() != first.etag()
+        assert [row["sensor_id"] for row in second.rows] == ["AABB", "EEFF"]
+
+    def test_etag_depends_on_content_only(self, metadata_engine):
+        from src.db import upsert_sensor_metadata
+
+        etag = get_metadata_snapshot().etag()
+        upsert_sensor_metadata([{"sensor_id": "AABB", "description": "Sensor AABB", "latitude": 60.1,
+                                 "longitude": 24.9, "project_id": "p"}])
+
+        assert get_metadata_snapshot().etag() == etag
+
+    def test_ttl_expiry_rebuilds(self, metadata_engine):
+        first = get_metadata_snapshot()
+
+        with patch("src.utils.metadata_snapshot.METADATA_SNAPSHOT_TTL", 0):
+            assert get_metadata_snapshot() is not first
+
+    def test_concurrent_stale_readers_build_once(self, metadata_engine):
+        import threading
+        import time
+        from src.db import get_all_sensor_metadata
+        from src.utils.metadata_snapshot import invalidate_metadata_snapshot
+
+        def slow_load():
+            time.sleep(0.05)
+            return get_all_sensor_metadata()
+
+        invalidate_metadata_snapshot()
+        snapshots = []
+        with patch("src.utils.metadata_snapshot.get_all_sensor_metadata", side_effect=slow_load) as load:
+            threads = [threading.Thread(target=lambda: snapshots.append(get_metadata_snapshot())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert load.call_count == 1
+        assert len({id(snapshot) for snapshot in snapshots}) == 1
+
+    @pytest.mark.parametrize("header, expected", [
+        (None, False), ('"abc"', True), ('W/"abc"', True), ('"x", "abc"', True), ("*", True), ('"x"', False),
+    ])
+    def test_etag_matches(self, header, expected):
+        assert etag_matches(header, '"abc"') is expected
+
+
+class TestMetadataEndpoint:
+
+    def test_conditional_get(self, client):
+        response = client.get("/api/sensors/metadata")
+        etag = response.headers["etag"]
+
+        assert response.status_code == 200
+        assert len(response.json()["data"]) == 3
+
+        cached = client.get("/api/sensors/metadata", headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["etag"] == etag
+
+    def test_write_invalidates_etag(self, client):
+        from src.db import delete_sensor_metadata
+
+        etag = client.get("/api/sensors/metadata").headers["etag"]
+        delete_sensor_metadata("AABB")
+
+        response = client.get("/api/sensors/metadata", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    def test_pagination_and_fields(self, client):
+        response = client.get("/api/sensors/metadata", params={"limit": 2, "offset": 1, "fields": "sensor_id"})
+        body = response.json()
+
+        assert body["data"] == [{"sensor_id": "CCDD"}, {"sensor_id": "EEFF"}]
+        assert body["pagination"] == {"offset": 1, "limit": 2, "total": 3}
+        assert response.headers["etag"] != client.get("/api/sensors/metadata").headers["etag"]
+
+    def test_unknown_field(self, client):
+        response = client.get("/api/sensors/metadata", params={"fields": "sensor_id,secret"})
+
+        assert response.status_code == 400
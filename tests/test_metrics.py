@@ -0,0 +1,149 @@
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from src.utils.metrics import Counter, Gauge, Histogram, Registry, REGISTRY
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    REGISTRY.clear()
+    yield
+    REGISTRY.clear()
+
+
+class TestMetricTypes:
+
+    def test_counter(self):
+        counter = Counter("rows_total", "Rows", ("project",))
+        counter.inc(project="p")
+        counter.inc(4, project="p")
+        counter.inc(project='q"1')
+
+        assert counter.value(project="p") == 5
+        assert counter.samples() == ['rows_total{project="p"} 5', 'rows_total{project="q\\"1"} 1']
+
+    def test_labels_must_match(self):
+        counter = Counter("rows_total", "Rows", ("project",))
+
+        with pytest.raises(ValueError):
+            counter.inc(sensor="AABB")
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            histogram.observe(value)
+
+        assert histogram.samples() == [
+            'latency_seconds_bucket{le="0.1"} 1',
+            'latency_seconds_bucket{le="1"} 3',
+            'latency_seconds_bucket{le="+Inf"} 4',
+            "latency_seconds_sum 4.25",
+            "latency_seconds_count 4",
+        ]
+
+    def test_callback_gauge(self):
+        gauge = Gauge("pool", "Pool", ("state",), callback=lambda: {("size",): 5})
+
+        assert gauge.samples() == ['pool{state="size"} 5']
+
+    def test_registry_rejects_duplicates(self):
+        registry = Registry()
+        registry.register(Counter("a_total", "A"))
+
+        with pytest.raises(ValueError):
+            registry.register(Counter("a_total", "A"))
+        assert "# TYPE a_total counter" in registry.render()
+
+
+class TestInstrumentation:
+
+    def test_parser_counts_rows_and_rejections(self):
+        from src.SensorDataParser import SensorDataParser
+        from src.utils.metrics import ROWS_PARSED, READINGS_REJECTED
+
+        parser = SensorDataParser("p")
+        parser.process_raw_sensor_data({"sensor_id": "AABB", "timestamp": 1704067200, "temperature": 20, "humidity": 40})
+        parser.process_raw_sensor_data({"sensor_id": "AABB", "timestamp": 1704067200})
+
+        assert ROWS_PARSED.value(project="p") == 2
+        assert READINGS_REJECTED.value(project="p") == 1
+
+    def test_projects_past_the_label_limit_count_as_other(self):
+        from src.SensorDataParser import SensorDataParser
+        from src.utils.metrics import ROWS_PARSED
+
+        reading = {"sensor_id": "AABB", "timestamp": 1704067200, "temperature": 20}
+        with patch("src.utils.metrics.METRICS_MAX_PROJECTS", 2):
+            for project in ("p1", "p2", "p3", "p4", "p1"):
+                SensorDataParser(project).process_raw_sensor_data(reading)
+
+        assert ROWS_PARSED.value(project="p1") == 2
+        assert ROWS_PARSED.value(project="p2") == 1
+        assert ROWS_PARSED.value(project="p3") == 0
+        assert ROWS_PARSED.value(project="other") == 2
+
+    def test_insert_records_batch_and_duplicates(self):
+        from src.db import insert_sensor_rows
+        from src.utils.metrics import INSERT_BATCH_ROWS, INSERT_DUPLICATES, POOL_WAIT_SECONDS
+
+        engine = MagicMock()
+        connection = engine.begin.return_value.__enter__.return_value
+        connection.execute.return_value.rowcount = 1
+        rows = [{"timestamp": 1, "sensor_id": "AABB", "metric_name": name, "metric_value": "1", "project_id": "p"}
+                for name in ("temperature", "humidity")]
+
+        with patch("src.db.get_engine", return_value=engine):
+            insert_sensor_rows(rows)
+
+        assert INSERT_BATCH_ROWS.count(project="p") == 1
+        assert INSERT_DUPLICATES.value(project="p") == 1
+        assert POOL_WAIT_SECONDS.count() == 1
+
+    def test_batch_save_counts_firestore_reads(self):
+        from src.history_to_timescale import process_and_batch_save
+        from src.SensorDataParser import SensorDataParser
+        from src.utils.metrics import FIRESTORE_READS, SYNC_DOCS_PER_SECOND
+
+        docs = [MagicMock(to_dict=MagicMock(return_value={"sensor_id": "AABB", "timestamp": 1704067200 + i,
+                                                           "temperature": i})) for i in range(3)]
+        with patch("src.history_to_timescale.insert_sensor_rows"):
+            process_and_batch_save(docs, SensorDataParser("p"), "p", source="reconciliation")
+
+        assert FIRESTORE_READS.value(project="p", source="reconciliation") == 3
+        assert SYNC_DOCS_PER_SECOND.value(project="p", source="reconciliation") > 0
+
+
+class TestMetricsEndpoint:
+
+    @pytest.fixture
+    def client(self):
+        import os
+        os.environ.setdefault("VITE_AUTH0_DOMAIN", "test.auth0.com")
+        os.environ.setdefault("VITE_AUTH0_AUDIENCE", "test-audience")
+        from fastapi.testclient import TestClient
+        from src.normalizer_api import app
+        from src.dependencies import get_auth_claims
+
+        app.dependency_overrides[get_auth_claims] = lambda: {"sub": "test"}
+        yield TestClient(app)
+        app.dependency_overrides.pop(get_auth_claims, None)
+
+    def test_webhook_requests_are_exposed(self, client):
+        with patch("src.routers.webhook.insert_sensor_rows"), patch("src.routers.webhook.log_webhook"):
+            client.post("/api/webhook", json={"project_id": "p", "sensor_id": "AABB", "timestamp": 1704067200,
+                                              "measurements": {"temperature": 20}})
+            client.post("/api/webhook", json={"project_id": "p", "sensor_id": "AABB"})
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert 'webhook_requests_total{project="p",status="success"} 1' in response.text
+        assert 'webhook_requests_total{project="p",status="rejected"} 1' in response.text
+        assert 'webhook_request_seconds_count{project="p"} 2' in response.text
+
+    def test_token_is_required_when_configured(self, client):
+        with patch("src.normalizer_api.METRICS_TOKEN", "secret"):
+            assert client.get("/metrics").status_code == 401
+            assert client.get("/metrics", headers={"Authorization": "Bearer secret"}).status_code == 200
@@ -68,9 +68,23 @@ def mock_sync_function():
 
 @pytest.fixture
 def mock_sync_status():
-    """Mock sync_status"""
-    with patch('src.routers.history.sync_status', {'state': None, 'error': None}) as mock_status:
-        yield mock_status
+    """Mock the latest history job row"""
+    job = {
+        'job_id': 'job-1', 'job_type': 'history', 'state': None, 'error': None, 'scope': [],
+        'current_project': None, 'docs_read': 0, 'docs_total': None, 'rows_written': 0,
+        'cancel_requested': False, 'created_at': None, 'started_at': None, 'finished_at': None,
+        'heartbeat_at': None,
+    }
+    with patch('src.routers.history.list_sync_jobs', side_effect=lambda *a, **k: [job]):
+        yield job
+
+
+@pytest.fixture
+def mock_create_job():
+    """Mock create_sync_job"""
+    with patch('src.routers.history.create_sync_job') as mock:
+        mock.return_value = ({'job_id': 'job-1'}, None)
+        yield mock
 
 
 @pytest.fixture
@@ -351,7 +365,7 @@ class TestDeleteSensor:
 class TestSyncHistory:
     """Test history synchronization endpoints"""
 
-    def test_sync_history_starts_background_task(self, client, mock_sync_function):
+    def test_sync_history_starts_background_task(self, client, mock_sync_function, mock_create_job):
         """Test that sync history starts a background task"""
         response = client.post("/api/history")
 
@@ -359,6 +373,8 @@ class TestSyncHistory:
         data = response.json()
         assert data["status"] == "accepted"
         assert "background" in data["message"].lower()
+        assert data["job_id"] == "job-1"
+        assert mock_sync_function.call_args.args == ("job-1",)
 
     def test_get_sync_status_success(self, client, mock_sync_status):
         """Test getting sync status when successful"""
@@ -0,0 +1,119 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src.utils.profiling import sample_stacks, collapsed, profile_call, profile_report, profile_history_sync, \
+    sync_profiles, ProfilerBusy, _profile_lock
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+@pytest.fixture
+def busy_thread():
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_loop, args=(stop,), name="busy")
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join()
+
+
+class TestSampling:
+
+    def test_collapsed_stacks_include_busy_thread(self, busy_thread):
+        stacks = sample_stacks(0.2, interval=0.005)
+
+        busy = [stack for stack in stacks if stack.startswith("busy;")]
+        assert busy
+        assert all("busy_loop (test_profiling.py:" in stack for stack in busy)
+
+    def test_idle_threads_are_skipped(self):
+        event = threading.Event()
+        waiter = threading.Thread(target=event.wait, name="waiter")
+        waiter.start()
+        try:
+            assert not [s for s in sample_stacks(0.05) if s.startswith("waiter;")]
+            assert [s for s in sample_stacks(0.05, include_idle=True) if s.startswith("waiter;")]
+        finally:
+            event.set()
+            waiter.join()
+
+    def test_collapsed_format(self):
+        from collections import Counter
+
+        assert collapsed(Counter({"main;a;b": 3, "main;a": 1})) == "main;a;b 3\nmain;a 1\n"
+
+    def test_one_profile_at_a_time(self):
+        with _profile_lock:
+            with pytest.raises(ProfilerBusy):
+                sample_stacks(0.01)
+
+
+class TestCProfile:
+
+    def test_profile_call(self):
+        profiler, result = profile_call(sorted, [3, 1, 2])
+
+        assert result == [1, 2, 3]
+        assert "function calls" in profile_report(profiler)
+
+    def test_history_sync_report_is_kept(self):
+        def fake_sync(job_id, **kwargs):
+            time.sleep(0.01)
+
+        with patch("src.history_to_timescale.sync_firestore_to_timescale", fake_sync):
+            report = profile_history_sync("job-1", project_ids=["p"])
+
+        assert "fake_sync" in report
+        assert sync_profiles.get("job-1")["state"] == "done"
+
+
+class TestProfileEndpoints:
+
+    @pytest.fixture
+    def client(self):
+        import os
+        os.environ.setdefault("VITE_AUTH0_DOMAIN", "test.auth0.com")
+        os.environ.setdefault("VITE_AUTH0_AUDIENCE", "test-audience")
+        from fastapi.testclient import TestClient
+        from src.normalizer_api import app
+        from src.dependencies import require_admin
+
+        app.dependency_overrides[require_admin] = lambda: {"sub": "test"}
+        yield TestClient(app)
+        app.dependency_overrides.clear()
+
+    def test_sampling_endpoint(self, client, busy_thread):
+        response = client.post("/api/admin/profile", params={"seconds": 0.2})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert int(response.headers["x-profile-samples"]) > 0
+        assert any(line.startswith("busy;") for line in response.text.splitlines())
+
+    def test_busy_profiler_conflicts(self, client):
+        with _profile_lock:
+            response = client.post("/api/admin/profile", params={"seconds": 0.1})
+
+        assert response.status_code == 409
+
+    def test_profiled_history_sync(self, client):
+        with patch("src.routers.admin.create_sync_job", return_value=({"job_id": "job-2"}, None)), \
+             patch("src.routers.admin.profile_history_sync") as mock_profile:
+            response = client.post("/api/admin/profile/history-sync", json={"project_ids": ["p"]})
+
+        assert response.status_code == 202
+        assert mock_profile.call_args.args == ("job-2",)
+        assert mock_profile.call_args.kwargs["project_ids"] == ["p"]
+
+    def test_profile_report_lookup(self, client):
+        sync_profiles.set("job-3", {"state": "done", "report": "report"})
+
+        with patch("src.routers.admin.get_sync_job", return_value=None):
+            assert client.get("/api/admin/profile/history-sync/job-3").json()["data"]["report"] == "report"
+            assert client.get("/api/admin/profile/history-sync/missing").status_code == 404
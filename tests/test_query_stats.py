@@ -0,0 +1,117 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from src.utils.query_stats import QUERY_STATS, normalize_statement, enable_query_stats, disable_query_stats, \
+    query_stats_enabled, explain
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)"))
+    QUERY_STATS.reset()
+    enable_query_stats(engine)
+    yield engine
+    disable_query_stats(engine)
+    QUERY_STATS.reset()
+
+
+class TestNormalize:
+
+    def test_multi_row_values_collapse(self):
+        one = "INSERT INTO t (a, b) VALUES (%(a_m0)s, %(b_m0)s)"
+        many = "INSERT INTO t (a, b) VALUES (%(a_m0)s, %(b_m0)s), (%(a_m1)s, %(b_m1)s), (%(a_m2)s, %(b_m2)s)"
+
+        assert normalize_statement(many) == "INSERT INTO t (a, b) VALUES (:a, :b), ..."
+        assert normalize_statement(one) != normalize_statement(many)
+
+    def test_in_lists_collapse(self):
+        assert normalize_statement("SELECT * FROM t WHERE id IN (?, ?, ?)") == \
+            normalize_statement("SELECT * FROM t WHERE id IN (?, ?)")
+
+
+class TestQueryStats:
+
+    def test_statements_are_aggregated(self, engine):
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO t (v) VALUES (:v)"), [{"v": "a"}, {"v": "b"}, {"v": "c"}])
+            for _ in range(2):
+                conn.execute(text("SELECT * FROM t WHERE v = :v"), {"v": "a"}).all()
+
+        entries = {entry["statement"]: entry for entry in QUERY_STATS.top()}
+        insert = entries["INSERT INTO t (v) VALUES (?)"]
+        select = entries["SELECT * FROM t WHERE v = ?"]
+        assert insert["param_sets"] == 3
+        assert insert["rows"] == 3
+        assert select["calls"] == 2
+
+    def test_slow_statements_are_logged(self, engine):
+        with patch.object(QUERY_STATS, "slow_ms", 0):
+            with engine.begin() as conn:
+                conn.execute(text("SELECT 1")).all()
+
+        slow = list(QUERY_STATS.slow)
+        assert slow[-1]["statement"] == "SELECT 1"
+        assert slow[-1]["plan"] is None  # plans are only collected on Postgres
+
+    def test_failed_statement_does_not_leak_timer(self, engine):
+        with engine.connect() as conn:
+            with pytest.raises(Exception):
+                conn.execute(text("SELECT * FROM missing"))
+            assert not conn.info.get("query_start")
+
+    def test_disabled_engine_has_no_listeners(self, engine):
+        disable_query_stats(engine)
+        with engine.begin() as conn:
+            conn.execute(text("SELECT 1")).all()
+
+        assert not query_stats_enabled(engine)
+        assert QUERY_STATS.top() == []
+
+    def test_explain_uses_savepoint(self):
+        conn = MagicMock()
+        conn.dialect.name = "postgresql"
+        cursor = conn.connection.dbapi_connection.cursor.return_value
+        cursor.fetchall.return_value = [("Seq Scan on sensor_data",)]
+
+        plan = explain(conn, "SELECT min(timestamp) FROM sensor_data", {})
+
+        assert plan == "Seq Scan on sensor_data"
+        assert [c.args[0] for c in cursor.execute.call_args_list] == [
+            "SAVEPOINT query_stats_explain", "EXPLAIN SELECT min(timestamp) FROM sensor_data",
+            "RELEASE SAVEPOINT query_stats_explain",
+        ]
+
+
+class TestQueryStatsEndpoints:
+
+    @pytest.fixture
+    def client(self, engine):
+        import os
+        os.environ.setdefault("VITE_AUTH0_DOMAIN", "test.auth0.com")
+        os.environ.setdefault("VITE_AUTH0_AUDIENCE", "test-audience")
+        from fastapi.testclient import TestClient
+        from src.normalizer_api import app
+        from src.dependencies import require_admin
+
+        app.dependency_overrides[require_admin] = lambda: {"sub": "test"}
+        with patch("src.routers.admin.get_engine", return_value=engine):
+            yield TestClient(app)
+        app.dependency_overrides.clear()
+
+    def test_stats_and_toggle(self, client, engine):
+        with engine.begin() as conn:
+            conn.execute(text("SELECT 1")).all()
+
+        data = client.get("/api/admin/queries", params={"sort": "calls"}).json()["data"]
+        assert data["enabled"] is True
+        assert data["statements"][0]["statement"] == "SELECT 1"
+
+        assert client.put("/api/admin/queries/enabled", params={"enabled": False}).json()["data"] == {"enabled": False}
+        assert client.delete("/api/admin/queries").status_code == 200
+        assert client.get("/api/admin/queries").json()["data"]["statements"] == []
+        assert client.get("/api/admin/queries", params={"sort": "bogus"}).status_code == 400
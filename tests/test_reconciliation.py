@@ -0,0 +1,205 @@
+import pytest
+from datetime import date, datetime, timezone
+from unittest.mock import Mock, patch
+
+
+class FakeSensorRef:
+    """Sensor document whose readings count per UTC day is given by `daily_counts`"""
+
+    def __init__(self, sensor_id, daily_counts):
+        self.id = sensor_id
+        self.daily_counts = daily_counts
+        self.streamed = []
+
+    def collection(self, name):
+        assert name == "readings"
+        return FakeRangeQuery(self)
+
+
+class FakeRangeQuery:
+
+    def __init__(self, sensor, filters=()):
+        self.sensor = sensor
+        self.filters = list(filters)
+
+    def where(self, filter):
+        return FakeRangeQuery(self.sensor, self.filters + [filter])
+
+    def _range(self):
+        bounds = {op: value for _, op, value in self.filters}
+        return bounds[">="], bounds["<"]
+
+    def count_in_range(self):
+        start, end = self._range()
+        return sum(c for day, c in self.sensor.daily_counts.items()
+                   if start <= datetime(day.year, day.month, day.day, tzinfo=timezone.utc) < end)
+
+    def stream(self):
+        self.sensor.streamed.append(self._range()[0].date())
+        return iter([])
+
+
+@pytest.fixture(autouse=True)
+def plain_field_filter():
+    with patch('src.reconciliation.FieldFilter', side_effect=lambda field, op, value: (field, op, value)):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def db_engine():
+    """In-memory SQLite engine for the reconciled_days table"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import StaticPool
+    from src.db import Base
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with patch('src.db.get_engine', return_value=engine):
+        yield engine
+
+
+@pytest.fixture
+def mock_count():
+    with patch('src.reconciliation.estimate_document_count', side_effect=lambda q: q.count_in_range()) as mock:
+        yield mock
+
+
+@pytest.fixture
+def mock_save():
+    with patch('src.reconciliation.process_and_batch_save') as mock:
+        yield mock
+
+
+def make_client(sensor_refs):
+    client = Mock()
+    client.collection.return_value.document.return_value.collection.return_value \
+        .list_documents.return_value = sensor_refs
+    return client
+
+
+class TestReconcileProject:
+
+    def test_only_differing_buckets_are_resynced(self, mock_count, mock_save):
+        from src.reconciliation import reconcile_project
+
+        complete = FakeSensorRef("AA:BB", {date(2024, 1, 1): 10, date(2024, 1, 2): 10})
+        gappy = FakeSensorRef("CC:DD", {date(2024, 1, 1): 10, date(2024, 1, 2): 10, date(2024, 1, 3): 5})
+        db_counts = {
+            ("AABB", date(2024, 1, 1)): 10, ("AABB", date(2024, 1, 2)): 10,
+            ("CCDD", date(2024, 1, 1)): 10, ("CCDD", date(2024, 1, 2)): 4, ("CCDD", date(2024, 1, 3)): 5,
+        }
+
+        with patch('src.reconciliation.get_daily_reading_counts', return_value=db_counts):
+            resynced = reconcile_project(
+                make_client([complete, gappy]), "project_a",
+                datetime(2024, 1, 1, tzinfo=timezone.utc), datetime(2024, 1, 3, 12, tzinfo=timezone.utc),
+            )
+
+        assert resynced == 1
+        assert complete.streamed == []
+        assert gappy.streamed == [date(2024, 1, 2)]
+        assert mock_save.call_count == 1
+
+    def test_matching_sensors_skip_daily_counts(self, mock_count, mock_save):
+        from src.reconciliation import reconcile_project
+
+        sensor = FakeSensorRef("s1", {date(2024, 1, 1): 3, date(2024, 1, 2): 3})
+        db_counts = {("s1", date(2024, 1, 1)): 3, ("s1", date(2024, 1, 2)): 3}
+
+        with patch('src.reconciliation.get_daily_reading_counts', return_value=db_counts):
+            resynced = reconcile_project(
+                make_client([sensor]), "project_a",
+                datetime(2024, 1, 1, tzinfo=timezone.utc), datetime(2024, 1, 2, tzinfo=timezone.utc),
+            )
+
+        assert resynced == 0
+        assert mock_count.call_count == 1
+        mock_save.assert_not_called()
+
+    def test_rejected_documents_are_resynced_once(self, mock_count, mock_save):
+        from src.reconciliation import reconcile_project
+
+        # Two documents of Jan 2 have no numeric metrics, and the sensor document id is not the parsed id
+        sensor = FakeSensorRef("gateway-7", {date(2024, 1, 1): 10, date(2024, 1, 2): 10})
+        db_counts = {("s1", date(2024, 1, 1)): 10, ("s1", date(2024, 1, 2)): 8}
+        start, end = datetime(2024, 1, 1, tzinfo=timezone.utc), datetime(2024, 1, 2, 12, tzinfo=timezone.utc)
+
+        with patch('src.reconciliation.get_daily_reading_counts', return_value=db_counts):
+            first = reconcile_project(make_client([sensor]), "project_a", start, end)
+            second = reconcile_project(make_client([sensor]), "project_a", start, end)
+            sensor.daily_counts[date(2024, 1, 2)] = 11
+            third = reconcile_project(make_client([sensor]), "project_a", start, end)
+
+        assert (first, second, third) == (2, 0, 1)
+        assert sensor.streamed == [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 2)]
+
+    def test_nothing_to_reconcile_without_synced_data(self, mock_count, mock_save):
+        from src.reconciliation import reconcile_project
+
+        with patch('src.reconciliation.get_oldest_timestamp_from_db', return_value=None), \
+             patch('src.reconciliation.get_newest_timestamp_from_db', return_value=None):
+            assert reconcile_project(make_client([]), "project_a") == 0
+
+
+class TestReconcileJob:
+
+    def test_locked_projects_fail_the_job(self):
+        from contextlib import contextmanager
+        from sqlalchemy import create_engine
+        from sqlalchemy.pool import StaticPool
+        from src.db import Base, create_sync_job, get_sync_job
+        from src.reconciliation import reconcile_firestore_to_timescale
+
+        @contextmanager
+        def lock(pid):
+            yield pid != "project_b"
+
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(engine)
+        with patch('src.db.get_engine', return_value=engine), \
+             patch('src.reconciliation.get_firestore_client'), \
+             patch('src.reconciliation.project_sync_lock', side_effect=lock), \
+             patch('src.reconciliation.reconcile_project') as mock_reconcile:
+            job, _ = create_sync_job("reconcile")
+            reconcile_firestore_to_timescale(job["job_id"], ["project_a", "project_b"])
+            stored = get_sync_job(job["job_id"])
+
+        assert stored["state"] == "failed"
+        assert stored["error"] == "Skipped projects being synced by another job: project_b"
+        assert [c.args[1] for c in mock_reconcile.call_args_list] == ["project_a"]
+
+
+class TestDayRange:
+
+    def test_day_range_uses_utc_days(self):
+        from src.reconciliation import day_range
+
+        days = day_range(datetime(2024, 1, 1, 23, tzinfo=timezone.utc), datetime(2024, 1, 3, 1, tzinfo=timezone.utc))
+
+        assert days == [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)]
+
+
+def test_daily_reading_counts_from_db():
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import StaticPool
+    from src.db import Base, get_daily_reading_counts
+
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    rows = [
+        {"timestamp": datetime(2024, 1, 1, h), "sensor_id": "s1", "metric_name": m,
+         "metric_value": "1", "project_id": "project_a"}
+        for h in (1, 2) for m in ("temp", "hum")
+    ] + [
+        {"timestamp": datetime(2024, 1, 2, 5), "sensor_id": "s1", "metric_name": "temp",
+         "metric_value": "1", "project_id": "project_a"},
+        {"timestamp": datetime(2024, 1, 2, 5), "sensor_id": "s2", "metric_name": "temp",
+         "metric_value": "1", "project_id": "project_b"},
+    ]
+    with engine.begin() as conn:
+        conn.execute(Base.metadata.tables["sensor_data"].insert(), rows)
+
+    with patch('src.db.get_engine', return_value=engine):
+        counts = get_daily_reading_counts("project_a")
+
+    assert counts == {("s1", date(2024, 1, 1)): 2, ("s1", date(2024, 1, 2)): 1}
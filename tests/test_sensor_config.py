@@ -0,0 +1,455 @@
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import Mock, MagicMock, patch
+
+
+def make_unconfigured_docs(count):
+    docs = []
+    for i in range(count):
+        doc = Mock()
+        doc.id = f"reading{i:05d}"
+        doc.reference = f"source/{i}"
+        doc.to_dict.return_value = {
+            "raw_data": {"ts": 1700000000 + i, "t": 21.5, "h": 40, "mac": "AA:BB"},
+            "received_at": None,
+        }
+        docs.append(doc)
+    return docs
+
+
+@pytest.fixture
+def fake_client():
+    """Firestore client whose batches record their writes"""
+    client = MagicMock()
+    client.committed = []
+
+    def new_batch():
+        batch = Mock()
+        batch.writes = []
+        batch.set.side_effect = lambda ref, data, **kwargs: batch.writes.append(("set", ref, data))
+        batch.delete.side_effect = lambda ref: batch.writes.append(("delete", ref))
+        batch.commit.side_effect = lambda: client.committed.append(batch.writes)
+        return batch
+
+    client.batch.side_effect = new_batch
+    client.collection.return_value.document.return_value.collection.return_value \
+        .document.return_value.collection.return_value.document.side_effect = lambda doc_id: f"target/{doc_id}"
+
+    with patch('src.sensor_config.require_firestore_client', return_value=client), \
+         patch('src.sensor_config.insert_sensor_rows') as mock_insert:
+        client.inserted = mock_insert
+        yield client
+
+
+def set_source_docs(client, docs):
+    client.collection.return_value.document.return_value.collection.return_value.stream.return_value = iter(docs)
+
+
+class TestTriggerBackfill:
+
+    def test_moves_are_committed_in_batches(self, fake_client):
+        from src.sensor_config import trigger_backfill
+
+        set_source_docs(fake_client, make_unconfigured_docs(12))
+
+        with patch('src.sensor_config.BACKFILL_BATCH_SIZE', 5):
+            moved = trigger_backfill("AA:BB", {"project_id": "p", "mapping": {"t": "temperature"}, "ts_field": "ts"})
+
+        assert moved == 12
+        assert sorted(len(writes) for writes in fake_client.committed) == [4, 10, 10]
+
+    def test_copy_and_delete_share_a_batch(self, fake_client):
+        from src.sensor_config import trigger_backfill
+
+        set_source_docs(fake_client, make_unconfigured_docs(3))
+        trigger_backfill("AA:BB", {"project_id": "p", "mapping": {"t": "temperature"}, "ts_field": "ts"})
+
+        writes = fake_client.committed[0]
+        assert [w[0] for w in writes] == ["set", "delete"] * 3
+        _, target, data = writes[0]
+        assert target.startswith("target/")
+        assert data["measurements"] == {"temperature": 21.5}
+        assert data["extra"] == {"h": 40}
+        assert writes[1] == ("delete", "source/0")
+
+    def test_moved_readings_are_written_to_timescale(self, fake_client):
+        from src.sensor_config import trigger_backfill
+
+        set_source_docs(fake_client, make_unconfigured_docs(4))
+
+        with patch('src.sensor_config.BACKFILL_BATCH_SIZE', 2):
+            trigger_backfill("AA:BB", {"project_id": "p", "mapping": {"t": "temperature", "h": "humidity"},
+                                       "ts_field": "ts"})
+
+        rows = [row for c in fake_client.inserted.call_args_list for row in c.args[0]]
+        assert fake_client.inserted.call_count == 2
+        assert len(rows) == 8
+        assert {row["metric_name"] for row in rows} == {"temperature", "humidity"}
+        assert {row["sensor_id"] for row in rows} == {"AABB"}
+        assert {row["project_id"] for row in rows} == {"p"}
+
+    def test_backfill_uses_parser_decoding(self, fake_client):
+        from src.sensor_config import trigger_backfill
+
+        set_source_docs(fake_client, make_unconfigured_docs(2))
+        trigger_backfill("AA:BB", {"project_id": "p", "mapping": {"h": "humidity"}, "ts_field": "ts",
+                                   "decoders": {"h": "scale:0.01"}})
+
+        _, _, data = fake_client.committed[0][0]
+        assert data["measurements"] == {"humidity": 0.4}
+        assert data["timestamp"] == datetime.fromtimestamp(1700000000, tz=timezone.utc)
+        rows = fake_client.inserted.call_args.args[0]
+        assert [row["metric_value"] for row in rows] == ["0.4", "0.4"]
+
+    def test_empty_mapping_writes_no_rows(self, fake_client):
+        from src.sensor_config import trigger_backfill
+
+        set_source_docs(fake_client, make_unconfigured_docs(2))
+        moved = trigger_backfill("AA:BB", {"project_id": "p", "mapping": {}, "ts_field": "ts"})
+
+        assert moved == 2
+        fake_client.inserted.assert_not_called()
+
+    def test_only_mapped_metrics_are_written(self, fake_client):
+        from src.sensor_config import trigger_backfill
+
+        set_source_docs(fake_client, make_unconfigured_docs(2))
+        trigger_backfill("AA:BB", {"project_id": "p", "mapping": {"t": "temperature"}, "ts_field": "ts"})
+
+        rows = fake_client.inserted.call_args.args[0]
+        assert [row["metric_name"] for row in rows] == ["temperature", "temperature"]
+
+    def test_rows_written_before_batch_fails(self, fake_client):
+        from src.sensor_config import trigger_backfill
+
+        set_source_docs(fake_client, make_unconfigured_docs(2))
+        failing = Mock()
+        failing.commit.side_effect = Exception("Unavailable")
+        fake_client.batch.side_effect = None
+        fake_client.batch.return_value = failing
+
+        with patch('src.sensor_config.BACKFILL_RETRY_DELAY', 0), pytest.raises(Exception):
+            trigger_backfill("AA:BB", {"project_id": "p", "mapping": {"t": "temperature"}, "ts_field": "ts"})
+
+        fake_client.inserted.assert_called_once()
+
+    def test_sources_kept_when_insert_fails(self, fake_client):
+        from src.sensor_config import trigger_backfill
+
+        set_source_docs(fake_client, make_unconfigured_docs(2))
+        fake_client.inserted.side_effect = Exception("Database unavailable")
+
+        with pytest.raises(Exception, match="Database unavailable"):
+            trigger_backfill("AA:BB", {"project_id": "p", "mapping": {"t": "temperature"}, "ts_field": "ts"})
+
+        assert fake_client.committed == []
+
+    def test_failed_batch_is_retried(self, fake_client):
+        from src.sensor_config import trigger_backfill
+
+        set_source_docs(fake_client, make_unconfigured_docs(2))
+        original = fake_client.batch.side_effect
+        attempts = []
+
+        def flaky_batch():
+            batch = original()
+            if not attempts:
+                batch.commit.side_effect = Exception("Deadline exceeded")
+            attempts.append(batch)
+            return batch
+
+        fake_client.batch.side_effect = flaky_batch
+
+        with patch('src.sensor_config.BACKFILL_RETRY_DELAY', 0):
+            moved = trigger_backfill("AA:BB", {"project_id": "p", "mapping": {}, "ts_field": "ts"})
+
+        assert moved == 2
+        assert len(attempts) == 2
+
+    def test_exhausted_retries_raise(self, fake_client):
+        from src.sensor_config import trigger_backfill
+
+        set_source_docs(fake_client, make_unconfigured_docs(2))
+        failing = Mock()
+        failing.commit.side_effect = Exception("Unavailable")
+        fake_client.batch.side_effect = None
+        fake_client.batch.return_value = failing
+
+        with patch('src.sensor_config.BACKFILL_RETRY_DELAY', 0), pytest.raises(Exception, match="Unavailable"):
+            trigger_backfill("AA:BB", {"project_id": "p", "mapping": {}, "ts_field": "ts"})
+
+        assert failing.commit.call_count == 3
+
+
+@pytest.fixture
+def job_engine():
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import StaticPool
+    from src.db import Base
+    from src.utils import sync_jobs
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with patch("src.db.get_engine", return_value=engine):
+        yield engine
+    # Jobs the tests queued but never started
+    sync_jobs._queued_jobs.clear()
+
+
+class TestBackfillJobs:
+
+    def test_backfill_job_reports_moved_and_remaining(self, fake_client, job_engine):
+        from src.db import create_sync_job
+        from src.sensor_config import run_backfill_job, get_backfill_status
+
+        set_source_docs(fake_client, make_unconfigured_docs(7))
+        job, _ = create_sync_job("backfill", ["AA:BB"])
+
+        with patch('src.sensor_config.count_unconfigured_readings', return_value=10):
+            run_backfill_job(job["job_id"], "AA:BB", {"project_id": "p", "mapping": {"t": "temperature"},
+                                                      "ts_field": "ts"})
+
+        status = get_backfill_status(job["job_id"])
+        assert status["state"] == "success"
+        assert status["moved"] == 7
+        assert status["remaining"] == 3
+        assert status["rows_written"] == 7
+
+    def test_failed_backfill_records_error(self, fake_client, job_engine):
+        from src.db import create_sync_job
+        from src.sensor_config import run_backfill_job, get_backfill_status
+
+        fake_client.collection.return_value.document.return_value.collection.return_value \
+            .stream.side_effect = Exception("Permission denied")
+        job, _ = create_sync_job("backfill", ["AA:BB"])
+
+        with patch('src.sensor_config.count_unconfigured_readings', return_value=None):
+            run_backfill_job(job["job_id"], "AA:BB", {"project_id": "p", "mapping": {}, "ts_field": "ts"})
+
+        status = get_backfill_status(job["job_id"])
+        assert status["state"] == "failed"
+        assert status["error"] == "Permission denied"
+        assert status["remaining"] is None
+
+    def test_one_backfill_per_sensor(self, job_engine):
+        from src.sensor_config import start_backfill_job
+
+        with patch('src.sensor_config._backfill_jobs') as mock_pool:
+            first = start_backfill_job("AA:BB", {"project_id": "p"})
+            second = start_backfill_job("AA:BB", {"project_id": "p"})
+            other = start_backfill_job("CC:DD", {"project_id": "p"})
+
+        assert second["job_id"] == first["job_id"]
+        assert other["job_id"] != first["job_id"]
+        assert mock_pool.submit.call_count == 2
+
+
+class TestConfigCache:
+
+    def test_config_is_read_once(self, fake_client):
+        from src.sensor_config import get_sensor_config
+
+        doc = fake_client.collection.return_value.document.return_value.get.return_value
+        doc.exists = True
+        doc.to_dict.return_value = {"project_id": "p", "mapping": {"t": "temperature"}}
+
+        first = get_sensor_config("AA:BB")
+        first["mapping"]["t"] = "changed"
+        second = get_sensor_config("AA:BB")
+
+        assert second == {"project_id": "p", "mapping": {"t": "temperature"}}
+        assert fake_client.collection.return_value.document.return_value.get.call_count == 1
+
+    def test_missing_config_is_cached(self, fake_client):
+        from src.sensor_config import get_sensor_config
+
+        fake_client.collection.return_value.document.return_value.get.return_value.exists = False
+
+        assert get_sensor_config("AA:BB") is None
+        assert get_sensor_config("AA:BB") is None
+        assert fake_client.collection.return_value.document.return_value.get.call_count == 1
+
+    def test_lookup_reads_the_cache_once(self, fake_client):
+        from src.sensor_config import get_sensor_config, _config_cache
+
+        fake_client.collection.return_value.document.return_value.get.return_value.exists = False
+        hits, misses = _config_cache.hits, _config_cache.misses
+
+        get_sensor_config("AA:BB")
+        get_sensor_config("AA:BB")
+
+        assert (_config_cache.hits - hits, _config_cache.misses - misses) == (1, 1)
+
+    def test_failed_read_is_not_cached(self, fake_client):
+        from src.sensor_config import get_sensor_config
+
+        get = fake_client.collection.return_value.document.return_value.get
+        get.side_effect = [Exception("unavailable"), Mock(exists=True, to_dict=Mock(return_value={"a": 1}))]
+
+        assert get_sensor_config("AA:BB") is None
+        assert get_sensor_config("AA:BB") == {"a": 1}
+
+    @pytest.mark.parametrize("write", ["update", "delete"])
+    def test_writes_invalidate_config(self, fake_client, write):
+        from src.sensor_config import get_sensor_config, update_sensor_config, delete_sensor_config
+
+        get = fake_client.collection.return_value.document.return_value.get
+        get.return_value.exists = True
+        get.return_value.to_dict.return_value = {"project_id": "old"}
+        get_sensor_config("AA:BB")
+
+        if write == "update":
+            update_sensor_config("AA:BB", {"project_id": "new"})
+        else:
+            delete_sensor_config("AA:BB")
+        get_sensor_config("AA:BB")
+
+        assert get.call_count == 2
+
+    def test_expired_config_is_reloaded(self, fake_client):
+        from src.sensor_config import get_sensor_config, _config_cache
+
+        get = fake_client.collection.return_value.document.return_value.get
+        get.return_value.exists = False
+
+        with patch('src.utils.cache.time.monotonic', return_value=1000.0):
+            get_sensor_config("AA:BB")
+        with patch('src.utils.cache.time.monotonic', return_value=1000.0 + _config_cache.ttl + 1):
+            get_sensor_config("AA:BB")
+
+        assert get.call_count == 2
+
+    def test_unconfigured_listing_is_cached_until_config_changes(self, fake_client):
+        from src.sensor_config import get_unconfigured_sensor_ids_from_firestore, update_sensor_config
+
+        list_documents = fake_client.collection.return_value.list_documents
+        list_documents.return_value = [Mock(id="AA:BB"), Mock(id="CC:DD")]
+
+        assert get_unconfigured_sensor_ids_from_firestore() == ["AA:BB", "CC:DD"]
+        assert get_unconfigured_sensor_ids_from_firestore() == ["AA:BB", "CC:DD"]
+        assert list_documents.call_count == 1
+
+        update_sensor_config("AA:BB", {"project_id": "p"})
+        get_unconfigured_sensor_ids_from_firestore()
+        assert list_documents.call_count == 2
+
+    def test_warm_up_loads_all_configs(self, fake_client):
+        from src.sensor_config import warm_sensor_config_cache, get_sensor_config
+
+        fake_client.collection.return_value.stream.return_value = [
+            Mock(id="AA:BB", to_dict=Mock(return_value={"project_id": "p1"})),
+            Mock(id="CC:DD", to_dict=Mock(return_value={"project_id": "p2"})),
+        ]
+
+        assert warm_sensor_config_cache() == 2
+        assert get_sensor_config("CC:DD") == {"project_id": "p2"}
+        fake_client.collection.return_value.document.return_value.get.assert_not_called()
+
+
+class TestTTLCache:
+
+    def test_least_recently_used_is_evicted(self):
+        from src.utils.cache import TTLCache
+
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert "a" in cache and "c" in cache
+        assert "b" not in cache
+        assert len(cache) == 2
+
+
+class TestBulkOnboarding:
+
+    def test_configs_are_written_in_batches(self, fake_client):
+        from src.sensor_config import update_sensor_configs
+
+        configs = {f"S{i}": {"project_id": "p"} for i in range(7)}
+        with patch('src.sensor_config.CONFIG_BATCH_SIZE', 3):
+            errors = update_sensor_configs(configs)
+
+        assert errors == {sensor_id: None for sensor_id in configs}
+        assert fake_client.batch.call_count == 3
+
+    def test_failed_config_batch_is_reported_per_sensor(self, fake_client):
+        from src.sensor_config import update_sensor_configs
+
+        batches = [Mock(), Mock()]
+        batches[1].commit.side_effect = Exception("Deadline exceeded")
+        fake_client.batch.side_effect = batches
+
+        with patch('src.sensor_config.CONFIG_BATCH_SIZE', 2):
+            errors = update_sensor_configs({"S0": {}, "S1": {}, "S2": {}})
+
+        assert errors == {"S0": None, "S1": None, "S2": "Deadline exceeded"}
+
+    def test_backfills_respect_concurrency_limit(self, job_engine):
+        import threading
+        import time
+        from src.sensor_config import start_backfill_jobs
+
+        running, peak, lock = [0], [0], threading.Lock()
+        done = threading.Event()
+        finished = []
+
+        def fake_run(job_id, sensor_id, config):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+                finished.append(sensor_id)
+                if len(finished) == 6:
+                    done.set()
+
+        with patch('src.sensor_config.run_backfill_job', side_effect=fake_run):
+            jobs = start_backfill_jobs({f"S{i}": {"project_id": "p"} for i in range(6)}, max_concurrent=2)
+            assert done.wait(5)
+
+        assert len({job["job_id"] for job in jobs.values()}) == 6
+        assert peak[0] == 2
+
+    def test_backfills_share_the_backfill_executor(self, job_engine):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from src.sensor_config import start_backfill_jobs
+
+        threads = set()
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared") as pool, \
+                patch('src.sensor_config._backfill_jobs', pool), \
+                patch('src.sensor_config.run_backfill_job',
+                      side_effect=lambda *args: threads.add(threading.current_thread().name)):
+            start_backfill_jobs({f"S{i}": {"project_id": "p"} for i in range(4)}, max_concurrent=4)
+
+        assert len(threads) == 1
+        assert threads.pop().startswith("shared")
+
+    def test_metadata_is_upserted(self, job_engine):
+        from src.db import upsert_sensor_metadata, get_all_sensor_metadata
+
+        upsert_sensor_metadata([
+            {"sensor_id": "S0", "project_id": "p", "description": "old", "latitude": 1.0, "longitude": 2.0},
+        ])
+        upsert_sensor_metadata([
+            {"sensor_id": "S0", "project_id": "p", "description": "new", "latitude": 1.0, "longitude": 2.0},
+            {"sensor_id": "S1", "project_id": "p", "description": None, "latitude": 3.0, "longitude": 4.0},
+        ])
+
+        metadata = {row["sensor_id"]: row for row in get_all_sensor_metadata()}
+        assert metadata["S0"]["description"] == "new"
+        assert set(metadata) == {"S0", "S1"}
+
+    def test_saved_configs_update_parser_mappings(self, fake_client):
+        from src.sensor_config import update_sensor_configs, delete_sensor_config
+        from src.sensor_mappings import SENSOR_MAPPINGS
+
+        update_sensor_configs({"AA:BB": {"project_id": "p", "mapping": {"t": "temperature"}, "ts_field": "ts"}})
+        assert SENSOR_MAPPINGS.get("AABB") is not None
+
+        delete_sensor_config("AA:BB")
+        assert SENSOR_MAPPINGS.get("AABB") is None
@@ -0,0 +1,139 @@
+import random
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, MagicMock, patch
+
+import pytest
+
+BASE_TIME = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+class FakeUnconfiguredReadings:
+    """`readings` subcollection supporting the received_at filter and ordering used by the refresh"""
+
+    def __init__(self, readings, after=None):
+        self.readings = readings
+        self.after = after
+        self.streamed = 0
+
+    def where(self, filter):
+        field, op, value = filter
+        assert (field, op) == ("received_at", ">")
+        query = FakeUnconfiguredReadings(self.readings, value)
+        query.parent = self
+        return query
+
+    def order_by(self, field):
+        assert field == "received_at"
+        return self
+
+    def stream(self):
+        root = getattr(self, "parent", self)
+        for reading in sorted(self.readings, key=lambda r: r["received_at"]):
+            if self.after is None or reading["received_at"] > self.after:
+                root.streamed += 1
+                yield Mock(to_dict=Mock(return_value=reading))
+
+
+def make_reading(minute, **payload):
+    return {"raw_data": payload or {"t": minute, "mac": "AA:BB"}, "received_at": BASE_TIME + timedelta(minutes=minute)}
+
+
+@pytest.fixture
+def discovery_engine():
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import StaticPool
+    from src.db import Base
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with patch("src.db.get_engine", return_value=engine), \
+         patch("src.sensor_discovery.FieldFilter", side_effect=lambda field, op, value: (field, op, value)):
+        yield engine
+
+
+def fake_client_for(readings_by_sensor):
+    client = MagicMock()
+    client.collection.return_value.document.side_effect = \
+        lambda sensor_id: Mock(collection=Mock(return_value=readings_by_sensor[sensor_id]))
+    return client
+
+
+class TestMergeReadings:
+
+    def test_counts_seen_range_and_keys(self):
+        from src.sensor_discovery import empty_summary, merge_readings
+
+        summary = merge_readings(empty_summary("AA:BB"), [
+            make_reading(5, t=1, mac="AA:BB"),
+            make_reading(1, h=40, mac="AA:BB"),
+        ])
+
+        assert summary["reading_count"] == 2
+        assert summary["first_seen"] == BASE_TIME + timedelta(minutes=1)
+        assert summary["last_seen"] == BASE_TIME + timedelta(minutes=5)
+        assert summary["raw_keys"] == ["h", "mac", "t"]
+
+    def test_sample_is_bounded(self):
+        from src.sensor_discovery import empty_summary, merge_readings, SUMMARY_SAMPLE_SIZE
+
+        summary = merge_readings(empty_summary("AA:BB"), [make_reading(i) for i in range(100)], rng=random.Random(1))
+
+        assert summary["reading_count"] == 100
+        assert len(summary["sample"]) == SUMMARY_SAMPLE_SIZE
+
+    def test_sample_is_uniform_over_merges(self):
+        from src.sensor_discovery import empty_summary, merge_readings
+
+        # Readings arriving in later refreshes must get the same chance of being sampled
+        rng = random.Random(7)
+        late_hits = 0
+        for _ in range(2000):
+            summary = merge_readings(empty_summary("AA:BB"), [make_reading(i, n=i) for i in range(10)], rng)
+            summary = merge_readings(summary, [make_reading(i, n=i) for i in range(10, 20)], rng)
+            late_hits += sum(1 for payload in summary["sample"] if payload["n"] >= 10)
+
+        share = late_hits / (2000 * len(summary["sample"]))
+        assert 0.45 < share < 0.55
+
+
+class TestRefreshSummaries:
+
+    def test_refresh_only_reads_new_readings(self, discovery_engine):
+        from src.sensor_discovery import refresh_sensor_summary
+
+        readings = FakeUnconfiguredReadings([make_reading(i) for i in range(3)])
+        client = fake_client_for({"AA:BB": readings})
+
+        refresh_sensor_summary(client, "AA:BB")
+        readings.readings.extend(make_reading(i) for i in range(3, 5))
+        summary = refresh_sensor_summary(client, "AA:BB")
+
+        assert summary["reading_count"] == 5
+        assert readings.streamed == 5
+        assert summary["last_seen"] == BASE_TIME + timedelta(minutes=4)
+
+    def test_summaries_of_configured_sensors_are_dropped(self, discovery_engine):
+        from src.db import get_unconfigured_sensor_summaries
+        from src.sensor_discovery import refresh_discovery_summaries
+
+        client = fake_client_for({
+            "AA:BB": FakeUnconfiguredReadings([make_reading(1)]),
+            "CC:DD": FakeUnconfiguredReadings([make_reading(2)]),
+        })
+
+        with patch("src.sensor_discovery.get_unconfigured_sensor_ids_from_firestore", return_value=["AA:BB", "CC:DD"]):
+            refresh_discovery_summaries(client)
+        with patch("src.sensor_discovery.get_unconfigured_sensor_ids_from_firestore", return_value=["CC:DD"]):
+            refresh_discovery_summaries(client)
+
+        assert [s["sensor_id"] for s in get_unconfigured_sensor_summaries()] == ["CC:DD"]
+
+    def test_unsummarized_sensors_are_listed_empty(self, discovery_engine):
+        from src.sensor_discovery import refresh_sensor_summary, get_discovery_summaries
+
+        refresh_sensor_summary(fake_client_for({"AA:BB": FakeUnconfiguredReadings([make_reading(1)])}), "AA:BB")
+
+        with patch("src.sensor_discovery.get_unconfigured_sensor_ids_from_firestore", return_value=["AA:BB", "EE:FF"]):
+            summaries = get_discovery_summaries()
+
+        assert [(s["sensor_id"], s["reading_count"]) for s in summaries] == [("AA:BB", 1), ("EE:FF", 0)]
@@ -0,0 +1,155 @@
+import random
+from unittest.mock import patch
+
+import pytest
+
+from src.utils import geohash
+
+SENSORS = {
+    # Helsinki centre
+    "AA01": (60.1699, 24.9384),
+    "AA02": (60.1702, 24.9390),
+    "AA03": (60.1710, 24.9410),
+    # Espoo
+    "BB01": (60.2055, 24.6559),
+    # Tampere
+    "CC01": (61.4978, 23.7610),
+    # Either side of the antimeridian
+    "DD01": (-16.5, 179.9),
+    "DD02": (-16.5, -179.9),
+}
+
+
+@pytest.fixture
+def map_engine():
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import StaticPool
+    from src.db import Base, upsert_sensor_metadata
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with patch("src.db.get_engine", return_value=engine):
+        upsert_sensor_metadata([
+            {"sensor_id": sensor_id, "latitude": lat, "longitude": lon, "project_id": sensor_id[:2]}
+            for sensor_id, (lat, lon) in SENSORS.items()
+        ])
+        yield engine
+
+
+class TestGeohash:
+
+    def test_encode(self):
+        assert geohash.encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+    def test_shorter_hash_is_prefix(self):
+        for _ in range(200):
+            lat, lon = random.uniform(-90, 90), random.uniform(-180, 180)
+            assert geohash.encode(lat, lon).startswith(geohash.encode(lat, lon, 6))
+
+    def test_cover_contains_every_point_in_box(self):
+        box = (60.15, 24.90, 60.25, 25.10)
+        prefixes = geohash.cover(*box)
+
+        assert 1 <= len(prefixes) <= 32
+        for _ in range(500):
+            point = geohash.encode(random.uniform(box[0], box[2]), random.uniform(box[1], box[3]))
+            assert any(point.startswith(prefix) for prefix in prefixes)
+
+    def test_prefix_ranges_merge_neighbours(self):
+        assert geohash.prefix_ranges(["u4", "u5", "u7"]) == [("u4", "u6"), ("u7", "u8")]
+        assert geohash.prefix_ranges(["zz"]) == [("zz", None)]
+
+    def test_precision_grows_with_zoom(self):
+        precisions = [geohash.precision_for_zoom(zoom) for zoom in range(0, 22)]
+
+        assert precisions == sorted(precisions)
+        assert precisions[0] == 1
+
+
+class TestBoundingBox:
+
+    def test_sensors_in_box(self, map_engine):
+        from src.db import get_sensors_in_bbox
+
+        rows = get_sensors_in_bbox(60.0, 24.5, 60.5, 25.5)
+
+        assert sorted(row["sensor_id"] for row in rows) == ["AA01", "AA02", "AA03", "BB01"]
+
+    def test_project_filter_and_limit(self, map_engine):
+        from src.db import get_sensors_in_bbox
+
+        assert len(get_sensors_in_bbox(60.0, 24.5, 60.5, 25.5, project_id="AA")) == 3
+        assert len(get_sensors_in_bbox(60.0, 24.5, 60.5, 25.5, limit=2)) == 2
+
+    def test_box_crossing_antimeridian(self, map_engine):
+        from src.db import get_sensors_in_bbox
+
+        rows = get_sensors_in_bbox(-17, 179, -16, -179)
+
+        assert sorted(row["sensor_id"] for row in rows) == ["DD01", "DD02"]
+
+    def test_clusters(self, map_engine):
+        from src.db import cluster_sensors_in_bbox
+
+        cells = cluster_sensors_in_bbox(59, 23, 62, 26, precision=5)
+        by_count = sorted(cells, key=lambda cell: cell["count"])
+
+        assert [cell["count"] for cell in by_count] == [1, 1, 3]
+        assert {cell["sensor_id"] for cell in by_count[:2]} == {"BB01", "CC01"}
+        assert by_count[2]["sensor_id"] is None
+        assert by_count[2]["latitude"] == pytest.approx(60.1704, abs=1e-3)
+
+    def test_backfill_fills_missing_geohash(self, map_engine):
+        from sqlalchemy.orm import Session
+        from src.db import SensorMetadata, backfill_sensor_geohashes
+
+        with Session(map_engine) as session:
+            session.query(SensorMetadata).update({SensorMetadata.geohash: None})
+            session.commit()
+
+        assert backfill_sensor_geohashes() == len(SENSORS)
+        with Session(map_engine) as session:
+            assert session.get(SensorMetadata, "AA01").geohash == geohash.encode(*SENSORS["AA01"])
+
+
+class TestMapEndpoint:
+
+    @pytest.fixture
+    def client(self, map_engine):
+        import os
+        os.environ.setdefault("VITE_AUTH0_DOMAIN", "test.auth0.com")
+        os.environ.setdefault("VITE_AUTH0_AUDIENCE", "test-audience")
+        from fastapi.testclient import TestClient
+        from src.normalizer_api import app
+        from src.dependencies import get_auth_claims
+
+        app.dependency_overrides[get_auth_claims] = lambda: {"sub": "test"}
+        yield TestClient(app)
+        app.dependency_overrides.pop(get_auth_claims, None)
+
+    def test_low_zoom_clusters(self, client):
+        response = client.get("/api/sensors/map", params={
+            "min_lat": 59, "min_lon": 23, "max_lat": 62, "max_lon": 26, "zoom": 11,
+        })
+        data = response.json()["data"]
+
+        assert response.status_code == 200
+        assert [cluster["count"] for cluster in data["clusters"]] == [3]
+        assert sorted(sensor["sensor_id"] for sensor in data["sensors"]) == ["BB01", "CC01"]
+
+    def test_high_zoom_lists_sensors(self, client):
+        response = client.get("/api/sensors/map", params={
+            "min_lat": 60.16, "min_lon": 24.93, "max_lat": 60.18, "max_lon": 24.95, "zoom": 18,
+        })
+        data = response.json()["data"]
+
+        assert data["clusters"] == []
+        assert [sensor["sensor_id"] for sensor in data["sensors"]] == ["AA01", "AA02", "AA03"]
+        assert data["truncated"] is False
+
+    def test_invalid_box(self, client):
+        response = client.get("/api/sensors/map", params={
+            "min_lat": 61, "min_lon": 23, "max_lat": 60, "max_lon": 26,
+        })
+
+        assert response.status_code == 400
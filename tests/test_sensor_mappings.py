@@ -0,0 +1,119 @@
+from datetime import datetime, timezone
+from unittest.mock import Mock, MagicMock
+
+import pytest
+
+from src.sensor_mappings import MappingRegistry, SensorMapping, SENSOR_MAPPINGS, refresh_sensor_mappings
+from src.SensorDataParser import SensorDataParser
+
+CONFIG = {"project_id": "p", "mapping": {"t": "temperature", "h": "humidity"}, "ts_field": "ts"}
+
+
+@pytest.fixture
+def registry():
+    registry = MappingRegistry()
+    registry.set("AA:BB:CC", CONFIG)
+    return registry
+
+
+class TestSensorMapping:
+
+    def test_unknown_decoder_is_rejected(self):
+        with pytest.raises(ValueError):
+            SensorMapping({"t": "temperature"}, decoders={"t": "celsius"})
+
+    def test_decoders_are_applied(self):
+        mapping = SensorMapping({"t": "temperature", "on": "relay"}, decoders={"t": "scale:0.01", "on": "bool"})
+
+        assert mapping.measurements({"t": 2150, "on": "true"}) == {"temperature": 21.5, "relay": True}
+
+    def test_undecodable_values_are_skipped(self):
+        mapping = SensorMapping({"t": "temperature", "h": "humidity"}, decoders={"t": "float"})
+
+        assert mapping.measurements({"t": "n/a", "h": 40}) == {"humidity": 40}
+
+    def test_extra_excludes_mapped_and_id_fields(self):
+        mapping = SensorMapping({"t": "temperature"})
+
+        assert mapping.extra({"t": 1, "ts": 2, "mac": "AA", "rssi": -70}) == {"rssi": -70}
+
+
+class TestMappingAwareParser:
+
+    def test_mapped_keys_become_clean_metrics(self, registry):
+        parser = SensorDataParser("p", mappings=registry)
+
+        rows = parser.process_raw_sensor_data({"mac": "AA:BB:CC", "ts": 1700000000, "t": 21.5, "h": 40, "rssi": -70})
+
+        assert {(r["metric_name"], r["metric_value"]) for r in rows} == {("temperature", "21.5"), ("humidity", "40.0")}
+        assert all(r["sensor_id"] == "AABBCC" for r in rows)
+        assert rows[0]["timestamp"] == datetime.fromtimestamp(1700000000, tz=timezone.utc)
+
+    def test_unmapped_sensor_uses_field_detection(self, registry):
+        parser = SensorDataParser("p", mappings=registry)
+
+        rows = parser.process_raw_sensor_data({"mac": "DD:EE", "ts": 1700000000, "t": 21.5})
+
+        assert [r["metric_name"] for r in rows] == ["t"]
+
+    def test_normalized_documents_are_not_remapped(self, registry):
+        parser = SensorDataParser("p", mappings=registry)
+
+        rows = parser.process_raw_sensor_data({
+            "sensor_id": "AA:BB:CC", "timestamp": datetime(2024, 1, 1, tzinfo=timezone.utc),
+            "measurements": {"temperature": 20.0},
+        })
+
+        assert [r["metric_name"] for r in rows] == ["temperature"]
+
+    def test_backfilled_bookkeeping_fields_are_not_metrics(self, registry):
+        parser = SensorDataParser("p", mappings=registry)
+        backfilled = {"sensor_id": "AA:BB:CC", "timestamp": datetime(2024, 1, 1, tzinfo=timezone.utc),
+                      "extra": {"h": 40}, "backfilled": True, "original_received_at": None}
+
+        rows = parser.process_raw_sensor_data({**backfilled, "measurements": {"temperature": 20.0}})
+        empty = parser.process_raw_sensor_data({**backfilled, "measurements": {}})
+
+        assert [r["metric_name"] for r in rows] == ["temperature"]
+        assert empty == []
+
+    def test_epoch_string_timestamp(self, registry):
+        parser = SensorDataParser("p", mappings=registry)
+
+        rows = parser.process_raw_sensor_data({"mac": "AA:BB:CC", "ts": "1700000000", "t": 1})
+
+        assert rows[0]["timestamp"] == datetime.fromtimestamp(1700000000, tz=timezone.utc)
+
+    def test_shared_registry_is_the_default(self):
+        SENSOR_MAPPINGS.set("AA:BB:CC", CONFIG)
+
+        rows = SensorDataParser("p").process_raw_sensor_data({"mac": "AA:BB:CC", "ts": 1700000000, "t": 1})
+
+        assert [r["metric_name"] for r in rows] == ["temperature"]
+
+
+class TestRefresh:
+
+    def test_refresh_replaces_all_mappings(self):
+        SENSOR_MAPPINGS.set("OLD", CONFIG)
+        client = MagicMock()
+        client.collection.return_value.stream.return_value = [
+            Mock(id="AA:BB", to_dict=Mock(return_value=CONFIG)),
+            Mock(id="CC:DD", to_dict=Mock(return_value={"project_id": "p"})),
+            Mock(id="EE:FF", to_dict=Mock(return_value={**CONFIG, "decoders": {"t": "nope"}})),
+        ]
+
+        assert refresh_sensor_mappings(client) is True
+
+        assert SENSOR_MAPPINGS.get("AABB") is not None
+        assert SENSOR_MAPPINGS.get("OLD") is None
+        assert len(SENSOR_MAPPINGS) == 1
+        assert SENSOR_MAPPINGS.loaded
+
+    def test_failed_refresh_keeps_mappings(self):
+        SENSOR_MAPPINGS.set("AA:BB", CONFIG)
+        client = MagicMock()
+        client.collection.return_value.stream.side_effect = Exception("unavailable")
+
+        assert refresh_sensor_mappings(client) is False
+        assert SENSOR_MAPPINGS.get("AA:BB") is not None
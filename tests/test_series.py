@@ -0,0 +1,132 @@
+import math
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.utils.downsampling import lttb
+
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def series_engine():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from sqlalchemy.pool import StaticPool
+    from src.db import Base, SensorData
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        for i in range(120):
+            session.add(SensorData(timestamp=BASE_TIME + timedelta(minutes=i), sensor_id="AABB",
+                                   metric_name="temperature", metric_value=str(i), project_id="p"))
+            session.add(SensorData(timestamp=BASE_TIME + timedelta(minutes=i), sensor_id="AABB",
+                                   metric_name="status", metric_value="ok", project_id="p"))
+        session.commit()
+
+    with patch("src.db.get_engine", return_value=engine):
+        yield engine
+
+
+class TestLttb:
+
+    def make_points(self, count):
+        return [(BASE_TIME + timedelta(seconds=i), math.sin(i / 10)) for i in range(count)]
+
+    def test_reduces_to_threshold_keeping_ends(self):
+        points = self.make_points(1000)
+
+        sampled = lttb(points, 50)
+
+        assert len(sampled) == 50
+        assert sampled[0] == points[0]
+        assert sampled[-1] == points[-1]
+        assert sampled == sorted(sampled)
+
+    def test_short_series_is_unchanged(self):
+        points = self.make_points(10)
+
+        assert lttb(points, 50) == points
+
+    def test_keeps_spikes(self):
+        points = [(BASE_TIME + timedelta(seconds=i), 0.0) for i in range(500)]
+        points[250] = (points[250][0], 100.0)
+
+        assert points[250] in lttb(points, 20)
+
+
+class TestSensorSeries:
+
+    def test_raw_series_skips_non_numeric_values(self, series_engine):
+        from src.db import get_sensor_series
+
+        series, source = get_sensor_series("AABB", None, BASE_TIME, BASE_TIME + timedelta(minutes=10))
+
+        assert source == "sensor_data"
+        assert list(series) == ["temperature"]
+        assert series["temperature"][3] == (BASE_TIME + timedelta(minutes=3), 3.0)
+
+    @pytest.mark.parametrize("aggregation, expected", [
+        ("avg", [29.5, 89.5]), ("min", [0.0, 60.0]), ("max", [59.0, 119.0]), ("count", [60.0, 60.0]),
+    ])
+    def test_bucketed_series(self, series_engine, aggregation, expected):
+        from src.db import get_sensor_series
+
+        series, _ = get_sensor_series("AABB", ["temperature"], BASE_TIME, BASE_TIME + timedelta(hours=3),
+                                      bucket_seconds=3600, aggregation=aggregation)
+
+        assert [value for _, value in series["temperature"]] == expected
+        assert series["temperature"][1][0] == BASE_TIME + timedelta(hours=1)
+
+    @pytest.mark.parametrize("bucket_seconds, reader", [
+        (7200, "_rollup_series_rows"), (90, "_bucketed_series_rows"),
+    ])
+    def test_postgres_uses_rollup_for_whole_hours(self, bucket_seconds, reader):
+        import src.db as db
+
+        engine = MagicMock()
+        engine.dialect.name = "postgresql"
+        rows = [(BASE_TIME, "temperature", 1.5)]
+
+        with patch("src.db.get_engine", return_value=engine), \
+             patch("src.db.rollup_available", return_value=True), \
+             patch(f"src.db.{reader}", return_value=rows) as mock_reader:
+            series, source = db.get_sensor_series("AABB", None, BASE_TIME, BASE_TIME + timedelta(days=1),
+                                                  bucket_seconds=bucket_seconds)
+
+        mock_reader.assert_called_once()
+        assert source == ("sensor_data_hourly" if bucket_seconds == 7200 else "sensor_data")
+        assert series == {"temperature": [(BASE_TIME, 1.5)]}
+
+    def test_rollup_reads_partial_edge_hours_from_sensor_data(self):
+        import src.db as db
+
+        start, end = BASE_TIME + timedelta(minutes=30), BASE_TIME + timedelta(hours=3, minutes=15)
+        hourly = [(BASE_TIME, "temperature", 2, 30.0, 14.0, 16.0), (BASE_TIME + timedelta(hours=2), "temperature", 1, 20.0, 20.0, 20.0)]
+        edges = [(BASE_TIME, "temperature", 1, 10.0, 10.0, 10.0), (BASE_TIME + timedelta(hours=2), "temperature", 1, 22.0, 22.0, 22.0)]
+
+        with patch("src.db._rollup_components", return_value=hourly) as mock_rollup, \
+             patch("src.db._raw_components", return_value=edges) as mock_raw:
+            rows = db._rollup_series_rows(MagicMock(), "AABB", None, start, end, 7200, "avg")
+
+        assert mock_rollup.call_args.args[3:5] == (BASE_TIME + timedelta(hours=1), BASE_TIME + timedelta(hours=3))
+        assert mock_raw.call_args.args[3] == [(start, BASE_TIME + timedelta(hours=1)),
+                                              (BASE_TIME + timedelta(hours=3), end)]
+        assert rows == [(BASE_TIME, "temperature", 40.0 / 3), (BASE_TIME + timedelta(hours=2), "temperature", 21.0)]
+
+    def test_range_without_a_whole_hour_reads_sensor_data(self):
+        import src.db as db
+
+        engine = MagicMock()
+        engine.dialect.name = "postgresql"
+
+        with patch("src.db.get_engine", return_value=engine), \
+             patch("src.db.rollup_available", return_value=True), \
+             patch("src.db._bucketed_series_rows", return_value=[]) as mock_raw:
+            _, source = db.get_sensor_series("AABB", None, BASE_TIME + timedelta(minutes=30),
+                                             BASE_TIME + timedelta(hours=1, minutes=15), bucket_seconds=3600)
+
+        mock_raw.assert_called_once()
+        assert source == "sensor_data"
@@ -0,0 +1,193 @@
+import time
+import pytest
+from datetime import datetime, timezone, timedelta
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from src.db import (
+    Base,
+    create_sync_job,
+    update_sync_job,
+    get_sync_job,
+    list_sync_jobs,
+    request_sync_job_cancel,
+    project_sync_lock,
+    migrate_sync_jobs,
+)
+from src.utils import sync_jobs
+from src.utils.sync_jobs import JobProgress, SyncCancelled, describe_job, queue_job
+
+
+@pytest.fixture
+def test_engine():
+    """In-memory SQLite engine shared across connections."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture(autouse=True)
+def patch_engine(test_engine):
+    with patch("src.db.get_engine", return_value=test_engine):
+        yield
+
+
+class TestSyncJobTable:
+
+    def test_create_job(self):
+        job, running = create_sync_job("history")
+
+        assert running is None
+        assert job["state"] == "queued"
+        assert job["scope"] == []
+        assert get_sync_job(job["job_id"])["job_id"] == job["job_id"]
+
+    def test_single_flight_for_overlapping_jobs(self):
+        first, _ = create_sync_job("history")
+        second, running = create_sync_job("history")
+
+        assert second is None
+        assert running["job_id"] == first["job_id"]
+
+    def test_disjoint_projects_can_run_concurrently(self):
+        first, _ = create_sync_job("history", ["project_a"])
+        second, running = create_sync_job("history", ["project_b"])
+        third, running_third = create_sync_job("history", ["project_b", "project_c"])
+
+        assert second is not None and running is None
+        assert third is None
+        assert running_third["job_id"] == second["job_id"]
+
+    def test_finished_and_stale_jobs_do_not_block(self):
+        finished, _ = create_sync_job("history")
+        update_sync_job(finished["job_id"], state="success")
+        stale, _ = create_sync_job("history")
+        update_sync_job(stale["job_id"], state="running",
+                        heartbeat_at=datetime.now(timezone.utc) - timedelta(hours=1))
+
+        job, running = create_sync_job("history")
+
+        assert job is not None and running is None
+
+    def test_list_jobs_newest_first(self):
+        first, _ = create_sync_job("history", ["a"])
+        second, _ = create_sync_job("history", ["b"])
+        update_sync_job(second["job_id"], created_at=datetime.now(timezone.utc) + timedelta(seconds=1))
+
+        jobs = list_sync_jobs("history")
+
+        assert [j["job_id"] for j in jobs] == [second["job_id"], first["job_id"]]
+
+    def test_cancel_request_is_reported_on_update(self):
+        job, _ = create_sync_job("history")
+
+        assert request_sync_job_cancel(job["job_id"])["cancel_requested"] is True
+        assert update_sync_job(job["job_id"], docs_read=10) is True
+        assert request_sync_job_cancel("missing") is None
+
+    def test_project_lock_always_acquired_outside_postgres(self):
+        with project_sync_lock("project_a") as acquired:
+            assert acquired is True
+
+
+class TestJobProgress:
+
+    def test_progress_is_flushed_on_finish(self):
+        job, _ = create_sync_job("history")
+        progress = JobProgress(job["job_id"], flush_interval=60).start()
+        progress.set_project("project_a", 100)
+        progress.add_docs(40)
+        progress.add_rows(120)
+        progress.finish("success")
+
+        stored = get_sync_job(job["job_id"])
+        assert stored["state"] == "success"
+        assert stored["docs_read"] == 40
+        assert stored["docs_total"] == 100
+        assert stored["rows_written"] == 120
+        assert stored["current_project"] == "project_a"
+
+    def test_cancel_flag_from_db_stops_job(self):
+        job, _ = create_sync_job("history")
+        progress = JobProgress(job["job_id"], flush_interval=60).start()
+        request_sync_job_cancel(job["job_id"])
+
+        progress.flush()
+
+        with pytest.raises(SyncCancelled):
+            progress.check_cancelled()
+        progress.finish("cancelled")
+        assert get_sync_job(job["job_id"])["state"] == "cancelled"
+
+    def test_queued_job_is_kept_alive_until_started(self):
+        job, _ = create_sync_job("backfill", ["S0"])
+        created = datetime.now(timezone.utc) - timedelta(hours=1)
+        update_sync_job(job["job_id"], created_at=created)
+
+        with patch.object(sync_jobs, "PROGRESS_FLUSH_SECONDS", 0.01), \
+                patch.object(sync_jobs, "_queued_heartbeat", None):
+            queue_job(job["job_id"])
+            time.sleep(0.1)
+            duplicate, running = create_sync_job("backfill", ["S0"])
+            JobProgress(job["job_id"], flush_interval=60).start().finish("success")
+
+        assert duplicate is None
+        assert running["job_id"] == job["job_id"]
+        assert job["job_id"] not in sync_jobs._queued_jobs
+
+    def test_skipped_projects_are_listed_and_fail_the_job(self):
+        job, _ = create_sync_job("history")
+        progress = JobProgress(job["job_id"], flush_interval=60).start()
+        progress.skip_project("project_b")
+
+        assert describe_job(get_sync_job(job["job_id"]))["skipped_projects"] == ["project_b"]
+        progress.complete()
+
+        stored = get_sync_job(job["job_id"])
+        assert stored["state"] == "failed"
+        assert "project_b" in stored["error"]
+
+    def test_describe_job_rates_and_eta(self):
+        started = datetime.now(timezone.utc) - timedelta(seconds=10)
+        job = {
+            "job_id": "abc",
+            "state": "running",
+            "docs_read": 100,
+            "docs_total": 300,
+            "rows_written": 500,
+            "started_at": started,
+            "finished_at": None,
+        }
+
+        described = describe_job(job)
+
+        assert described["rows_per_second"] == pytest.approx(50, rel=0.05)
+        assert described["docs_per_second"] == pytest.approx(10, rel=0.05)
+        assert described["eta_seconds"] == pytest.approx(20, rel=0.05)
+
+
+class TestMigration:
+
+    def test_table_from_before_the_scope_rename_is_migrated(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE sync_jobs (job_id VARCHAR(36) PRIMARY KEY, job_type VARCHAR(20) NOT NULL, "
+                "state VARCHAR(20) NOT NULL, project_ids TEXT NOT NULL DEFAULT '', current_project VARCHAR(50), "
+                "docs_read INTEGER NOT NULL DEFAULT 0, docs_total INTEGER, rows_written INTEGER NOT NULL DEFAULT 0, "
+                "error TEXT, cancel_requested BOOLEAN NOT NULL DEFAULT 0, created_at TIMESTAMP NOT NULL, "
+                "started_at TIMESTAMP, finished_at TIMESTAMP, heartbeat_at TIMESTAMP)"
+            ))
+            connection.execute(text(
+                "INSERT INTO sync_jobs (job_id, job_type, state, project_ids, created_at) "
+                "VALUES ('old', 'history', 'success', 'p1,p2', '2024-01-01 00:00:00')"
+            ))
+
+        with patch("src.db.get_engine", return_value=engine):
+            migrate_sync_jobs()
+            migrate_sync_jobs()
+            job, _ = create_sync_job("history", ["p3"], params={"workers": 2})
+
+            assert get_sync_job("old")["scope"] == ["p1", "p2"]
+            assert get_sync_job(job["job_id"])["params"] == {"workers": 2}
@@ -0,0 +1,164 @@
+import threading
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from src.utils import tracing
+from src.utils.tracing import span, current_span, parse_traceparent, otlp_payload
+
+
+@pytest.fixture(autouse=True)
+def clear_spans():
+    tracing.MEMORY.clear()
+    yield
+    tracing.MEMORY.clear()
+
+
+class TestSpans:
+
+    def test_children_share_trace_and_nest(self):
+        with span("root", root=True) as root:
+            with span("child", rows=3) as child:
+                assert current_span() is child
+            assert current_span() is root
+
+        trace = tracing.MEMORY.traces()[0]
+        assert trace["name"] == "root"
+        assert [(s["name"], s["parent_id"]) for s in trace["spans"]] == [("root", None), ("child", root.span_id)]
+        assert trace["spans"][1]["attributes"] == {"rows": 3}
+        assert child.trace_id == root.trace_id
+
+    def test_no_span_outside_a_trace(self):
+        with span("db.insert_sensor_rows") as orphan:
+            assert orphan is None
+
+        assert list(tracing.MEMORY.spans) == []
+
+    def test_parent_carries_over_to_threads(self):
+        with span("root", root=True) as root:
+            thread_spans = []
+
+            def work():
+                with span("shard", parent=root) as shard:
+                    thread_spans.append(shard)
+
+            worker = threading.Thread(target=work)
+            worker.start()
+            worker.join()
+
+        assert thread_spans[0].parent_id == root.span_id
+
+    def test_errors_are_recorded(self):
+        with pytest.raises(ValueError):
+            with span("root", root=True):
+                raise ValueError("boom")
+
+        assert tracing.MEMORY.traces()[0]["spans"][0]["error"] == "ValueError: boom"
+
+    def test_sampling(self):
+        with patch("src.utils.tracing.TRACING_SAMPLE_RATE", 0.0):
+            with span("root", root=True) as root:
+                assert root is None
+
+    def test_summary(self):
+        for _ in range(3):
+            with span("root", root=True):
+                pass
+
+        assert tracing.MEMORY.summary()["root"]["count"] == 3
+
+
+class TestPropagation:
+
+    def test_traceparent(self):
+        trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+
+        assert parse_traceparent(f"00-{trace_id}-{parent_id}-01") == (trace_id, parent_id)
+        assert parse_traceparent(f"00-{trace_id}-{parent_id}-00") is None
+        assert parse_traceparent("garbage") is None
+
+    def test_malformed_traceparent_is_ignored(self):
+        trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+
+        assert parse_traceparent(f"00-{'z' * 32}-{parent_id}-01") is None
+        assert parse_traceparent(f"00-{trace_id}-{parent_id}-zz") is None
+        assert parse_traceparent(f"00-{'0' * 32}-{parent_id}-01") is None
+        assert parse_traceparent(f"00-{trace_id}-{'0' * 16}-01") is None
+        assert parse_traceparent(f"ff-{trace_id}-{parent_id}-01") is None
+        assert parse_traceparent(f"00-{trace_id.upper()}-{parent_id}-01") is None
+
+    def test_otlp_payload(self):
+        with span("root", root=True, rows=2) as root:
+            pass
+
+        otlp_span = otlp_payload([root])["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        assert otlp_span["traceId"] == root.trace_id
+        assert otlp_span["attributes"] == [{"key": "rows", "value": {"intValue": "2"}}]
+        assert int(otlp_span["endTimeUnixNano"]) >= int(otlp_span["startTimeUnixNano"])
+
+
+class TestPipelines:
+
+    @pytest.fixture
+    def client(self):
+        import os
+        os.environ.setdefault("VITE_AUTH0_DOMAIN", "test.auth0.com")
+        os.environ.setdefault("VITE_AUTH0_AUDIENCE", "test-audience")
+        from fastapi.testclient import TestClient
+        from src.normalizer_api import app
+        from src.dependencies import get_auth_claims, require_admin
+
+        app.dependency_overrides[get_auth_claims] = lambda: {"sub": "test"}
+        app.dependency_overrides[require_admin] = lambda: {"sub": "test"}
+        yield TestClient(app)
+        app.dependency_overrides.clear()
+
+    def test_webhook_stages(self, client):
+        trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+        engine = MagicMock()
+        engine.begin.return_value.__enter__.return_value.execute.return_value.rowcount = 1
+
+        with patch("src.db.get_engine", return_value=engine), patch("src.routers.webhook.log_webhook"):
+            response = client.post(
+                "/api/webhook",
+                json={"project_id": "p", "sensor_id": "AABB", "timestamp": 1704067200, "temperature": 20},
+                headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"},
+            )
+
+        assert response.status_code == 201
+        assert response.headers["traceparent"].startswith(f"00-{trace_id}-")
+        trace = client.get("/api/admin/traces", params={"name": "POST /api/webhook"}).json()["data"][0]
+        names = [s["name"] for s in trace["spans"]]
+        assert trace["trace_id"] == trace_id
+        assert names == ["POST /api/webhook", "validate WebhookData", "parse", "db.insert_sensor_rows",
+                         "log_webhook"]
+
+    def test_invalid_webhook_is_rejected_in_the_validate_stage(self, client):
+        response = client.post("/api/webhook", json={"sensor_id": "AABB", "temperature": 20})
+
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["loc"] == ["body", "project_id"]
+        trace = client.get("/api/admin/traces", params={"name": "POST /api/webhook"}).json()["data"][0]
+        assert [s["name"] for s in trace["spans"]] == ["POST /api/webhook", "validate WebhookData"]
+
+    def test_malformed_traceparent_starts_a_new_trace(self, client):
+        response = client.get("/health", headers={"traceparent": f"00-{'z' * 32}-00f067aa0ba902b7-01"})
+
+        assert response.status_code == 200
+        assert parse_traceparent(response.headers["traceparent"]) is not None
+
+    def test_history_batches(self):
+        from src.history_to_timescale import process_and_batch_save
+        from src.SensorDataParser import SensorDataParser
+
+        docs = [MagicMock(to_dict=MagicMock(return_value={"sensor_id": "AABB", "timestamp": 1704067200 + i,
+                                                           "temperature": i})) for i in range(3)]
+        with patch("src.history_to_timescale.insert_sensor_rows"):
+            with span("history_sync", root=True):
+                process_and_batch_save(docs, SensorDataParser("p"), "p")
+
+        batch = tracing.MEMORY.traces()[0]["spans"][1]
+        assert batch["name"] == "sync.batch"
+        assert batch["attributes"]["docs"] == 3
+        assert batch["attributes"]["rows"] == 3
+        assert {"firestore_ms", "parse_ms"} <= set(batch["attributes"])